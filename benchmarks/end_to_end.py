@@ -0,0 +1,527 @@
+"""Every flow end to end against recorded API responses served locally.
+
+    python -m benchmarks.end_to_end                      # compare with the baseline
+    python -m benchmarks.end_to_end --flows trader reporter --repeat 1
+    python -m benchmarks.end_to_end --update-baseline    # after an intended change
+
+Alpaca (trading, market data and the trade_updates stream), Finnhub and
+Slack are stood in for by stub servers that answer from the recordings in
+`benchmarks/fixtures/` after each provider's usual latency, so a run needs no
+credentials or network. Orders are accepted by a small fake broker that
+fills them over the stream a moment later.
+
+Each run is a fresh interpreter in an empty working directory (so every
+local store starts cold, like a deployment run) with its own Prefect
+database. We report wall time, time per task, requests per provider and
+peak RSS, and fail when the flow's run time or memory grow past the stored
+baseline or a flow makes more requests than it used to. Run time is the flow
+run's own start to end as the Prefect API has it: wall time also carries
+Prefect's fixed per-run overhead, which comes in whole seconds and would
+hide a flow that got several times slower.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import UTC, datetime
+
+from benchmarks.stub_server import StubServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+BASELINE_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "end_to_end_baseline.json"
+)
+
+TICKER = "AMD"
+ETFS = "SPY,QQQ,IWM,DIA,VTI"
+CREDENTIALS = {
+    "FINNHUB_API_KEY": "bench-finnhub",
+    "ALPACA_PAPER_API_KEY": "bench-key",
+    "ALPACA_PAPER_API_SECRET": "bench-secret",
+    "ETF_PICKS": ETFS,
+}
+
+
+def load_fixture(name: str, base_url: str = "") -> dict:
+    with open(os.path.join(FIXTURES_DIR, f"{name}.json")) as f:
+        # some responses point back at the API (slack's upload url)
+        return json.loads(f.read().replace("{base_url}", base_url))
+
+
+def _recorded(route: dict):
+    status, body, headers = (
+        route.get("status", 200),
+        route["body"],
+        route.get("headers", {}),
+    )
+    by_symbol = route.get("by_symbol")
+
+    def handler(match, query, raw):
+        if by_symbol and "symbols" in query:
+            wanted = query["symbols"].split(",")
+            return (
+                status,
+                {
+                    **body,
+                    by_symbol: {
+                        s: v for s, v in body[by_symbol].items() if s in wanted
+                    },
+                },
+                headers,
+            )
+        return status, body, headers
+
+    return handler
+
+
+def recorded_routes(fixture: dict) -> dict:
+    return {r["route"]: _recorded(r) for r in fixture["routes"]}
+
+
+class TradeStream:
+    """Local trade_updates websocket: authorizes anyone and sends what the broker pushes."""
+
+    def __init__(self):
+        self._clients: set = set()
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        threading.Thread(
+            target=self._loop.run_forever, name="trade-stream", daemon=True
+        ).start()
+        asyncio.run_coroutine_threadsafe(self._serve(), self._loop)
+        self._started.wait(5)
+
+    async def _serve(self):
+        from websockets.asyncio.server import serve
+
+        self.server = await serve(self._handler, "127.0.0.1", 0)
+        self.url = f"ws://127.0.0.1:{self.server.sockets[0].getsockname()[1]}"
+        self._started.set()
+
+    async def _handler(self, ws):
+        await ws.recv()
+        await ws.send(
+            json.dumps(
+                {
+                    "stream": "authorization",
+                    "data": {"status": "authorized", "action": "authenticate"},
+                }
+            )
+        )
+        await ws.recv()
+        await ws.send(
+            json.dumps({"stream": "listening", "data": {"streams": ["trade_updates"]}})
+        )
+        self._clients.add(ws)
+        try:
+            await ws.wait_closed()
+        finally:
+            self._clients.discard(ws)
+
+    async def _send(self, message: str):
+        for ws in list(self._clients):
+            await ws.send(message)
+
+    def push(self, event: str, order: dict, delay: float = 0):
+        message = json.dumps(
+            {"stream": "trade_updates", "data": {"event": event, "order": order}}
+        )
+        self._loop.call_soon_threadsafe(
+            lambda: self._loop.call_later(
+                delay, lambda: asyncio.ensure_future(self._send(message))
+            )
+        )
+
+
+class Broker:
+    """Order endpoints of the trading API: accepts any order from the recorded
+    template and fills it at the recorded last price `fill_after` seconds later."""
+
+    def __init__(self, fixture: dict, prices: dict[str, float], stream: TradeStream):
+        self.template = fixture["order"]
+        self.fill_after = fixture.get("fill_after", 0.25)
+        self.prices = prices
+        self.stream = stream
+        self.orders: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, match, query, raw):
+        request = json.loads(raw)
+        now = datetime.now(UTC).isoformat().replace("+00:00", "Z")
+        order = {
+            **self.template,
+            "id": str(uuid.uuid4()),
+            "client_order_id": request.get("client_order_id") or str(uuid.uuid4()),
+            "created_at": now,
+            "updated_at": now,
+            "submitted_at": now,
+            "symbol": request["symbol"],
+            "qty": str(request.get("qty")),
+            "side": request["side"],
+            "time_in_force": request.get("time_in_force", "day"),
+            "order_class": request.get("order_class")
+            or ("oto" if request.get("stop_loss") else "simple"),
+        }
+        with self._lock:
+            self.orders[order["id"]] = order
+        filled = {
+            **order,
+            "status": "filled",
+            "filled_qty": order["qty"],
+            "filled_avg_price": str(self.prices.get(order["symbol"], 100.0)),
+            "filled_at": now,
+        }
+        self.stream.push("fill", filled, delay=self.fill_after)
+        threading.Timer(self.fill_after, self._filled, (filled,)).start()
+        return 200, order
+
+    def _filled(self, order: dict):
+        with self._lock:
+            self.orders[order["id"]] = order
+
+    def list(self, match, query, raw):
+        symbols = set(query.get("symbols", "").split(",")) - {""}
+        with self._lock:
+            orders = [
+                o for o in self.orders.values() if not symbols or o["symbol"] in symbols
+            ]
+        return 200, orders
+
+
+class Stubs:
+    """Stub servers for every provider, started together."""
+
+    def __init__(self):
+        self.stream = TradeStream()
+        data = load_fixture("alpaca_data")
+        prices = {s: t["p"] for s, t in data["routes"][0]["body"]["trades"].items()}
+        trading = load_fixture("alpaca_trading")
+        self.broker = Broker(trading, prices, self.stream)
+        finnhub = load_fixture("finnhub")
+        self.servers = {
+            "alpaca_trading": StubServer(
+                {
+                    **recorded_routes(trading),
+                    "POST /v2/orders": self.broker.submit,
+                    "GET /v2/orders": self.broker.list,
+                },
+                latency=trading["latency"],
+            ),
+            "alpaca_data": StubServer(recorded_routes(data), latency=data["latency"]),
+            "finnhub": StubServer(recorded_routes(finnhub), latency=finnhub["latency"]),
+        }
+        # slack's upload url points back at the stub, so it needs its address first
+        slack = self.servers["slack"] = StubServer(
+            {}, latency=load_fixture("slack")["latency"]
+        )
+        slack.routes = [
+            (re.compile(p), h)
+            for p, h in recorded_routes(load_fixture("slack", slack.url)).items()
+        ]
+
+    def __enter__(self):
+        for server in self.servers.values():
+            server.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        for server in self.servers.values():
+            server.__exit__(*exc)
+
+    def requests(self) -> dict[str, dict[str, int]]:
+        return {name: dict(server.counts) for name, server in self.servers.items()}
+
+
+def point_flows_at(stubs: Stubs):
+    """Swap every client the flows use for one talking to the stubs."""
+    import finnhub
+    from alpaca.trading.client import TradingClient
+
+    from flows import const, notifier
+    from flows.const import AccountType, Provider
+    from flows.utils import clients
+
+    servers = stubs.servers
+    const.ALPACA_DATA_URL = f"{servers['alpaca_data'].url}/v2"
+    const.ALPACA_STREAM_URL = {
+        **const.ALPACA_STREAM_URL,
+        AccountType.PAPER: stubs.stream.url,
+    }
+
+    def _trading():
+        return TradingClient(
+            CREDENTIALS["ALPACA_PAPER_API_KEY"],
+            CREDENTIALS["ALPACA_PAPER_API_SECRET"],
+            paper=True,
+            url_override=servers["alpaca_trading"].url,
+        )
+
+    def _finnhub():
+        client = finnhub.Client(api_key=CREDENTIALS["FINNHUB_API_KEY"])
+        client.API_URL = f"{servers['finnhub'].url}/api/v1"
+        return client
+
+    # the registry hands these out from now on
+    clients.registry.get(
+        Provider.ALPACA_TRADING, _trading, account_type=AccountType.PAPER
+    )
+    clients.registry.get(Provider.FINNHUB, _finnhub)
+    notifier._dispatcher = notifier.SlackDispatcher(
+        "xoxb-bench", base_url=f"{servers['slack'].url}/api/"
+    )
+
+
+def scenarios() -> dict:
+    from flows.etf_trading.strategy import etf_balancing
+    from flows.prospector import prospector
+    from flows.reporter import reporter
+    from flows.strategies import SuspendConfig, humpday_day_trader_basic
+    from flows.trader import trader
+
+    return {
+        "prospector": lambda: prospector(ticker=TICKER, return_state=True),
+        "trader": lambda: trader(ticker=TICKER, return_state=True),
+        "reporter": lambda: reporter(ticker=TICKER, return_state=True),
+        "humpday_day_trader_basic": lambda: humpday_day_trader_basic(
+            prospect_buy_suspend=SuspendConfig(),
+            buy_sell_suspend=SuspendConfig(),
+            ticker=TICKER,
+            return_state=True,
+        ),
+        "etf_balancing": lambda: etf_balancing(
+            cash_to_set_aside=1000, return_state=True
+        ),
+    }
+
+
+FLOWS = [
+    "prospector",
+    "trader",
+    "reporter",
+    "humpday_day_trader_basic",
+    "etf_balancing",
+]
+
+
+def task_times(flow_run_id, settle: float = 10.0) -> dict[str, float]:
+    """Seconds per task name over the run and its subflows, from the Prefect API.
+
+    Task states reach the API as events, so this waits until every task run
+    the flow started has an end time.
+    """
+    from prefect.client.orchestration import get_client
+    from prefect.client.schemas.filters import (
+        FlowRunFilter,
+        FlowRunFilterId,
+        FlowRunFilterParentFlowRunId,
+        TaskRunFilter,
+        TaskRunFilterSubFlowRuns,
+    )
+
+    with get_client(sync_client=True) as client:
+        run_ids, frontier = [flow_run_id], [flow_run_id]
+        while frontier:
+            children = client.read_flow_runs(
+                flow_run_filter=FlowRunFilter(
+                    parent_flow_run_id=FlowRunFilterParentFlowRunId(any_=frontier)
+                )
+            )
+            frontier = [c.id for c in children]
+            run_ids += frontier
+        deadline = time.monotonic() + settle
+        while True:
+            runs = client.read_task_runs(
+                flow_run_filter=FlowRunFilter(id=FlowRunFilterId(any_=run_ids)),
+                task_run_filter=TaskRunFilter(
+                    subflow_runs=TaskRunFilterSubFlowRuns(exists_=False)
+                ),
+            )
+            if all(r.end_time is not None for r in runs) or time.monotonic() > deadline:
+                break
+            time.sleep(0.2)
+    times: dict[str, float] = defaultdict(float)
+    for run in runs:
+        if run.start_time and run.end_time:
+            times[run.name.rsplit("-", 1)[0]] += (
+                run.end_time - run.start_time
+            ).total_seconds()
+    return dict(times)
+
+
+def run_time(flow_run_id) -> float:
+    """Seconds between the flow run's start and end, from the Prefect API."""
+    from prefect.client.orchestration import get_client
+
+    with get_client(sync_client=True) as client:
+        run = client.read_flow_run(flow_run_id)
+    return (run.end_time - run.start_time).total_seconds()
+
+
+def run_one(name: str) -> dict:
+    """Run one flow here, in this (fresh) process, and measure it."""
+    from prefect import flow
+
+    @flow
+    def empty():
+        pass
+
+    # the first run starts the temporary prefect server, the second is what
+    # any flow run costs before it does anything
+    empty()
+    started = time.perf_counter()
+    empty()
+    empty_flow = time.perf_counter() - started
+    with Stubs() as stubs:
+        point_flows_at(stubs)
+        run = scenarios()[name]
+        started = time.perf_counter()
+        state = run()
+        wall = time.perf_counter() - started
+        if not state.is_completed():
+            raise RuntimeError(f"{name} ended {state.name}: {state.message}")
+        requests = stubs.requests()
+    return {
+        "run_s": run_time(state.state_details.flow_run_id),
+        "wall_s": wall,
+        "empty_flow_s": empty_flow,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "requests": {
+            provider: sum(routes.values()) for provider, routes in requests.items()
+        },
+        "routes": requests,
+        "tasks": task_times(state.state_details.flow_run_id),
+    }
+
+
+def _spawn(name: str) -> dict:
+    with tempfile.TemporaryDirectory(prefix="e2e-") as workdir:
+        os.makedirs(os.path.join(workdir, "flows", "data"))
+        env = {k: v for k, v in os.environ.items() if not k.startswith("PREFECT_")}
+        env.update(CREDENTIALS)
+        env.update(
+            SECRETS_BACKEND="local",
+            PYTHONPATH=os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")])),
+            PREFECT_HOME=os.path.join(workdir, ".prefect"),
+            PREFECT_SERVER_ANALYTICS_ENABLED="false",
+            PREFECT_LOGGING_LEVEL="WARNING",
+        )
+        result = subprocess.run(
+            [sys.executable, "-m", "benchmarks.end_to_end", "--child", name],
+            cwd=workdir,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"{name} failed:\n{result.stdout[-3000:]}\n{result.stderr[-3000:]}"
+        )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def best_of(name: str, repeat: int) -> dict:
+    runs = [_spawn(name) for _ in range(repeat)]
+    best = min(runs, key=lambda r: r["run_s"])
+    return {**best, "peak_rss_mb": min(r["peak_rss_mb"] for r in runs)}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--flows", nargs="+", default=FLOWS, choices=FLOWS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="allowed relative growth"
+    )
+    parser.add_argument(
+        "--slack", type=float, default=0.2, help="allowed absolute run time growth (s)"
+    )
+    parser.add_argument(
+        "--memory-slack",
+        type=float,
+        default=40,
+        help="allowed absolute RSS growth (MB)",
+    )
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_one(args.child)))
+        return 0
+
+    results = {}
+    for name in args.flows:
+        r = best_of(name, args.repeat)
+        results[name] = r
+        requests = ", ".join(f"{p} {n}" for p, n in r["requests"].items() if n)
+        print(
+            f"{name:<28}{r['run_s']:>7.2f}s  (wall {r['wall_s']:.2f}s, "
+            f"an empty flow {r['empty_flow_s']:.2f}s)  "
+            f"{r['peak_rss_mb']:>4.0f} MB peak  requests: {requests}"
+        )
+        for task, seconds in sorted(r["tasks"].items(), key=lambda kv: -kv[1]):
+            print(f"    {task:<36}{seconds:>7.3f}s")
+
+    summary = {
+        name: {
+            "run_s": round(r["run_s"], 3),
+            "peak_rss_mb": round(r["peak_rss_mb"], 1),
+            "requests": sum(r["requests"].values()),
+        }
+        for name, r in results.items()
+    }
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(BASELINE_FILE):
+            with open(BASELINE_FILE) as f:
+                baseline = json.load(f)
+        baseline.update(summary)
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nbaseline written to {os.path.relpath(BASELINE_FILE, ROOT)}")
+        return 0
+
+    failures = []
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+        for name, now in summary.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            allowed = before["run_s"] * (1 + args.tolerance) + args.slack
+            if now["run_s"] > allowed:
+                failures.append(
+                    f"{name} ran {now['run_s']:.2f}s > allowed {allowed:.2f}s"
+                )
+            allowed = before["peak_rss_mb"] * (1 + args.tolerance) + args.memory_slack
+            if now["peak_rss_mb"] > allowed:
+                failures.append(
+                    f"{name} peaked at {now['peak_rss_mb']:.0f} MB > allowed {allowed:.0f} MB"
+                )
+            # request counts don't depend on the machine, any growth is a change in the flow
+            if now["requests"] > before["requests"]:
+                failures.append(
+                    f"{name} made {now['requests']} requests, {before['requests']} before"
+                )
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
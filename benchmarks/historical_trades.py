@@ -0,0 +1,217 @@
+"""Request count and wall time of the as-of price lookup against a stub data API.
+
+    python -m benchmarks.historical_trades --symbols 12 --latency 0.08
+
+Runs the old serial probing loop (kept here only as a reference) next to
+`alpaca_client.aget_historical_trades` on the same synthetic market.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+
+import requests
+
+from benchmarks.end_to_end import CREDENTIALS
+from benchmarks.stub_server import StubServer
+from flows import alpaca_client
+from flows.utils import market_time
+
+
+class SyntheticMarket:
+    """Every symbol trades every `spacing` seconds from a per-symbol first trade
+    until the close, on every weekday that isn't listed as a holiday."""
+
+    def __init__(
+        self, symbols: list[str], holidays: set[date], spacing: float = 1, seed: int = 7
+    ):
+        rng = random.Random(seed)
+        self.spacing = spacing
+        # most names trade at the bell, a few thin ones don't show up for a while
+        self.first_offset = {
+            s: rng.choice([0, 0, 0, 5, 30, 95]) * 60 + rng.randint(0, 59)
+            for s in symbols
+        }
+        self.price = {s: round(rng.uniform(20, 400), 2) for s in symbols}
+        self.holidays = holidays
+
+    def trades(
+        self, symbol: str, start: datetime, end: datetime, limit: int | None = None
+    ) -> list[datetime]:
+        day = start.astimezone(market_time.MARKET_TZ).date()
+        if (
+            day.weekday() >= 5
+            or day in self.holidays
+            or symbol not in self.first_offset
+        ):
+            return []
+        open_, close = market_time.session_bounds(day)
+        first = open_ + timedelta(seconds=self.first_offset[symbol])
+        lo = max(first, start)
+        hi = min(close, end)
+        if lo > hi:
+            return []
+        # snap lo onto the trade grid
+        k = -(-(lo - first).total_seconds() // self.spacing)
+        t = first + timedelta(seconds=k * self.spacing)
+        out = []
+        while t <= hi and (limit is None or len(out) < limit):
+            out.append(t)
+            t += timedelta(seconds=self.spacing)
+        return out
+
+    def trade(self, symbol: str, t: datetime, i: int) -> dict:
+        return {"t": t.isoformat(), "p": self.price[symbol], "s": 100, "x": "V", "i": i}
+
+
+def _parse_ts(value: str) -> datetime:
+    # the legacy loop sends un-padded hours ("T9:40:00")
+    day, _, rest = value.partition("T")
+    hour, _, rest = rest.partition(":")
+    return datetime.fromisoformat(f"{day}T{int(hour):02d}:{rest}")
+
+
+def build_routes(market: SyntheticMarket) -> dict:
+    def single(match, query, _):
+        symbol = match.group(1)
+        limit = int(query.get("limit", 1000))
+        ts = market.trades(
+            symbol, _parse_ts(query["start"]), _parse_ts(query["end"]), limit
+        )
+        return 200, {
+            "symbol": symbol,
+            "trades": [market.trade(symbol, t, i) for i, t in enumerate(ts)],
+            "next_page_token": None,
+        }
+
+    def multi(_, query, __):
+        start, end = _parse_ts(query["start"]), _parse_ts(query["end"])
+        limit = int(query.get("limit", 1000))
+        offset = int(query.get("page_token") or 0)
+        trades, seen = {}, 0
+        for symbol in sorted(query["symbols"].split(",")):
+            remaining = offset + limit - seen
+            if remaining <= 0:
+                break
+            ts = market.trades(symbol, start, end)
+            for t in ts[max(offset - seen, 0) : remaining]:
+                trades.setdefault(symbol, []).append(market.trade(symbol, t, seen))
+            seen += len(ts)
+        more = seen > offset + limit
+        return 200, {
+            "trades": trades,
+            "next_page_token": str(offset + limit) if more else None,
+        }
+
+    return {
+        r"GET /v2/stocks/trades": multi,
+        r"GET /v2/stocks/([A-Z.]+)/trades": single,
+    }
+
+
+def legacy_get_historical_trades(
+    base_url: str, symbols: list[str], time_frame: timedelta
+) -> dict:
+    def _call(symbols, next_page_token=None, max_end_time="9:40:00"):
+        page_token = ""
+        if next_page_token is not None:
+            page_token = f"page_token={next_page_token}&"
+        symbols_str = ",".join(symbols)
+        asof = (datetime.now().date() - time_frame).strftime("%Y-%m-%d")
+        start = f"{asof}T09:30:00-03:00".replace(":", "%3A")
+        end = f"{asof}T{max_end_time}-03:00".replace(":", "%3A")
+        url = f"{base_url}/stocks/trades?symbols={symbols_str}&limit=1000&start={start}&end={end}&feed=sip&{page_token}sort=asc"
+        response = requests.get(url)
+        response.raise_for_status()
+        return response.json()
+
+    trade_data = {}
+    data = _call(symbols)
+    for symbol in symbols:
+        if symbol in data["trades"]:
+            trade_data[symbol] = data["trades"][symbol][0]
+    cnt = 0
+    max_end_time = "10:00:00"
+    while (
+        not all(x in trade_data for x in symbols)
+        and cnt < 100
+        and max_end_time != "23:00:00"
+    ):
+        search_symbols = [x for x in symbols if x not in trade_data]
+        if data["next_page_token"] is None:
+            max_end_time = str(int(max_end_time.split(":")[0]) + 1) + ":00:00"
+        if len(search_symbols) == 1:
+            max_end_time = "22:00:00"
+        data = _call(
+            search_symbols,
+            next_page_token=data["next_page_token"],
+            max_end_time=max_end_time,
+        )
+        for symbol in search_symbols:
+            if symbol in data["trades"]:
+                trade_data[symbol] = data["trades"][symbol][0]
+        cnt += 1
+    return trade_data
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, default=10)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument(
+        "--spacing", type=float, default=1.0, help="seconds between trades"
+    )
+    parser.add_argument(
+        "--holiday", action="store_true", help="make the as-of day a holiday"
+    )
+    args = parser.parse_args()
+    # the stub takes any key, don't go looking for real ones
+    os.environ.update(CREDENTIALS, SECRETS_BACKEND="local")
+
+    symbols = [f"ETF{chr(65 + i // 26)}{chr(65 + i % 26)}" for i in range(args.symbols)]
+    time_frame = timedelta(days=args.days)
+    asof = market_time.market_today() - time_frame
+    market = SyntheticMarket(
+        symbols, holidays={asof} if args.holiday else set(), spacing=args.spacing
+    )
+
+    with StubServer(build_routes(market), latency=args.latency) as stub:
+        base_url = f"{stub.url}/v2"
+        rows = []
+
+        t0 = time.perf_counter()
+        try:
+            found = legacy_get_historical_trades(base_url, symbols, time_frame)
+        except Exception as e:  # the old loop doesn't survive every market shape
+            print(f"legacy loop failed: {e!r}")
+            found = {}
+        rows.append(
+            ("serial loop", stub.total_requests, time.perf_counter() - t0, len(found))
+        )
+
+        stub.reset()
+        t0 = time.perf_counter()
+        found = asyncio.run(
+            alpaca_client.aget_historical_trades(symbols, time_frame, base_url=base_url)
+        )
+        rows.append(
+            (
+                "windowed async",
+                stub.total_requests,
+                time.perf_counter() - t0,
+                len(found),
+            )
+        )
+
+    print(f"{len(symbols)} symbols, as-of {asof}, {args.latency * 1000:.0f}ms latency")
+    print(f"{'path':<16}{'requests':>10}{'wall (s)':>10}{'found':>8}")
+    for name, n, wall, hits in rows:
+        print(f"{name:<16}{n:>10}{wall:>10.3f}{hits:>8}")
+
+
+if __name__ == "__main__":
+    main()
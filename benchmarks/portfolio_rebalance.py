@@ -0,0 +1,225 @@
+"""Rebalance cost as the universe grows.
+
+    python -m benchmarks.portfolio_rebalance --symbols 100 1000 5000
+
+Runs the whole in-memory rebalance (portfolio from broker positions ->
+targets -> sell and buy order requests) through the pydantic / Decimal
+path it replaced, kept here as a reference, and through `PortfolioArrays`,
+with and without sell balancing. With it, the buys spend the cash the
+sells freed up, like `update_portfolio_cash` does in the flow.
+No network; the "broker" positions are synthetic. Order request objects are
+built on both paths, `arrays (math)` is the engine alone.
+"""
+
+import argparse
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+
+import numpy as np
+from alpaca.trading.enums import OrderSide, TimeInForce
+from alpaca.trading.requests import MarketOrderRequest, StopLossRequest
+
+from flows.etf_trading.portfolio import (
+    STOP_LOSS_RATIO,
+    Portfolio,
+    PortfolioArrays,
+    Position,
+)
+
+
+def synthetic_book(n: int, held_fraction: float = 0.8, seed: int = 3):
+    rng = np.random.default_rng(seed)
+    universe = [f"S{i:05d}" for i in range(n)]
+    price = rng.uniform(5, 500, n).round(2)
+    qty = rng.integers(1, 200, n)
+    held_mask = rng.random(n) < held_fraction
+    held = [
+        SimpleNamespace(
+            symbol=universe[i],
+            qty=str(qty[i]),
+            current_price=str(price[i]),
+            market_value=str(round(qty[i] * price[i], 2)),
+            cost_basis=str(round(qty[i] * price[i] * 0.9, 2)),
+        )
+        for i in np.flatnonzero(held_mask)
+    ]
+    new_prices = {universe[i]: float(price[i]) for i in np.flatnonzero(~held_mask)}
+    ratio_change = dict(zip(universe, rng.uniform(0.8, 1.2, n).tolist()))
+    return universe, held, new_prices, ratio_change
+
+
+def legacy_rebalance(
+    universe, held, new_prices, ratio_change, cash, sell_balancing=False
+):
+    positions = [p for p in held if p.symbol in universe]
+    new_positions = []
+    for etf in universe:
+        if etf not in [p.symbol for p in positions]:
+            new_positions.append(
+                Position(
+                    new=True,
+                    symbol=etf,
+                    qty=0,
+                    market_value=0.0,
+                    proportion_portfolio_value=0.0,
+                    current_price=new_prices[etf],
+                )
+            )
+    total = sum([Decimal(p.market_value) for p in positions]) + cash
+    value_proportions = {
+        p.symbol: float(Decimal(p.market_value) / total) for p in positions
+    }
+    positions = [
+        Position(
+            symbol=p.symbol,
+            market_value=Decimal(p.market_value),
+            qty=Decimal(p.qty),
+            cost_basis=Decimal(p.cost_basis),
+            proportion_portfolio_value=value_proportions[p.symbol],
+            current_price=Decimal(p.current_price),
+        )
+        for p in positions
+    ]
+    portfolio = Portfolio(cash_on_hand=cash, positions=positions + new_positions)
+    for p in portfolio.positions:
+        p.ratio_change = ratio_change[p.symbol]
+
+    n = len(portfolio.positions)
+    change_sum = sum([p.ratio_change for p in portfolio.positions])
+    performance = {p.symbol: p.ratio_change / change_sum for p in portfolio.positions}
+    targets = {}
+    for k, v in performance.items():
+        targets[k] = min(v, 1.7 / n) if v > 1 / n else max(v, 0.3 / n)
+    total_adj = sum(targets.values())
+    if total_adj > 1 or total_adj < 0.99:
+        for k, v in targets.items():
+            targets[k] = v / total_adj
+
+    orders = []
+    cash_after = float(cash)
+    for position in portfolio.positions if sell_balancing else []:
+        if targets[position.symbol] < position.proportion_portfolio_value:
+            left = (
+                targets[position.symbol]
+                * float(position.qty)
+                / position.proportion_portfolio_value
+            )
+            n_sell = round(float(position.qty) - left, 2)
+            cash_after += n_sell * float(position.current_price)
+            orders.append(
+                MarketOrderRequest(
+                    symbol=position.symbol,
+                    qty=n_sell,
+                    side=OrderSide.SELL,
+                    time_in_force=TimeInForce.DAY,
+                )
+            )
+    buy_targets = {
+        p.symbol: targets[p.symbol]
+        for p in portfolio.positions
+        if targets[p.symbol] > p.proportion_portfolio_value
+    }
+    buy_total = sum(buy_targets.values())
+    allocation = {k: int(cash_after * (v / buy_total)) for k, v in buy_targets.items()}
+    for symbol, money in allocation.items():
+        price = [p.current_price for p in portfolio.positions if p.symbol == symbol][0]
+        qty = int(money / price)
+        if qty > 0:
+            orders.append(
+                MarketOrderRequest(
+                    symbol=symbol,
+                    qty=qty,
+                    side=OrderSide.BUY,
+                    time_in_force=TimeInForce.DAY,
+                    stop_loss=StopLossRequest(
+                        stop_price=float(price) * STOP_LOSS_RATIO
+                    ),
+                )
+            )
+    return orders
+
+
+def array_math(universe, held, new_prices, ratio_change, cash, sell_balancing=False):
+    portfolio = PortfolioArrays.from_holdings(universe, held, new_prices, cash)
+    portfolio.ratio_change = np.array([ratio_change[s] for s in universe])
+    targets = portfolio.rebalance_targets()
+    sells = np.zeros(len(portfolio))
+    if sell_balancing:
+        sells = portfolio.sell_quantities(targets)
+        portfolio.cash += float(sells @ portfolio.price)
+    return portfolio, sells, portfolio.buy_quantities(targets)
+
+
+def array_rebalance(
+    universe, held, new_prices, ratio_change, cash, sell_balancing=False
+):
+    portfolio, sells, buys = array_math(
+        universe, held, new_prices, ratio_change, cash, sell_balancing
+    )
+    orders = [
+        MarketOrderRequest(
+            symbol=portfolio.symbols[i],
+            qty=float(sells[i]),
+            side=OrderSide.SELL,
+            time_in_force=TimeInForce.DAY,
+        )
+        for i in np.flatnonzero(sells > 0)
+    ]
+    orders += [
+        MarketOrderRequest(
+            symbol=portfolio.symbols[i],
+            qty=int(buys[i]),
+            side=OrderSide.BUY,
+            time_in_force=TimeInForce.DAY,
+            stop_loss=StopLossRequest(
+                stop_price=float(portfolio.price[i]) * STOP_LOSS_RATIO
+            ),
+        )
+        for i in np.flatnonzero(buys > 0)
+    ]
+    return orders
+
+
+def best_of(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--cash", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(
+        f"{'symbols':>8}{'sells':>7}{'legacy ms':>12}{'arrays ms':>12}{'math ms':>10}{'speedup':>9}  same orders"
+    )
+    for n in args.symbols:
+        book = synthetic_book(n)
+        for sell in (False, True):
+            run = (*book, args.cash, sell)
+            legacy = best_of(lambda run=run: legacy_rebalance(*run), args.repeat)
+            arrays = best_of(lambda run=run: array_rebalance(*run), args.repeat)
+            math = best_of(lambda run=run: array_math(*run), args.repeat)
+            old = {
+                (o.symbol, o.side, round(float(o.qty), 2))
+                for o in legacy_rebalance(*run)
+            }
+            new = {
+                (o.symbol, o.side, round(float(o.qty), 2))
+                for o in array_rebalance(*run)
+            }
+            print(
+                f"{n:>8}{'yes' if sell else 'no':>7}{legacy * 1000:>12.1f}{arrays * 1000:>12.1f}"
+                f"{math * 1000:>10.2f}{legacy / arrays:>8.1f}x  {old == new}"
+            )
+
+
+if __name__ == "__main__":
+    main()
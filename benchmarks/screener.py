@@ -0,0 +1,86 @@
+"""Screening cost as the universe grows.
+
+    python -m benchmarks.screener --symbols 100 3000 10000
+
+Synthetic `get_stock_data`-shaped records (a year of insider transactions
+and four months of analyst trends each), timed through building the factor
+matrix and scoring/ranking it. No network.
+"""
+
+import argparse
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from flows.screener import PickMethod, factor_frame, pick, screen
+
+AS_OF = date(2024, 7, 10)
+
+
+def synthetic_records(n: int, transactions: int = 20, seed: int = 5) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    records = []
+    for i in range(n):
+        low = rng.uniform(5, 300)
+        high = low * rng.uniform(1.1, 2.5)
+        days = rng.integers(0, 365, transactions)
+        records.append(
+            {
+                "ticker": f"S{i:05d}",
+                "current_price": rng.uniform(low, high),
+                "52WeekHigh": high,
+                "52WeekLow": low,
+                "insider_transactions": [
+                    {
+                        "transactionDate": (AS_OF - timedelta(days=int(d))).isoformat(),
+                        "transactionCode": rng.choice(["S", "P", "M"]),
+                        "change": -int(rng.integers(100, 50_000)),
+                        "transactionPrice": float(rng.uniform(low, high)),
+                    }
+                    for d in days
+                ],
+                "recommendation_trends": [
+                    {
+                        k: int(rng.integers(0, 15))
+                        for k in ["strongBuy", "buy", "hold", "sell", "strongSell"]
+                    }
+                    for _ in range(4)
+                ],
+            }
+        )
+    return records
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, nargs="+", default=[100, 3000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'symbols':>8}{'factors ms':>12}{'screen ms':>11}{'pick ms':>9}")
+    for n in args.symbols:
+        records = synthetic_records(n)
+        factors = factor_frame(records, AS_OF)
+        ranked = screen(factors)
+        build = best_of(
+            lambda records=records: factor_frame(records, AS_OF), args.repeat
+        )
+        score = best_of(lambda factors=factors: screen(factors), args.repeat)
+        choose = best_of(
+            lambda ranked=ranked: pick(ranked, PickMethod.WEIGHTED), args.repeat
+        )
+        print(f"{n:>8}{build * 1000:>12.1f}{score * 1000:>11.2f}{choose * 1000:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
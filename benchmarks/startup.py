@@ -0,0 +1,176 @@
+"""Cold-start import cost of every flow entry point in prefect.yaml.
+
+    python -m benchmarks.startup                    # compare with the baseline
+    python -m benchmarks.startup --update-baseline  # after an intended change
+
+Each entry point is imported in a fresh interpreter a few times, alternating
+with a bare `import prefect`. We keep the best time of each and report the
+difference, so the number is mostly our own code and roughly comparable
+between machines. The run
+fails if an entry point's overhead grows past the stored baseline, or if it
+imports one of the heavy dependencies that should only load inside tasks.
+tests/test_startup.py checks the same `DEFERRED_MODULES` on every run.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "startup_baseline.json"
+)
+
+# these belong inside the tasks that need them, never at import time
+DEFERRED_MODULES = [
+    "pandas",
+    "matplotlib",
+    "seaborn",
+    "alpaca",
+    "finnhub",
+    "prefect_slack",
+    "google.cloud.secretmanager",
+    "pyarrow",
+    "numpy",
+]
+
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - t0
+print(json.dumps({{
+    "seconds": elapsed,
+    "loaded": [m for m in {deferred!r} if m in sys.modules],
+}}))
+"""
+
+
+def entrypoints(prefect_yaml: str = os.path.join(ROOT, "prefect.yaml")) -> list[str]:
+    with open(prefect_yaml) as f:
+        config = yaml.safe_load(f)
+    return sorted(
+        {d["entrypoint"] for d in config.get("deployments", []) if d.get("entrypoint")}
+    )
+
+
+def _statement(entrypoint: str) -> str:
+    path, flow_name = entrypoint.split(":")
+    module = path.removesuffix(".py").replace("/", ".")
+    return f"import {module}; getattr({module}, {flow_name!r})"
+
+
+def _run(statement: str, importtime: bool = False) -> tuple[dict, str]:
+    env = dict(os.environ, SECRETS_BACKEND="local")
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ["-X", "importtime"]
+    cmd += ["-c", _PROBE.format(statement=statement, deferred=DEFERRED_MODULES)]
+    result = subprocess.run(
+        cmd, cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def best_of(statement: str, repeat: int) -> dict:
+    runs = [_run(statement)[0] for _ in range(repeat)]
+    return {"seconds": min(r["seconds"] for r in runs), "loaded": runs[0]["loaded"]}
+
+
+def overhead_of(statement: str, repeat: int) -> tuple[dict, float]:
+    """Best run of `statement` and its time over bare prefect.
+
+    The two are interleaved so that a slow patch on the machine hits both
+    sides instead of one entry point.
+    """
+    runs, prefect_runs = [], []
+    for _ in range(repeat):
+        prefect_runs.append(_run("import prefect")[0]["seconds"])
+        runs.append(_run(statement)[0])
+    run = {"seconds": min(r["seconds"] for r in runs), "loaded": runs[0]["loaded"]}
+    return run, max(run["seconds"] - min(prefect_runs), 0.0)
+
+
+def import_profile(statement: str, top: int = 8) -> list[tuple[str, float]]:
+    """Import time per top-level package (from -X importtime).
+
+    Summing each module's self time by package doesn't double count nested
+    imports the way cumulative time would.
+    """
+    _, stderr = _run(statement, importtime=True)
+    totals: dict[str, float] = defaultdict(float)
+    for line in stderr.splitlines():
+        parts = line.removeprefix("import time:").split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        totals[parts[2].strip().split(".")[0]] += int(parts[0]) / 1e6
+    return sorted(totals.items(), key=lambda kv: -kv[1])[:top]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="allowed relative growth"
+    )
+    # overheads are a tenth or two of a second, so this only absorbs timer
+    # noise; a doubled import cost still fails
+    parser.add_argument(
+        "--slack", type=float, default=0.05, help="allowed absolute growth (s)"
+    )
+    parser.add_argument(
+        "--profile", action="store_true", help="print the slowest imports"
+    )
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    prefect_only = best_of("import prefect", args.repeat)["seconds"]
+    print(f"bare `import prefect`: {prefect_only:.3f}s\n")
+
+    results = {}
+    failures = []
+    for entrypoint in entrypoints():
+        run, overhead = overhead_of(_statement(entrypoint), args.repeat)
+        results[entrypoint] = round(overhead, 4)
+        print(
+            f"{entrypoint:<55}{run['seconds']:>8.3f}s  (+{overhead:.3f}s over prefect)"
+        )
+        if run["loaded"]:
+            failures.append(
+                f"{entrypoint} imports {', '.join(run['loaded'])} at startup"
+            )
+        if args.profile:
+            for name, seconds in import_profile(_statement(entrypoint)):
+                print(f"    {name:<40}{seconds:>8.3f}s")
+
+    if args.update_baseline:
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nbaseline written to {os.path.relpath(BASELINE_FILE, ROOT)}")
+        return 0
+
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+        for entrypoint, overhead in results.items():
+            allowed = (
+                baseline.get(entrypoint, overhead) * (1 + args.tolerance) + args.slack
+            )
+            if overhead > allowed:
+                failures.append(
+                    f"{entrypoint} startup overhead {overhead:.3f}s > allowed {allowed:.3f}s"
+                )
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import json
+import re
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# a handler gets the regex match for the path, the parsed query string and the
+# raw body, and returns (status, json-able body) or (status, body, headers)
+Handler = Callable[[re.Match, dict, bytes], tuple]
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # the default backlog of 5 drops SYNs as soon as a client fans out, which
+    # shows up as one-second TCP retransmits in the timings
+    request_queue_size = 256
+
+
+class StubServer:
+    """Local threaded HTTP server standing in for a remote API.
+
+    Every request sleeps `latency` seconds before being answered so wall-time
+    numbers look like talking to the real thing, and requests are counted per
+    route so benchmarks can report how chatty a code path is.
+    """
+
+    def __init__(
+        self,
+        routes: dict[str, Handler],
+        latency: float = 0.05,
+    ):
+        self.routes = [
+            (re.compile(pattern), handler) for pattern, handler in routes.items()
+        ]
+        self.latency = latency
+        self.counts: Counter = Counter()
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", 0), self._handler_class())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def total_requests(self) -> int:
+        return sum(self.counts.values())
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _dispatch(self, method: str, raw_path: str, body: bytes) -> tuple:
+        parsed = urlparse(raw_path)
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        for pattern, handler in self.routes:
+            match = pattern.fullmatch(f"{method} {parsed.path}")
+            if match:
+                with self._lock:
+                    self.counts[pattern.pattern] += 1
+                time.sleep(self.latency)
+                return handler(match, query, body)
+        return 404, {"message": f"no stub for {method} {parsed.path}"}
+
+    def _handler_class(self):
+        stub = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                result = stub._dispatch(method, self.path, body)
+                status, payload = result[0], result[1]
+                headers = result[2] if len(result) > 2 else {}
+                data = (
+                    payload
+                    if isinstance(payload, bytes)
+                    else json.dumps(payload).encode()
+                )
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    for k, v in headers.items():
+                        self.send_header(k, str(v))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # the client gave up on this one (e.g. a cancelled probe)
+                    self.close_connection = True
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def do_DELETE(self):
+                self._respond("DELETE")
+
+            def log_message(self, *args):
+                pass
+
+        return _Handler
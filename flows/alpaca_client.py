@@ -1,106 +1,285 @@
-from datetime import datetime, timedelta
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+import time
+from typing import TYPE_CHECKING
 
-from alpaca.trading.client import TradingClient
+import httpx
+from pydantic import BaseModel
 import requests
 
+from flows import const
 import flows.env as env
-from flows.const import AccountType
+from flows.const import AccountType, Provider
+from flows.utils import api_metrics, clients, market_time
 
+if TYPE_CHECKING:
+    from alpaca.trading.client import TradingClient
 
+
+# names of the flows.env attributes, looked up when a client is built so that
+# importing this module doesn't go to Secret Manager
 ALPACA_ACCOUNT_CREDS = {
     AccountType.LIVE: {
-        "api_key": env.ALPACA_LIVE_API_KEY,
-        "api_secret": env.ALPACA_LIVE_API_SECRET,
+        "api_key": "ALPACA_LIVE_API_KEY",
+        "api_secret": "ALPACA_LIVE_API_SECRET",
     },
     AccountType.PAPER: {
-        "api_key": env.ALPACA_PAPER_API_KEY,
-        "api_secret": env.ALPACA_PAPER_API_SECRET,
+        "api_key": "ALPACA_PAPER_API_KEY",
+        "api_secret": "ALPACA_PAPER_API_SECRET",
     },
 }
 
 
-def get_client(account_type):
-    is_paper = account_type is AccountType.PAPER
-    trading_client = TradingClient(
-        api_key=ALPACA_ACCOUNT_CREDS[account_type]["api_key"],
-        secret_key=ALPACA_ACCOUNT_CREDS[account_type]["api_secret"],
-        paper=is_paper,
+def get_account_creds(account_type: AccountType) -> dict:
+    return {k: getattr(env, v) for k, v in ALPACA_ACCOUNT_CREDS[account_type].items()}
+
+
+def get_client(account_type) -> "TradingClient":
+    def _build():
+        # alpaca-py takes most of a second to import, only pay for it when a
+        # task actually needs to trade
+        from alpaca.trading.client import TradingClient
+
+        creds = get_account_creds(account_type)
+        return TradingClient(
+            api_key=creds["api_key"],
+            secret_key=creds["api_secret"],
+            paper=account_type == AccountType.PAPER,
+        )
+
+    return clients.registry.get(
+        Provider.ALPACA_TRADING, _build, account_type=account_type
     )
-    return trading_client
 
 
-def get_historical_trades(
+def get_market_sessions(
+    start: date,
+    end: date,
+    account_type: AccountType = AccountType.PAPER,
+) -> list[tuple[datetime, datetime]]:
+    """Trading sessions between `start` and `end` from the broker calendar.
+
+    Holidays are missing and early closes have the real close time. Falls
+    back to plain weekday sessions when the calendar can't be reached.
+    """
+    from alpaca.trading.requests import GetCalendarRequest
+
+    try:
+        days = get_client(account_type).get_calendar(
+            GetCalendarRequest(start=start, end=end)
+        )
+    except Exception as e:
+        print(f"market calendar unavailable ({e}), assuming regular weekday hours")
+        n = (end - start).days + 1
+        return sorted(
+            s for s in market_time.recent_sessions(end, n) if s[0].date() >= start
+        )
+    # the calendar comes back as naive exchange-local times
+    return [
+        (
+            d.open.replace(tzinfo=market_time.MARKET_TZ),
+            d.close.replace(tzinfo=market_time.MARKET_TZ),
+        )
+        for d in days
+    ]
+
+
+def _data_headers(account_type: AccountType) -> dict:
+    creds = get_account_creds(account_type)
+    return {
+        "accept": "application/json",
+        "APCA-API-KEY-ID": creds["api_key"],
+        "APCA-API-SECRET-KEY": creds["api_secret"],
+    }
+
+
+def get_data_session(account_type: AccountType = AccountType.PAPER) -> requests.Session:
+    def _build():
+        session = requests.Session()
+        session.headers.update(_data_headers(account_type))
+        return session
+
+    return clients.registry.get(Provider.ALPACA_DATA, _build, account_type=account_type)
+
+
+async def _aget_with_backoff(
+    client: httpx.AsyncClient,
+    url: str,
+    params: dict,
+    attempts: int = 4,
+    backoff: float = 0.5,
+) -> httpx.Response:
+    started = time.perf_counter()
+    for attempt in range(attempts):
+        response = await client.get(url, params=params)
+        if (
+            response.status_code not in clients.RETRY_STATUSES
+            or attempt == attempts - 1
+        ):
+            break
+        retry_after = response.headers.get("Retry-After")
+        await asyncio.sleep(float(retry_after) if retry_after else backoff * 2**attempt)
+    limit, remaining = api_metrics.quota_from_headers(response.headers)
+    api_metrics.metrics.observe(
+        Provider.ALPACA_DATA,
+        api_metrics.endpoint_name(url),
+        response.status_code,
+        time.perf_counter() - started,
+        received=len(response.content),
+        retries=attempt,
+        limit=limit,
+        remaining=remaining,
+    )
+    response.raise_for_status()
+    return response
+
+
+async def aget_historical_trades(
     symbols: list[str],
     time_frame: timedelta,
     account_type: AccountType = AccountType.PAPER,
+    probe_width: int = 1,
+    max_sessions: int = 6,
+    max_concurrency: int = 16,
+    base_url: str = const.ALPACA_DATA_URL,
 ) -> dict:
-    def _call(
-        symbols,
-        account_type,
-        next_page_token=None,
-        max_end_time="9:40:00",
-    ):
-        page_token = ""
-        if next_page_token is not None:
-            page_token = f"page_token={next_page_token}&"
-        symbols_str = ",".join(symbols)
-        asof = (datetime.now().date() - time_frame).strftime("%Y-%m-%d")
-        start = f"{asof}T09:30:00-03:00".replace(":", "%3A")
-        end = f"{asof}T{max_end_time}-03:00".replace(":", "%3A")
-        url = f"https://data.alpaca.markets/v2/stocks/trades?symbols={symbols_str}&limit=1000&start={start}&end={end}&feed=sip&{page_token}sort=asc"
-        headers = {
-            "accept": "application/json",
-            "APCA-API-KEY-ID": ALPACA_ACCOUNT_CREDS[account_type]["api_key"],
-            "APCA-API-SECRET-KEY": ALPACA_ACCOUNT_CREDS[account_type]["api_secret"],
+    """First trade of the session `time_frame` ago for every symbol.
+
+    Each probe asks for a single trade (limit=1, ascending) inside one
+    regular-hours session window, so a non-empty answer is already the as-of
+    trade. If the as-of day was a weekend or holiday the window comes back
+    empty and we fall back to the previous session. By default the older
+    window is only asked for once the newer one came back empty, one request
+    per symbol on a normal day. `probe_width` > 1 sends that many windows at
+    once, saving the round trip on a holiday at the cost of requests, and the
+    outstanding probes for a symbol are cancelled as soon as it resolves.
+    """
+    asof = market_time.market_today() - time_frame
+    windows = market_time.recent_sessions(asof, max_sessions)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _probe(client, symbol, start, end) -> dict | None:
+        params = {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "limit": 1,
+            "feed": "sip",
+            "sort": "asc",
         }
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        return response.json()
+        async with semaphore:
+            response = await _aget_with_backoff(
+                client, f"{base_url}/stocks/{symbol}/trades", params
+            )
+        trades = response.json().get("trades") or []
+        return trades[0] if trades else None
 
-    trade_data = {}
-    data = _call(symbols, account_type, next_page_token=None)
-    # only take the first entry for each symbol
+    async def _first_trade(client, symbol) -> dict | None:
+        for i in range(0, len(windows), probe_width):
+            probes = [
+                asyncio.create_task(_probe(client, symbol, start, end))
+                for start, end in windows[i : i + probe_width]
+            ]
+            try:
+                # windows are newest first, so take the first non-empty one in order
+                for probe in probes:
+                    trade = await probe
+                    if trade is not None:
+                        return trade
+            finally:
+                for probe in probes:
+                    probe.cancel()
+        return None
+
+    async with httpx.AsyncClient(headers=_data_headers(account_type)) as client:
+        trades = await asyncio.gather(*[_first_trade(client, s) for s in symbols])
+
+    return {s: t for s, t in zip(symbols, trades) if t is not None}
+
+
+def get_historical_trades(
+    symbols: list[str],
+    time_frame: timedelta,
+    account_type: AccountType = AccountType.PAPER,
+) -> dict:
+    return asyncio.run(
+        aget_historical_trades(
+            symbols=symbols,
+            time_frame=time_frame,
+            account_type=account_type,
+        )
+    )
+
+
+# symbols per latest-trades request, and a cap on the joined list so the URL
+# stays far from the usual 8k limit even with long tickers
+LATEST_CHUNK_SIZE = 200
+LATEST_CHUNK_CHARS = 2000
+
+
+class LatestTrades(BaseModel):
+    trades: dict[str, dict]
+    missing: list[str]
+    requests: int
+
+    @property
+    def prices(self) -> dict[str, float]:
+        return {s: t["p"] for s, t in self.trades.items()}
+
+
+def _symbol_chunks(symbols: list[str], size: int, max_chars: int) -> list[list[str]]:
+    chunks, current, chars = [], [], 0
     for symbol in symbols:
-        if symbol in data["trades"]:
-            trade_data[symbol] = data["trades"][symbol][0]
-    cnt = 0
-    symbols_missing = True
-    max_end_time = "10:00:00"
-    search_symbols = [x for x in symbols]
-    while symbols_missing and cnt < 100 and max_end_time != "23:00:00":
-        search_symbols = [x for x in symbols if x not in trade_data]
-        if data["next_page_token"] is None:
-            max_end_time = str(int(max_end_time.split(":")[0]) + 1) + ":00:00"
-        if len(search_symbols) == 1:
-            max_end_time = "22:00:00"
-        data = _call(
-            search_symbols,
-            account_type,
-            next_page_token=data["next_page_token"],
-            max_end_time=max_end_time,
+        if current and (len(current) == size or chars + len(symbol) + 1 > max_chars):
+            chunks.append(current)
+            current, chars = [], 0
+        current.append(symbol)
+        chars += len(symbol) + 1
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def get_latest_trades(
+    symbols: list[str],
+    account_type: AccountType = AccountType.PAPER,
+    chunk_size: int = LATEST_CHUNK_SIZE,
+    max_workers: int = 8,
+    feed: str = "iex",
+) -> LatestTrades:
+    """Latest trade for every symbol, in ceil(N / chunk_size) requests.
+
+    Chunks go out concurrently on the pooled data session. Symbols the feed
+    has nothing for end up in `missing` instead of raising.
+    """
+    symbols = list(dict.fromkeys(symbols))
+    chunks = _symbol_chunks(symbols, chunk_size, LATEST_CHUNK_CHARS)
+    session = get_data_session(account_type)
+
+    def _fetch(chunk: list[str]) -> dict:
+        response = session.get(
+            f"{const.ALPACA_DATA_URL}/stocks/trades/latest",
+            params={"symbols": ",".join(chunk), "feed": feed},
         )
-        # only take the first entry the first time we come across a symbol
-        for symbol in search_symbols:
-            if symbol in data["trades"]:
-                trade_data[symbol] = data["trades"][symbol][0]
-        if all(x in trade_data for x in symbols):
-            symbols_missing = False
-        cnt += 1
+        response.raise_for_status()
+        return response.json().get("trades") or {}
 
-    return trade_data
+    trades = {}
+    if len(chunks) == 1:
+        trades.update(_fetch(chunks[0]))
+    elif chunks:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as pool:
+            for chunk_trades in pool.map(api_metrics.carry(_fetch), chunks):
+                trades.update(chunk_trades)
+    missing = [s for s in symbols if s not in trades]
+    if missing:
+        print(f"no latest trade for {len(missing)} symbols: {missing[:20]}")
+    return LatestTrades(trades=trades, missing=missing, requests=len(chunks))
 
 
 def get_latest_trade(
     symbols: list[str],
     account_type: AccountType = AccountType.PAPER,
 ):
-    symbols_str = ",".join(symbols)
-    url = f"https://data.alpaca.markets/v2/stocks/trades/latest?symbols={symbols_str}&feed=iex"
-    headers = {
-        "accept": "application/json",
-        "APCA-API-KEY-ID": ALPACA_ACCOUNT_CREDS[account_type]["api_key"],
-        "APCA-API-SECRET-KEY": ALPACA_ACCOUNT_CREDS[account_type]["api_secret"],
-    }
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return response.json()
+    # the raw {"trades": {...}} shape of the endpoint
+    return {"trades": get_latest_trades(symbols, account_type).trades}
@@ -0,0 +1,282 @@
+"""Local OHLCV history, synced incrementally from Alpaca's bars endpoint.
+
+    python -m flows.bar_store --symbols SPY QQQ IWM --timeframe 1Day 1Min
+
+One uncompressed Arrow IPC file per symbol and timeframe under
+`flows/data/bars/store/<timeframe>/<SYMBOL>.arrow`, read through a memory
+map so the columns are numpy views of the page cache rather than copies.
+"""
+
+import argparse
+import os
+import threading
+from datetime import UTC, date, datetime, timedelta
+from datetime import time as dtime
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from flows import const
+from flows.alpaca_client import get_data_session
+from flows.const import AccountType
+from flows.run_state import atomic_write
+from flows.utils.market_time import MARKET_TZ
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+DAY = "1Day"
+MINUTE = "1Min"
+FIELDS = ["o", "h", "l", "c", "v"]
+# how far back the first sync of a symbol goes
+INITIAL_HISTORY = {DAY: timedelta(days=5 * 365), MINUTE: timedelta(days=30)}
+STEP = {DAY: timedelta(days=1), MINUTE: timedelta(minutes=1)}
+BARS_PAGE_LIMIT = 10_000
+# the free data plan can't ask for the last 15 minutes of sip data
+SIP_DELAY = timedelta(minutes=16)
+# a lookup doesn't reach back further than this for its bar, enough for a
+# weekend and a holiday; past it the store is missing sessions (a failed sync)
+MAX_BAR_AGE = timedelta(days=5)
+
+
+def _schema() -> "pa.Schema":
+    import pyarrow as pa
+
+    return pa.schema([("t", pa.int64())] + [(f, pa.float64()) for f in FIELDS])
+
+
+def fetch_bars(
+    symbols: list[str],
+    timeframe: str,
+    start: datetime,
+    end: datetime | None = None,
+    account_type: AccountType = AccountType.PAPER,
+    feed: str = "sip",
+) -> dict[str, list[dict]]:
+    """Every bar for `symbols` in [start, end], following next_page_token."""
+    session = get_data_session(account_type)
+    end = end or datetime.now(UTC) - SIP_DELAY
+    params = {
+        "symbols": ",".join(symbols),
+        "timeframe": timeframe,
+        "start": start.astimezone(UTC).isoformat(),
+        "end": end.astimezone(UTC).isoformat(),
+        "limit": BARS_PAGE_LIMIT,
+        # the store is appended to and never rewritten, adjusted bars would
+        # mix bases after a split; raw also matches the trades API prices
+        "adjustment": "raw",
+        "feed": feed,
+        "sort": "asc",
+    }
+    bars: dict[str, list[dict]] = {}
+    while True:
+        response = session.get(f"{const.ALPACA_DATA_URL}/stocks/bars", params=params)
+        response.raise_for_status()
+        payload = response.json()
+        for symbol, symbol_bars in (payload.get("bars") or {}).items():
+            bars.setdefault(symbol, []).extend(symbol_bars)
+        token = payload.get("next_page_token")
+        if not token:
+            return bars
+        params["page_token"] = token
+
+
+class BarStore:
+    """Daily and minute bars per symbol, as epoch-second timestamps and float columns.
+
+    `sync` asks only for bars after the last stored one and rewrites the
+    symbol's file atomically with the new rows on the end. Loaded columns are
+    kept per process until the file changes, so repeated `asof` lookups are
+    a binary search over an in-memory (mapped) array.
+    """
+
+    def __init__(self, root: str = const.BAR_STORE_DIR, fetch=fetch_bars):
+        self.root = root
+        self._fetch = fetch
+        self._cache: dict[str, tuple[float, dict[str, np.ndarray]]] = {}
+        self._lock = threading.Lock()
+
+    def path(self, symbol: str, timeframe: str) -> str:
+        return os.path.join(self.root, timeframe, f"{symbol}.arrow")
+
+    def columns(
+        self, symbol: str, timeframe: str = DAY
+    ) -> dict[str, np.ndarray] | None:
+        """{"t": int64 epoch seconds, "o".."v": float64}, memory mapped, or None if nothing is stored."""
+        import pyarrow as pa
+
+        path = self.path(symbol, timeframe)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+        # uncompressed ipc, so to_numpy is a view of the map and not a copy
+        table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+        columns = {name: table.column(name).to_numpy() for name in table.column_names}
+        with self._lock:
+            self._cache[path] = (mtime, columns)
+        return columns
+
+    def last_timestamp(self, symbol: str, timeframe: str) -> int | None:
+        columns = self.columns(symbol, timeframe)
+        return (
+            int(columns["t"][-1]) if columns is not None and len(columns["t"]) else None
+        )
+
+    def append(self, symbol: str, timeframe: str, bars: list[dict]) -> int:
+        """Add Alpaca bar dicts that are newer than what's stored. Returns rows added."""
+        import pyarrow as pa
+
+        if not bars:
+            return 0
+        t = np.array(
+            [
+                datetime.fromisoformat(b["t"].replace("Z", "+00:00")).timestamp()
+                for b in bars
+            ],
+            dtype=np.int64,
+        )
+        new = {
+            "t": t,
+            **{
+                f: np.array([b.get(f, np.nan) for b in bars], dtype=float)
+                for f in FIELDS
+            },
+        }
+        old = self.columns(symbol, timeframe)
+        last = int(old["t"][-1]) if old is not None and len(old["t"]) else None
+        keep = np.ones(len(t), bool) if last is None else t > last
+        if not keep.any():
+            return 0
+        merged = {
+            name: np.concatenate([old[name], new[name][keep]])
+            if old is not None
+            else new[name][keep]
+            for name in new
+        }
+        order = np.argsort(merged["t"], kind="stable")
+        table = pa.Table.from_arrays(
+            [pa.array(merged[name][order]) for name in new], schema=_schema()
+        )
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        atomic_write(self.path(symbol, timeframe), sink.getvalue().to_pybytes())
+        return int(keep.sum())
+
+    def sync(
+        self,
+        symbols: list[str],
+        timeframe: str = DAY,
+        account_type: AccountType = AccountType.PAPER,
+        now: datetime | None = None,
+    ) -> dict[str, int]:
+        """Fetch what's new since each symbol's last bar. Returns rows added per symbol.
+
+        Symbols that were last synced together share a start, so a routine
+        daily sync of the whole universe is one paginated request.
+        """
+        now = now or datetime.now(UTC)
+        end = now - SIP_DELAY
+        if timeframe == DAY:
+            # today's daily bar keeps changing until the close, only finished sessions are stored
+            midnight = datetime.combine(
+                now.astimezone(MARKET_TZ).date(), dtime(0), MARKET_TZ
+            )
+            end = min(end, midnight - timedelta(seconds=1))
+        starts: dict[datetime, list[str]] = {}
+        for symbol in symbols:
+            last = self.last_timestamp(symbol, timeframe)
+            if last is None:
+                start = now - INITIAL_HISTORY[timeframe]
+            else:
+                start = datetime.fromtimestamp(last, UTC) + STEP[timeframe]
+            starts.setdefault(start, []).append(symbol)
+        added = {}
+        for start, group in starts.items():
+            if start >= end:
+                added.update({s: 0 for s in group})
+                continue
+            bars = self._fetch(group, timeframe, start, end, account_type=account_type)
+            for symbol in group:
+                added[symbol] = self.append(symbol, timeframe, bars.get(symbol) or [])
+        return added
+
+    def asof(
+        self,
+        symbol: str,
+        when: datetime,
+        timeframe: str = DAY,
+        field: str = "c",
+        max_age: timedelta = MAX_BAR_AGE,
+    ) -> float | None:
+        """`field` of the last bar starting at or before `when`, by binary search.
+
+        None if there is no bar in the `max_age` before `when`.
+        """
+        columns = self.columns(symbol, timeframe)
+        if columns is None:
+            return None
+        i = np.searchsorted(columns["t"], when.timestamp(), side="right") - 1
+        if i < 0 or columns["t"][i] < (when - max_age).timestamp():
+            return None
+        return float(columns[field][i])
+
+    def asof_many(
+        self,
+        symbols: list[str],
+        when: datetime,
+        timeframe: str = DAY,
+        field: str = "c",
+        max_age: timedelta = MAX_BAR_AGE,
+    ) -> dict[str, float]:
+        prices = {s: self.asof(s, when, timeframe, field, max_age) for s in symbols}
+        return {s: p for s, p in prices.items() if p is not None}
+
+    def session_open(self, symbols: list[str], day: date) -> dict[str, float]:
+        """Opening price of the session on `day`, or of the last session before it.
+
+        Symbols without a bar from the few days up to `day` are left out.
+        """
+        # daily bars are stamped at midnight new york, so end of day finds that day's bar
+        when = datetime.combine(day, dtime(23, 59), MARKET_TZ)
+        return self.asof_many(symbols, when, DAY, "o")
+
+
+_store: BarStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_bar_store() -> BarStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = BarStore()
+    return _store
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", nargs="+", help="defaults to the etf universe")
+    parser.add_argument("--timeframe", nargs="+", default=[DAY], choices=[DAY, MINUTE])
+    parser.add_argument("--account-type", default=AccountType.PAPER, type=AccountType)
+    args = parser.parse_args()
+
+    if args.symbols is None:
+        from flows.etf_trading.etf_specs import get_etf_options
+
+        args.symbols = get_etf_options()
+    store = get_bar_store()
+    for timeframe in args.timeframe:
+        added = store.sync(args.symbols, timeframe, args.account_type)
+        print(
+            f"{timeframe}: {sum(added.values())} bars added over {len(added)} symbols"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import atexit
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.ticker import FuncFormatter
+
+from flows import const
+
+# bump when the look of the chart changes so old cache entries aren't reused
+CHART_VERSION = "1"
+ANALYST_COLORS = [
+    ("strongBuy", "darkblue"),
+    ("buy", "lightblue"),
+    ("hold", "orange"),
+    ("sell", "red"),
+    ("strongSell", "darkred"),
+]
+
+
+class ProspectChartRenderer:
+    """Draws the prospect chart onto one reusable figure.
+
+    The figure is built once with plain matplotlib (no pyplot, so nothing
+    lands in pyplot's global figure list) and its axes are cleared after
+    every render, so a long-lived worker holds exactly one figure.
+    """
+
+    def __init__(self, figsize=(12, 6), dpi=100):
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(self.figure)
+        self.axes = self.figure.subplots(2, 1)
+        # fixed margins that fit the rotated month labels; tight_layout would
+        # cost a whole extra draw on every render
+        self.figure.subplots_adjust(
+            left=0.06, right=0.99, top=0.95, bottom=0.12, hspace=0.55
+        )
+        self._lock = threading.Lock()
+
+    def render(self, pdf: pd.DataFrame, ticker: str) -> bytes:
+        with self._lock:
+            try:
+                self._draw(pdf, ticker)
+                buffer = BytesIO()
+                self.figure.savefig(buffer, format="png")
+                return buffer.getvalue()
+            finally:
+                for ax in self.axes:
+                    ax.clear()
+
+    def _draw(self, pdf: pd.DataFrame, ticker: str):
+        line_ax, bar_ax = self.axes
+        months = pdf["month"].astype(str).to_numpy()
+        x = np.arange(len(months))
+
+        line_ax.plot(x, pdf["month_moving_average"].to_numpy(dtype=float))
+        line_ax.set_title(f"({ticker}) Insider sell price")
+        line_ax.set_ylabel("month_moving_average")
+
+        bottom = np.zeros(len(months))
+        for column, color in ANALYST_COLORS:
+            if column in pdf:
+                counts = np.nan_to_num(pdf[column].to_numpy(dtype=float))
+            else:
+                counts = np.zeros(len(months))
+            bar_ax.bar(x, counts, bottom=bottom, color=color, label=column)
+            bottom += counts
+        bar_ax.legend()
+        bar_ax.set_ylabel("number of analysts")
+        bar_ax.set_title(f"({ticker}) Analyst reccomendations")
+        bar_ax.yaxis.set_major_formatter(FuncFormatter(lambda v, _: int(v)))
+
+        for ax in self.axes:
+            ax.set_xticks(x, months, rotation=45)
+            ax.set_xlim(-0.5, len(months) - 0.5)
+
+
+_local = threading.local()
+
+
+def _renderer() -> ProspectChartRenderer:
+    # matplotlib figures aren't safe to share between threads, one each
+    if not hasattr(_local, "renderer"):
+        _local.renderer = ProspectChartRenderer()
+    return _local.renderer
+
+
+def _render(pdf: pd.DataFrame, ticker: str) -> bytes:
+    return _renderer().render(pdf, ticker)
+
+
+def chart_key(pdf: pd.DataFrame, ticker: str) -> str:
+    digest = hashlib.sha256(f"{CHART_VERSION}|{ticker}|".encode())
+    digest.update(pdf.to_csv(index=False).encode())
+    return digest.hexdigest()
+
+
+class ChartCache:
+    """PNG bytes by content hash, in memory (LRU) and optionally on disk.
+
+    The directory keeps the `max_files` most recently used charts, the
+    oldest by mtime go when a put takes it over.
+    """
+
+    def __init__(
+        self,
+        directory: str | None = const.CHART_CACHE_DIR,
+        max_items: int = 32,
+        max_files: int = 1024,
+    ):
+        self.directory = directory
+        self.max_items = max_items
+        self.max_files = max_files
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.png")
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+        if self.directory and os.path.exists(self._path(key)):
+            try:
+                with open(self._path(key), "rb") as f:
+                    png = f.read()
+                # a hit counts as use, so pruning takes the stale ones first
+                os.utime(self._path(key))
+            except FileNotFoundError:
+                # pruned by another process in between
+                self.misses += 1
+                return None
+            self._remember(key, png)
+            self.hits += 1
+            return png
+        self.misses += 1
+        return None
+
+    def put(self, key: str, png: bytes):
+        self._remember(key, png)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = f"{self._path(key)}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(png)
+            os.replace(tmp, self._path(key))
+            self._prune()
+
+    def _prune(self):
+        files = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(".png"):
+                    continue
+                try:
+                    files.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass
+        if len(files) <= self.max_files:
+            return
+        files.sort()
+        for _, path in files[: len(files) - self.max_files]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _remember(self, key: str, png: bytes):
+        with self._lock:
+            self._memory[key] = png
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+
+chart_cache = ChartCache()
+_process_pool: ProcessPoolExecutor | None = None
+_process_pool_lock = threading.Lock()
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=max((os.cpu_count() or 2) - 1, 1)
+            )
+            atexit.register(_process_pool.shutdown)
+        return _process_pool
+
+
+def render_prospect_chart(
+    pdf: pd.DataFrame,
+    ticker: str,
+    use_process_pool: bool = False,
+    cache: ChartCache | None = None,
+) -> bytes:
+    """PNG of the insider price line and stacked analyst bars.
+
+    Identical data comes straight back from the cache. With
+    `use_process_pool` the drawing happens in a worker process so it doesn't
+    hold the GIL in the calling one.
+    """
+    cache = cache or chart_cache
+    key = chart_key(pdf, ticker)
+    png = cache.get(key)
+    if png is not None:
+        return png
+    if use_process_pool:
+        png = _get_process_pool().submit(_render, pdf, ticker).result()
+    else:
+        png = _render(pdf, ticker)
+    cache.put(key, png)
+    return png
@@ -1,11 +1,16 @@
 import enum
 from pydantic import BaseModel
 
-from flows import env
-
 CURRENT_STOCK_FILE = "flows/data/current_stock.txt"
-CURRENT_MKDOWN_FILE = "flows/data/report.md"
-CURRENT_PLOT_FILE = "flows/data/plot.png"
+MARKET_STORE_FILE = "flows/data/market_data.sqlite"
+CONSTITUENTS_FILE = "flows/data/constituents.sqlite"
+CHART_CACHE_DIR = "flows/data/charts"
+BARS_DIR = "flows/data/bars"
+MINUTE_BARS_DIR = "flows/data/bars/minute"
+BAR_STORE_DIR = "flows/data/bars/store"
+LEDGER_DIR = "flows/data/ledger"
+PERFORMANCE_FILE = "flows/data/performance.sqlite"
+RUN_STATE_DIR = "flows/data/runs"
 
 
 class SlackChannel(BaseModel):
@@ -18,6 +23,21 @@ class AccountType(enum.StrEnum):
     PAPER = "paper"
 
 
+class Provider(enum.StrEnum):
+    ALPACA_TRADING = "alpaca_trading"
+    ALPACA_DATA = "alpaca_data"
+    FINNHUB = "finnhub"
+    WIKIPEDIA = "wikipedia"
+    SECRET_MANAGER = "secret_manager"
+    SLACK = "slack"
+
+
+class PickMethod(enum.StrEnum):
+    RANDOM = "random"
+    TOP_K = "top_k"  # uniformly among the k best scores
+    WEIGHTED = "weighted"  # softmax over every score
+
+
 class SlackChannelName(enum.StrEnum):
     BOT_TEST = "bot-test"
     HUMPDAY_DAY_TRADER = "humpday-day-trader"
@@ -40,3 +60,8 @@ ALPACA_URL = {
     AccountType.LIVE: "https://api.alpaca.markets",
     AccountType.PAPER: "https://paper-api.alpaca.markets/v2",
 }
+ALPACA_DATA_URL = "https://data.alpaca.markets/v2"
+ALPACA_STREAM_URL = {
+    AccountType.LIVE: "wss://api.alpaca.markets/stream",
+    AccountType.PAPER: "wss://paper-api.alpaca.markets/stream",
+}
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from datetime import date
+from io import StringIO
+
+import pandas as pd
+import requests
+
+from flows import const
+from flows.const import Provider
+from flows.utils import api_metrics
+
+NASDAQ100_URL = "https://en.m.wikipedia.org/wiki/Nasdaq-100"
+# the list only changes at the annual reconstitution and the odd replacement
+REFRESH_TTL_SECONDS = 7 * 24 * 60 * 60
+# wikipedia turns away the default urllib / requests user agents
+USER_AGENT = "humpday_day_trader/0.1 (https://github.com/jcooper036/humpday_day_trader)"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    index_name TEXT NOT NULL,
+    effective_date TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (index_name, effective_date)
+);
+CREATE TABLE IF NOT EXISTS fetch_state (
+    index_name TEXT PRIMARY KEY,
+    checked_at REAL NOT NULL,
+    etag TEXT,
+    last_modified TEXT
+);
+"""
+
+
+def parse_constituents(html: str) -> pd.DataFrame:
+    return (
+        pd.read_html(StringIO(html), attrs={"id": "constituents"}, index_col="Symbol")[
+            0
+        ]
+        .reset_index()
+        .rename(columns={"Symbol": "Ticker"})
+    )
+
+
+class ConstituentIndex:
+    """Dated snapshots of an index's constituents, refreshed at most once a TTL.
+
+    A new snapshot is only written when the list actually changes, so the
+    table doubles as a history of past universes (`members(as_of=...)`).
+    """
+
+    def __init__(
+        self,
+        path: str = const.CONSTITUENTS_FILE,
+        index_name: str = "nasdaq100",
+        url: str = NASDAQ100_URL,
+        ttl: float = REFRESH_TTL_SECONDS,
+    ):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(_SCHEMA)
+        self.index_name = index_name
+        self.url = url
+        self.ttl = ttl
+        self._frame: pd.DataFrame | None = None
+        # set once a refresh fails, the rest of this index's calls use what's stored
+        self._refresh_failed = False
+        self._by_ticker: dict[str, dict] = {}
+        self._by_sector: dict[str, list[str]] = {}
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _fetch_state(self):
+        return self._conn.execute(
+            "SELECT checked_at, etag, last_modified FROM fetch_state WHERE index_name=?",
+            (self.index_name,),
+        ).fetchone()
+
+    def refresh(self, force: bool = False) -> bool:
+        """Re-fetch if the TTL ran out. Returns True when a new snapshot was stored."""
+        state = self._fetch_state()
+        if state is not None and not force and time.time() - state[0] < self.ttl:
+            return False
+
+        headers = {"User-Agent": USER_AGENT}
+        if state is not None and state[1]:
+            headers["If-None-Match"] = state[1]
+        if state is not None and state[2]:
+            headers["If-Modified-Since"] = state[2]
+        response = api_metrics.observe_response(
+            Provider.WIKIPEDIA, requests.get(self.url, headers=headers, timeout=30)
+        )
+        changed = False
+        if response.status_code != 304:
+            response.raise_for_status()
+            changed = self._store(parse_constituents(response.text))
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fetch_state VALUES (?, ?, ?, ?)",
+                (
+                    self.index_name,
+                    time.time(),
+                    response.headers.get("ETag", state[1] if state else None),
+                    response.headers.get("Last-Modified", state[2] if state else None),
+                ),
+            )
+        return changed
+
+    def _store(self, df: pd.DataFrame, effective_date: date | None = None) -> bool:
+        records = sorted(df.to_dict("records"), key=lambda r: r["Ticker"])
+        payload = json.dumps(records, sort_keys=True)
+        content_hash = hashlib.sha1(payload.encode()).hexdigest()
+        latest = self._conn.execute(
+            """SELECT content_hash FROM snapshots WHERE index_name=?
+            ORDER BY effective_date DESC LIMIT 1""",
+            (self.index_name,),
+        ).fetchone()
+        if latest is not None and latest[0] == content_hash:
+            return False
+        effective_date = effective_date or date.today()
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)",
+                (self.index_name, effective_date.isoformat(), content_hash, payload),
+            )
+        self._frame = None
+        return True
+
+    def members(self, as_of: date | None = None) -> pd.DataFrame:
+        """Constituents as of a date (latest snapshot on or before it), or today's.
+
+        Today's list falls back to the latest snapshot when wikipedia can't be
+        reached, it only raises when there is nothing stored yet.
+        """
+        if as_of is None:
+            if not self._refresh_failed:
+                try:
+                    self.refresh()
+                except requests.RequestException as e:
+                    if not self.history():
+                        raise
+                    print(
+                        f"couldn't refresh {self.index_name} constituents ({e}), using the latest snapshot"
+                    )
+                    self._refresh_failed = True
+            if self._frame is not None:
+                return self._frame
+        row = self._conn.execute(
+            """SELECT payload FROM snapshots WHERE index_name=? AND effective_date<=?
+            ORDER BY effective_date DESC LIMIT 1""",
+            (self.index_name, (as_of or date.today()).isoformat()),
+        ).fetchone()
+        if row is None:
+            raise LookupError(f"no {self.index_name} snapshot on or before {as_of}")
+        df = pd.DataFrame(json.loads(row[0]))
+        if as_of is None:
+            self._frame = df
+            self._by_ticker = {r["Ticker"]: r for r in df.to_dict("records")}
+            self._by_sector = df.groupby("GICS Sector").Ticker.apply(list).to_dict()
+        return df
+
+    def history(self) -> list[date]:
+        rows = self._conn.execute(
+            "SELECT effective_date FROM snapshots WHERE index_name=? ORDER BY effective_date",
+            (self.index_name,),
+        ).fetchall()
+        return [date.fromisoformat(r[0]) for r in rows]
+
+    def lookup(self, ticker: str) -> dict | None:
+        self.members()
+        return self._by_ticker.get(ticker)
+
+    def sector(self, gics_sector: str) -> list[str]:
+        self.members()
+        return self._by_sector.get(gics_sector, [])
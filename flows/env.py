@@ -1,16 +1,31 @@
-# import os
-# from dotenv import load_dotenv
-from flows.utils.secret_access import get_gsm_secret
+from flows.utils.secret_access import get_secret, get_secrets
 
-# load_dotenv()
-
-FINNHUB_API_KEY = get_gsm_secret(secret_name="finnhub_api_key")
-ALPACA_PAPER_API_KEY = get_gsm_secret(secret_name="alpaca_paper_api_key")
-ALPACA_PAPER_API_SECRET = get_gsm_secret(secret_name="alpaca_paper_api_secret")
+# env attribute -> secret name. These are resolved on first access instead of at
+# import time, and the first access pulls all of them in one concurrent batch
+SECRETS = {
+    "FINNHUB_API_KEY": "finnhub_api_key",
+    "ALPACA_PAPER_API_KEY": "alpaca_paper_api_key",
+    "ALPACA_PAPER_API_SECRET": "alpaca_paper_api_secret",
+}
 ALPACA_LIVE_API_KEY = ""
 ALPACA_LIVE_API_SECRET = ""
-# FINNHUB_API_KEY = os.environ.get("FINNHUB_API_KEY")
-# ALPACA_LIVE_API_KEY = os.environ.get("ALPACA_LIVE_API_KEY")
-# ALPACA_LIVE_API_SECRET = os.environ.get("ALPACA_LIVE_API_SECRET")
-# ALPACA_PAPER_API_KEY = os.environ.get("ALPACA_PAPER_API_KEY")
-# ALPACA_PAPER_API_SECRET = os.environ.get("ALPACA_PAPER_API_SECRET")
+
+_prefetched = False
+
+
+def prefetch():
+    get_secrets(list(SECRETS.values()))
+
+
+def __getattr__(name: str):
+    global _prefetched
+    if name not in SECRETS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if not _prefetched:
+        _prefetched = True
+        try:
+            prefetch()
+        except KeyError:
+            # only some of them are set locally, the lookup below says which
+            pass
+    return get_secret(SECRETS[name])
@@ -0,0 +1,266 @@
+"""Replay the etf_balancing allocation over historical daily bars.
+
+    python -m flows.etf_trading.backtest --symbols SPY QQQ IWM --lookback 10 21 63 --sell-balancing both
+
+Bars are read from local CSV files (`<bars>/<SYMBOL>.csv` with the t, o, h,
+l, c, v columns of Alpaca's bars endpoint), so it runs offline. Sweep points
+run in parallel on a process pool, each worker loads the bars once.
+"""
+
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+
+import numpy as np
+
+from flows import const
+from flows.etf_trading.portfolio import MAX_TILT, STOP_LOSS_RATIO, momentum_targets
+
+TRADING_DAYS = 252
+
+
+@dataclass
+class Bars:
+    dates: np.ndarray  # datetime64[D], (T,)
+    symbols: list[str]
+    open: np.ndarray  # (T, N)
+    low: np.ndarray
+    close: np.ndarray
+
+
+def load_bars(
+    directory: str = const.BARS_DIR, symbols: list[str] | None = None
+) -> Bars:
+    """Daily bars for `symbols` (default: every CSV in `directory`) on their common dates."""
+    import pandas as pd
+
+    if symbols is None:
+        symbols = sorted(
+            f.removesuffix(".csv") for f in os.listdir(directory) if f.endswith(".csv")
+        )
+    frames = {}
+    for symbol in symbols:
+        df = pd.read_csv(
+            os.path.join(directory, f"{symbol}.csv"), usecols=["t", "o", "l", "c"]
+        )
+        df.index = pd.to_datetime(df.pop("t").str[:10])
+        frames[symbol] = df
+    # only dates every symbol traded, a rebalance needs a price for all of them
+    joined = pd.concat(frames, axis=1, join="inner").sort_index()
+    if joined.empty:
+        raise ValueError(f"no dates shared by all of {symbols}")
+
+    def field(name):
+        return joined.xs(name, axis=1, level=1)[symbols].to_numpy(dtype=float)
+
+    return Bars(
+        dates=joined.index.to_numpy().astype("datetime64[D]"),
+        symbols=list(symbols),
+        open=field("o"),
+        low=field("l"),
+        close=field("c"),
+    )
+
+
+@dataclass(frozen=True)
+class BacktestParams:
+    lookback: int = 21  # trading days, the flow looks back 30 calendar days
+    rebalance_every: int = 1  # trading days between runs
+    sell_balancing: bool = False
+    max_tilt: float = MAX_TILT
+    stop_loss: float = STOP_LOSS_RATIO  # 0 turns it off
+    initial_cash: float = 100_000.0
+    whole_shares: bool = True
+
+
+def backtest(bars: Bars, params: BacktestParams) -> dict:
+    """Simulate the strategy and return summary metrics.
+
+    Each run trades at the open on the momentum of the previous closes
+    (close[t-1] / close[t-1-lookback]). Buys split the cash over the
+    underweight symbols by target, and with `sell_balancing` overweight
+    positions are first cut back, the same way the flow does it. A stop
+    at `stop_loss` x the last buy price closes the whole position the first
+    day the low reaches it. Everything inside a rebalance period (stops,
+    daily equity) is done as array operations over days x symbols; only the
+    periods themselves are a loop, since holdings carry from one to the next.
+    """
+    started = time.perf_counter()
+    T, N = bars.close.shape
+    if T <= params.lookback + 1:
+        raise ValueError(f"need more than {params.lookback + 1} days of bars, got {T}")
+    run_days = np.arange(params.lookback + 1, T, params.rebalance_every)
+    # targets for every run at once
+    ratio = bars.close[run_days - 1] / bars.close[run_days - 1 - params.lookback]
+    targets = momentum_targets(ratio, params.max_tilt)
+
+    shares = np.zeros(N)
+    stop = np.zeros(N)
+    cash = params.initial_cash
+    equity = np.full(T, np.nan)
+    equity[: run_days[0]] = cash
+    traded = 0.0
+    n_trades = 0
+    stop_outs = 0
+
+    for k, day in enumerate(run_days):
+        price = bars.open[day]
+        value = shares * price
+        proportions = value / (value.sum() + cash)
+        target = targets[k]
+
+        if params.sell_balancing:
+            over = target < proportions
+            left = np.divide(
+                target * shares, proportions, out=shares.copy(), where=over
+            )
+            sell = np.where(over, np.round(shares - left, 2), 0.0)
+            shares -= sell
+            cash += sell @ price
+            traded += sell @ price
+            n_trades += int((sell > 0).sum())
+
+        under = target > proportions
+        if under.any() and cash > 0:
+            weights = np.where(under, target, 0.0)
+            allocation = np.floor(cash * weights / weights.sum())
+            buy = allocation / price
+            if params.whole_shares:
+                buy = np.floor(buy)
+            shares += buy
+            cash -= buy @ price
+            traded += buy @ price
+            n_trades += int((buy > 0).sum())
+            stop = np.where(buy > 0, price * params.stop_loss, stop)
+
+        # stops hit between now and the next run, first hit per symbol
+        end = run_days[k + 1] if k + 1 < len(run_days) else T
+        days = np.arange(day, end)
+        held = shares > 0
+        hit = (bars.low[day:end] <= stop) & held & (params.stop_loss > 0)
+        hit_any = hit.any(axis=0)
+        first = np.where(hit_any, hit.argmax(axis=0), len(days))
+        exit_price = np.minimum(
+            bars.open[day + np.minimum(first, len(days) - 1), np.arange(N)], stop
+        )
+        proceeds = np.where(hit_any, shares * exit_price, 0.0)
+
+        alive = np.arange(len(days))[:, None] < first[None, :]
+        cash_by_day = cash + np.cumsum(
+            np.bincount(first[hit_any], weights=proceeds[hit_any], minlength=len(days))[
+                : len(days)
+            ]
+        )
+        equity[days] = (alive * shares * bars.close[day:end]).sum(axis=1) + cash_by_day
+
+        cash += proceeds.sum()
+        traded += proceeds.sum()
+        stop_outs += int(hit_any.sum())
+        shares = np.where(hit_any, 0.0, shares)
+
+    curve = equity[run_days[0] - 1 :]
+    daily = curve[1:] / curve[:-1] - 1
+    years = len(daily) / TRADING_DAYS
+    total_return = curve[-1] / curve[0] - 1
+    drawdown = 1 - curve / np.maximum.accumulate(curve)
+    volatility = daily.std() * np.sqrt(TRADING_DAYS)
+    return {
+        "total_return": float(total_return),
+        "cagr": float((1 + total_return) ** (1 / years) - 1) if years > 0 else 0.0,
+        "volatility": float(volatility),
+        "sharpe": float(daily.mean() * TRADING_DAYS / volatility)
+        if volatility > 0
+        else 0.0,
+        "max_drawdown": float(drawdown.max()),
+        # traded value over average equity, per year
+        "turnover": float(traded / curve.mean() / years) if years > 0 else 0.0,
+        "trades": n_trades,
+        "stop_outs": stop_outs,
+        "runtime_ms": (time.perf_counter() - started) * 1000,
+    }
+
+
+_worker_bars: Bars | None = None
+
+
+def _init_worker(directory: str, symbols: list[str] | None):
+    global _worker_bars
+    _worker_bars = load_bars(directory, symbols)
+
+
+def _run_point(params: BacktestParams) -> dict:
+    return {**asdict(params), **backtest(_worker_bars, params)}
+
+
+def sweep(
+    grid: dict[str, list],
+    directory: str = const.BARS_DIR,
+    symbols: list[str] | None = None,
+    processes: int | None = None,
+) -> list[dict]:
+    """Backtest every combination in `grid` ({param: [values]}) on a process pool."""
+    keys = list(grid)
+    points = [
+        BacktestParams(**dict(zip(keys, values)))
+        for values in itertools.product(*grid.values())
+    ]
+    with ProcessPoolExecutor(
+        max_workers=processes or os.cpu_count(),
+        initializer=_init_worker,
+        initargs=(directory, symbols),
+    ) as pool:
+        return list(pool.map(_run_point, points))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--bars", default=const.BARS_DIR, help="directory of <SYMBOL>.csv daily bars"
+    )
+    parser.add_argument("--symbols", nargs="+", help="defaults to every file in --bars")
+    parser.add_argument("--lookback", type=int, nargs="+", default=[21])
+    parser.add_argument("--rebalance-every", type=int, nargs="+", default=[1, 5])
+    parser.add_argument(
+        "--sell-balancing", choices=["yes", "no", "both"], default="both"
+    )
+    parser.add_argument("--max-tilt", type=float, nargs="+", default=[MAX_TILT])
+    parser.add_argument("--stop-loss", type=float, nargs="+", default=[STOP_LOSS_RATIO])
+    parser.add_argument("--processes", type=int)
+    args = parser.parse_args()
+
+    grid = {
+        "lookback": args.lookback,
+        "rebalance_every": args.rebalance_every,
+        "sell_balancing": {"yes": [True], "no": [False], "both": [False, True]}[
+            args.sell_balancing
+        ],
+        "max_tilt": args.max_tilt,
+        "stop_loss": args.stop_loss,
+    }
+    started = time.perf_counter()
+    results = sweep(grid, args.bars, args.symbols, args.processes)
+    columns = ["lookback", "rebalance_every", "sell_balancing", "max_tilt", "stop_loss"]
+    metrics = [
+        "total_return",
+        "cagr",
+        "max_drawdown",
+        "sharpe",
+        "turnover",
+        "stop_outs",
+        "runtime_ms",
+    ]
+    print("".join(f"{c:>16}" for c in columns + metrics))
+    for r in sorted(results, key=lambda r: -r["cagr"]):
+        cells = [str(r[c]) for c in columns]
+        cells += [
+            f"{r[m]:.3f}" if isinstance(r[m], float) else str(r[m]) for m in metrics
+        ]
+        print("".join(f"{c:>16}" for c in cells))
+    print(f"{len(results)} sweep points in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
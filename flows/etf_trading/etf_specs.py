@@ -1,4 +1,13 @@
-from flows.utils.secret_access import get_gsm_secret
+from flows.utils.secret_access import get_secret
 
-gcp_etf_options = get_gsm_secret(secret_name="etf_picks")
-etf_options = gcp_etf_options.split(",") if isinstance(gcp_etf_options, str) else []
+
+def get_etf_options() -> list[str]:
+    gcp_etf_options = get_secret(secret_name="etf_picks")
+    return gcp_etf_options.split(",") if isinstance(gcp_etf_options, str) else []
+
+
+def __getattr__(name: str):
+    # kept so `etf_specs.etf_options` still works, but it's no longer fetched on import
+    if name == "etf_options":
+        return get_etf_options()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
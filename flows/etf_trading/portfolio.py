@@ -0,0 +1,161 @@
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+import numpy as np
+from pydantic import BaseModel
+
+# keep every position between 30% and 170% of an equal weight
+MAX_TILT = 0.7
+STOP_LOSS_RATIO = 0.85
+
+
+def momentum_targets(
+    ratio_change: np.ndarray, max_tilt: float = MAX_TILT
+) -> np.ndarray:
+    """Target weights proportional to recent performance, clipped around equal weight.
+
+    Works along the last axis, so a (dates, symbols) array of price ratios
+    gives the targets for every date at once.
+    """
+    n = ratio_change.shape[-1]
+    equal = 1 / n
+    performance = ratio_change / ratio_change.sum(axis=-1, keepdims=True)
+    targets = np.where(
+        performance > equal,
+        np.minimum(performance, equal + max_tilt / n),
+        np.maximum(performance, equal - max_tilt / n),
+    )
+    # the clipping doesn't have to offset, so scale back to a sum of 1
+    total = targets.sum(axis=-1, keepdims=True)
+    return np.where((total > 1) | (total < 0.99), targets / total, targets)
+
+
+class Position(BaseModel):
+    symbol: str
+    market_value: Decimal
+    qty: Decimal
+    current_price: Decimal
+    proportion_portfolio_value: float
+    cost_basis: Decimal | None = None
+    ratio_change: float | None = None
+    new: bool = False
+
+
+class Portfolio(BaseModel):
+    cash_on_hand: int
+    positions: list[Position]
+
+
+@dataclass
+class PortfolioArrays:
+    """A portfolio as columns, one row per symbol.
+
+    `index` maps a symbol to its row. Everything the rebalance needs is a
+    vectorized expression over these arrays; pydantic / Decimal only come in
+    when reading positions from the broker and building order requests.
+
+    `proportions` are taken when the portfolio is built and stay put while
+    the run moves `cash` around: after the sells, market_value is still the
+    pre-sell value, so recomputing would count the sold shares twice.
+    """
+
+    symbols: np.ndarray
+    qty: np.ndarray
+    price: np.ndarray
+    market_value: np.ndarray
+    cost_basis: np.ndarray
+    new: np.ndarray
+    cash: float
+    ratio_change: np.ndarray | None = None
+    proportions: np.ndarray | None = None
+    index: dict[str, int] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.index = {s: i for i, s in enumerate(self.symbols.tolist())}
+        if self.proportions is None:
+            total = self.market_value.sum() + self.cash
+            self.proportions = (
+                self.market_value / total if total > 0 else np.zeros(len(self))
+            )
+
+    def __len__(self):
+        return len(self.symbols)
+
+    @classmethod
+    def from_holdings(
+        cls,
+        universe: list[str],
+        held: list,
+        new_prices: dict[str, float],
+        cash: float,
+    ) -> "PortfolioArrays":
+        """Rows for `universe`, filled from broker positions where we hold one.
+
+        `held` are alpaca positions (only those in `universe` are used), and
+        `new_prices` has a price for every symbol we don't hold yet.
+        """
+        symbols = np.array(universe, dtype=object)
+        n = len(symbols)
+        index = {s: i for i, s in enumerate(universe)}
+        qty, price, value = np.zeros(n), np.zeros(n), np.zeros(n)
+        cost_basis = np.full(n, np.nan)
+        new = np.ones(n, dtype=bool)
+        for p in held:
+            i = index.get(p.symbol)
+            if i is None:
+                continue
+            qty[i] = float(p.qty)
+            price[i] = float(p.current_price)
+            value[i] = float(p.market_value)
+            cost_basis[i] = float(p.cost_basis)
+            new[i] = False
+        for i in np.flatnonzero(new):
+            price[i] = new_prices[universe[i]]
+        return cls(symbols, qty, price, value, cost_basis, new, float(cash))
+
+    def rebalance_targets(self) -> np.ndarray:
+        return momentum_targets(self.ratio_change)
+
+    def sell_quantities(self, targets: np.ndarray) -> np.ndarray:
+        """Shares to sell to bring overweight positions down to `targets` (2 dp)."""
+        proportions = self.proportions
+        over = targets < proportions
+        # x / a = y / b
+        left = np.divide(
+            targets * self.qty, proportions, out=self.qty.copy(), where=over
+        )
+        return np.where(over, np.round(self.qty - left, 2), 0.0)
+
+    def buy_quantities(self, targets: np.ndarray) -> np.ndarray:
+        """Whole shares to buy for underweight positions, splitting the cash by target."""
+        under = targets > self.proportions
+        if not under.any() or self.cash <= 0:
+            return np.zeros(len(self))
+        weights = np.where(under, targets, 0.0)
+        allocation = np.floor(self.cash * weights / weights.sum())
+        # many of these aren't fractionable
+        return np.floor(
+            np.divide(
+                allocation, self.price, out=np.zeros(len(self)), where=self.price > 0
+            )
+        )
+
+    def to_portfolio(self) -> Portfolio:
+        # for printing and anything that wants the pydantic models
+        proportions = self.proportions
+        positions = [
+            Position(
+                symbol=self.symbols[i],
+                market_value=Decimal(str(self.market_value[i])),
+                qty=Decimal(str(self.qty[i])),
+                current_price=Decimal(str(self.price[i])),
+                proportion_portfolio_value=float(proportions[i]),
+                cost_basis=None if self.new[i] else Decimal(str(self.cost_basis[i])),
+                ratio_change=None
+                if self.ratio_change is None
+                else float(self.ratio_change[i]),
+                new=bool(self.new[i]),
+            )
+            for i in range(len(self))
+        ]
+        return Portfolio(cash_on_hand=int(self.cash), positions=positions)
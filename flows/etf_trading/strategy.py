@@ -1,261 +1,208 @@
+import uuid
 from datetime import timedelta
-from decimal import Decimal
-import time
-from typing import Optional
-
-from alpaca.trading.requests import (
-    MarketOrderRequest,
-    StopLossRequest,
-    GetOrdersRequest,
-)
-from alpaca.trading.enums import OrderSide, TimeInForce
+from typing import TYPE_CHECKING
+
 from prefect import flow, task
-from pydantic import BaseModel
 
+from flows import ledger
 from flows.alpaca_client import (
     get_client,
     get_historical_trades,
-    get_latest_trade,
+    get_latest_trades,
 )
 from flows.const import AccountType, SlackChannelName
-from flows.etf_trading.etf_specs import etf_options
-
+from flows.etf_trading.etf_specs import get_etf_options
+from flows.order_submitter import submit_orders, summarize
+from flows.order_tracker import close_order_trackers, get_order_tracker
+from flows.utils import api_metrics, clients, market_time
 
-class Position(BaseModel):
-    symbol: str
-    market_value: Decimal
-    qty: Decimal
-    current_price: Decimal
-    proportion_portfolio_value: float
-    cost_basis: Decimal | None = None
-    ratio_change: Optional[float] = None
-    new: bool = False
+# alpaca-py is imported by the tasks that build requests, it's slow to
+# import; the numpy portfolio and bar store only load once a run needs them
+if TYPE_CHECKING:
+    import numpy as np
+    from alpaca.trading.requests import MarketOrderRequest
 
+    from flows.etf_trading.portfolio import PortfolioArrays
 
-class Portfolio(BaseModel):
-    cash_on_hand: int
-    positions: list[Position]
 
-
-@task(retries=3, retry_delay_seconds=5)
+@task
 def get_curent_portfolio(
     cash_to_set_aside: int,
-    etfs: list[str] = etf_options,
+    etfs: list[str] | None = None,
     account_type: AccountType = AccountType.PAPER,
-) -> Portfolio:
+) -> "PortfolioArrays":
+    from flows.etf_trading.portfolio import PortfolioArrays
+
+    etfs = etfs or get_etf_options()
     client = get_client(account_type)
     account = client.get_account()
     cash_on_hand = int(float(account.cash))  # round down to nearest whole
     usable_cash = cash_on_hand - min(cash_to_set_aside, cash_on_hand)
-    positions = client.get_all_positions()
-    positions = [p for p in positions if p.symbol in etfs]
-    new_positions = []
-    for etf in etfs:
-        if etf not in [p.symbol for p in positions]:
-            data = get_latest_trade(
-                symbols=[etf],
-                account_type=account_type,
-            )
-            price = data["trades"][etf]["p"]
-            new_positions.append(
-                Position(
-                    new=True,
-                    symbol=etf,
-                    qty=0,
-                    market_value=0.0,
-                    proportion_portfolio_value=0.0,
-                    current_price=price,
-                )
-            )
-
-    total_position_market_value = (
-        sum([Decimal(p.market_value) for p in positions]) + usable_cash
-    )
-    # current proportions
-    value_proportions = {
-        p.symbol: float(Decimal(p.market_value) / total_position_market_value)
-        for p in positions
-    }
-    positions = [
-        Position(
-            symbol=p.symbol,
-            market_value=Decimal(p.market_value),
-            qty=Decimal(p.qty),
-            cost_basis=Decimal(p.cost_basis),
-            proportion_portfolio_value=value_proportions[p.symbol],
-            current_price=Decimal(p.current_price),
-        )
-        for p in positions
-    ]
-    positions = positions + new_positions
-    return Portfolio(cash_on_hand=usable_cash, positions=positions)
+    wanted = set(etfs)
+    positions = [p for p in client.get_all_positions() if p.symbol in wanted]
+    held = {p.symbol for p in positions}
+    # one batched price lookup for everything we don't hold yet
+    new_prices = get_latest_trades(
+        symbols=[etf for etf in etfs if etf not in held],
+        account_type=account_type,
+    ).prices
+    # can't size a buy without a price, leave those out of this rebalance
+    etfs = [etf for etf in etfs if etf in held or etf in new_prices]
+    return PortfolioArrays.from_holdings(etfs, positions, new_prices, usable_cash)
+
+
+@task
+def sync_bars(
+    etfs: list[str], account_type: AccountType = AccountType.PAPER
+) -> dict[str, int]:
+    from flows.bar_store import DAY, get_bar_store
+
+    try:
+        added = get_bar_store().sync(etfs, DAY, account_type)
+    except Exception as e:
+        # measure_performance falls back to the trades API for anything missing
+        print(f"bar sync failed: {e}")
+        return {}
+    print(f"{sum(added.values())} daily bars added")
+    return added
 
 
 def measure_performance(
-    portfolio: Portfolio,
+    portfolio: "PortfolioArrays",
     time_frame: timedelta = timedelta(days=30),
     account_type: AccountType = AccountType.PAPER,
 ):
-    symbols = [p.symbol for p in portfolio.positions]
-    data = get_historical_trades(
-        symbols=symbols,
-        time_frame=time_frame,
-        account_type=account_type,
-    )
-    old_price = {s: data[s]["p"] for s in symbols}
-    for p in portfolio.positions:
-        p.ratio_change = float(p.current_price) / old_price[p.symbol]
+    import numpy as np
+
+    from flows.bar_store import get_bar_store
+
+    symbols = portfolio.symbols.tolist()
+    # the open of the session time_frame ago (or the one before, if the
+    # market was shut), read from the local bar store
+    asof = market_time.market_today() - time_frame
+    old_prices = get_bar_store().session_open(symbols, asof)
+    missing = [s for s in symbols if s not in old_prices]
+    if missing:
+        print(f"no recent stored bars for {missing}, asking the trades API")
+        data = get_historical_trades(
+            symbols=missing,
+            time_frame=time_frame,
+            account_type=account_type,
+        )
+        old_prices.update({s: data[s]["p"] for s in missing})
+    old_price = np.array([old_prices[s] for s in symbols], dtype=float)
+    portfolio.ratio_change = portfolio.price / old_price
     return portfolio
 
 
 @task
-def compute_rebalance_target(portfolo: Portfolio) -> dict:
-    min_ratio_per_position = (1 / len(portfolo.positions)) - (
-        0.7 / len(portfolo.positions)
-    )
-    max_ratio_per_position = (1 / len(portfolo.positions)) + (
-        0.7 / len(portfolo.positions)
-    )
-    change_sum = sum([p.ratio_change for p in portfolo.positions])
-    performance_proportional_change = {
-        p.symbol: (p.ratio_change / change_sum) for p in portfolo.positions
-    }
-    adj_performance_proportional_change = {}
-    for k, v in performance_proportional_change.items():
-        if v > (1 / len(portfolo.positions)):
-            adj_performance_proportional_change[k] = min(v, max_ratio_per_position)
-        else:
-            adj_performance_proportional_change[k] = max(v, min_ratio_per_position)
-
-    # finally adjust everything such that the sum is 1. It might be more because
-    # of non-offsetting upwards / downwards adjustments, but it should never be
-    # that far off
-    total_adj = sum(adj_performance_proportional_change.values())
-    if total_adj > 1 or total_adj < 0.99:  # poor-mans .isclose w/o using numpy :)
-        for k, v in adj_performance_proportional_change:
-            adj_performance_proportional_change[k] = v / total_adj
-
-    return adj_performance_proportional_change
+def compute_rebalance_target(portfolo: "PortfolioArrays") -> "np.ndarray":
+    return portfolo.rebalance_targets()
 
 
 @task
 def create_rebalance_sell_orders(
-    portfolo: Portfolio, rebalance_targets: dict
-) -> list[MarketOrderRequest]:
+    portfolo: "PortfolioArrays", rebalance_targets: "np.ndarray"
+) -> "list[MarketOrderRequest]":
+    import numpy as np
+    from alpaca.trading.enums import OrderSide, TimeInForce
+    from alpaca.trading.requests import MarketOrderRequest
 
-    orders = []
     # for any assets that are too much of the portfolio, turn the correct proportion into cash
-    for position in portfolo.positions:
-        if rebalance_targets[position.symbol] < position.proportion_portfolio_value:
-            # x / a = y / b
-            n_left_shares = (
-                rebalance_targets[position.symbol]
-                * float(position.qty)
-                / position.proportion_portfolio_value
-            )
-            n_sell_shares = round(float(position.qty) - n_left_shares, 2)
-            portfolo.cash_on_hand += n_sell_shares * position.current_price
-            orders.append(
-                MarketOrderRequest(
-                    symbol=position.symbol,
-                    qty=n_sell_shares,
-                    side=OrderSide.SELL,
-                    time_in_force=TimeInForce.DAY,
-                )
-            )
-    return orders
-
-
-@task(retries=3, retry_delay_seconds=5)
+    sell_qty = portfolo.sell_quantities(rebalance_targets)
+    portfolo.cash += float(sell_qty @ portfolo.price)
+    return [
+        MarketOrderRequest(
+            symbol=portfolo.symbols[i],
+            qty=float(sell_qty[i]),
+            side=OrderSide.SELL,
+            time_in_force=TimeInForce.DAY,
+        )
+        for i in np.flatnonzero(sell_qty > 0)
+    ]
+
+
+@task
 def update_portfolio_cash(
-    portfolo: Portfolio,
+    portfolo: "PortfolioArrays",
     cash_to_set_aside: int,
     account_type: AccountType = AccountType.PAPER,
 ):
     client = get_client(account_type)
     account = client.get_account()
     cash_on_hand = int(float(account.cash))  # round down to nearest whole
-    portfolo.cash_on_hand = cash_on_hand - cash_to_set_aside
+    portfolo.cash = cash_on_hand - cash_to_set_aside
     return portfolo
 
 
 @task
-def create_rebalance_buy_orders(portfolo: Portfolio, rebalance_targets: dict):
-    orders = []
-    buy_targets = {}
-    for position in portfolo.positions:
-        if rebalance_targets[position.symbol] > position.proportion_portfolio_value:
-            buy_targets[position.symbol] = rebalance_targets[position.symbol]
-    buy_target_total = sum(buy_targets.values())
-
-    # this is basically the amount of money to invest in each ticker
-    buy_allocation: dict[str, int] = {
-        k: int(portfolo.cash_on_hand * (v / buy_target_total))
-        for k, v in buy_targets.items()
-    }
-    print(f"{portfolo.cash_on_hand=}")
-    for symbol, money_to_spend in buy_allocation.items():
-        print(f"{symbol=}, {money_to_spend=}")
-        current_price = [
-            p.current_price for p in portfolo.positions if p.symbol == symbol
-        ][0]
-        buy_qty = int(
-            money_to_spend / current_price
-        )  # many of these aren't fractionable
-        if buy_qty > 0:
-            orders.append(
-                MarketOrderRequest(
-                    symbol=symbol,
-                    qty=buy_qty,
-                    side=OrderSide.BUY,
-                    time_in_force=TimeInForce.DAY,
-                    stop_loss=StopLossRequest(stop_price=float(current_price) * 0.85),
-                )
-            )
-    return orders
-
-
-@task(retries=3, retry_delay_seconds=5)
+def create_rebalance_buy_orders(
+    portfolo: "PortfolioArrays", rebalance_targets: "np.ndarray"
+):
+    import numpy as np
+    from alpaca.trading.enums import OrderSide, TimeInForce
+    from alpaca.trading.requests import MarketOrderRequest, StopLossRequest
+
+    from flows.etf_trading.portfolio import STOP_LOSS_RATIO
+
+    print(f"{portfolo.cash=}")
+    # many of these aren't fractionable, so whole shares only
+    buy_qty = portfolo.buy_quantities(rebalance_targets)
+    return [
+        MarketOrderRequest(
+            symbol=portfolo.symbols[i],
+            qty=int(buy_qty[i]),
+            side=OrderSide.BUY,
+            time_in_force=TimeInForce.DAY,
+            stop_loss=StopLossRequest(
+                stop_price=float(portfolo.price[i]) * STOP_LOSS_RATIO
+            ),
+        )
+        for i in np.flatnonzero(buy_qty > 0)
+    ]
+
+
+@task(retries=2, retry_delay_seconds=5)
 def process_orders(
-    order_datas: list[MarketOrderRequest],
+    order_datas: "list[MarketOrderRequest]",
     account_type: AccountType = AccountType.PAPER,
-):
-    client = get_client(account_type=account_type)
-    orders = []
-    for order_data in order_datas:
-        r = client.submit_order(order_data=order_data)
-        orders.append(r)
-    return orders
+) -> list[dict]:
+    from prefect.runtime import flow_run
+
+    # client order ids come from the flow run, so a retry of this task (or of
+    # the whole run) finds the orders that already went through
+    run_key = flow_run.id or uuid.uuid4().hex
+    results = submit_orders(order_datas, run_key=run_key, account_type=account_type)
+    print(summarize(results))
+    # orders picked up from an earlier try are in the ledger already
+    submitted = [r.order for r in results if r.status == "submitted"]
+    ledger.record(
+        ledger.order_rows(submitted, ledger.ORDER, "etf_balancing", account_type)
+    )
+    failed = [r.symbol for r in results if r.status == "failed"]
+    if failed:
+        raise RuntimeError(f"{len(failed)} orders failed: {failed}")
+    return [r.order for r in results]
 
 
-@task(retries=3, retry_delay_seconds=5)
+@task
 def wait_for_orders_to_complete(
-    symbol: list[str],
-    account_type: AccountType,
-    max_retries: int = 60,
-):
-    client = get_client(account_type=account_type)
-    request_params = GetOrdersRequest(
-        symbols=[symbol],
+    orders: list[dict],
+    account_type: AccountType = AccountType.PAPER,
+    timeout: float = 8 * 3600,
+) -> list[dict]:
+    # market orders placed outside market hours sit until the next open, so
+    # the timeout is about a trading day
+    if not orders:
+        return []
+    final = get_order_tracker(account_type).wait(orders, timeout=timeout)
+    filled = [o for o in final if float(o.get("filled_qty") or 0) > 0]
+    unfilled = [o for o in final if float(o.get("filled_qty") or 0) == 0]
+    ledger.record(
+        ledger.order_rows(filled, ledger.FILL, "etf_balancing", account_type)
+        + ledger.order_rows(unfilled, ledger.ORDER, "etf_balancing", account_type)
     )
-    # orders will exist if they are not closed yet
-    orders = client.get_orders(request_params)
-    total_tries = 0
-    # for the first few tries we'll try quickly
-    # after that, slow down the retries, because it's probably going
-    # to be a while
-    retry_timing = [10, 10, 20, 60, 300]  # seconds
-    while (len(orders) > 0) and (total_tries < max_retries):
-        orders = client.get_orders(request_params)
-        if len(retry_timing) > total_tries:
-            wait_time = retry_timing[total_tries]
-        else:
-            wait_time = 3600  # default is 1 hour
-        print(f"Waiting for {symbol} order to clear: check in {wait_time} seconds")
-        time.sleep(wait_time)
-        total_tries += 1
-    if total_tries == max_retries:
-        raise ValueError(f"order for {symbol} was not proccesed in {max_retries} tries")
+    return final
 
 
 @flow(
@@ -264,32 +211,38 @@ def wait_for_orders_to_complete(
 )
 def etf_balancing(
     cash_to_set_aside: int,
-    etfs: list[str] | None = etf_options,
+    etfs: list[str] | None = None,
     account_type: AccountType = AccountType.PAPER,
     sell_balancing=False,
     slack_channel_name: SlackChannelName = SlackChannelName.BOT_TEST,
 ):
+    api_calls = api_metrics.metrics.mark()
+    etfs = etfs or get_etf_options()
+    sync_bars(etfs, account_type=account_type)
+    # connect to the trade updates stream now so it's listening before the
+    # first order goes out
+    get_order_tracker(account_type)
     portfolio = get_curent_portfolio(
         cash_to_set_aside=cash_to_set_aside,
         etfs=etfs,
         account_type=account_type,
     )
-    print(f"{portfolio.model_dump_json()=}")
-    portfolio = measure_performance(portfolio)
-    print(f"{portfolio.model_dump_json()=}")
+    print(f"{portfolio.to_portfolio().model_dump_json()=}")
+    portfolio = measure_performance(portfolio, account_type=account_type)
+    print(f"{portfolio.to_portfolio().model_dump_json()=}")
     rebalance_targets = compute_rebalance_target(portfolio)
-    print(f"{rebalance_targets=}")
+    print(f"{dict(zip(portfolio.symbols, rebalance_targets.round(4).tolist()))=}")
 
     # selling orders block
     if sell_balancing:
         sell_orders = create_rebalance_sell_orders(portfolio, rebalance_targets)
         print(f"{sell_orders=}")
         sell_order_reciepts = process_orders(
-            orders=sell_orders,
+            order_datas=sell_orders,
             account_type=account_type,
         )
         print(f"{sell_order_reciepts=}")
-        wait_for_orders_to_complete(sell_order_reciepts)
+        wait_for_orders_to_complete(sell_order_reciepts, account_type=account_type)
 
     # spending cash on buy rebalancing
     portfolio = update_portfolio_cash(
@@ -299,16 +252,12 @@ def etf_balancing(
     )
     buy_orders = create_rebalance_buy_orders(portfolio, rebalance_targets)
     print(f"{buy_orders=}")
-    buy_order_reciepts = process_orders(buy_orders)
+    buy_order_reciepts = process_orders(buy_orders, account_type=account_type)
     print(f"{buy_order_reciepts=}")
-
-    # don't need to wrap in ummapped because they are
-    # not iterable arguments
-    wait_for_orders_to_complete.map(
-        symbol=etfs,
-        account_type=account_type,
-        max_retries=60,
-    )
+    wait_for_orders_to_complete(buy_order_reciepts, account_type=account_type)
+    print(f"{clients.registry.stats()=}")
+    close_order_trackers()
+    api_metrics.publish_summary(api_calls, "etf-balancing")
 
     # commence buying and selling
     # compare 3 month and 1 month window to the SNP and Nasdaq
@@ -0,0 +1,95 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from flows import env
+from flows.const import Provider
+from flows.utils import api_metrics, clients
+from flows.utils.rate_limit import TokenBucket
+
+if TYPE_CHECKING:
+    import finnhub
+
+# free tier is 60 calls / minute. Leave a little headroom for the burst so we
+# never cross it in any rolling minute
+FINNHUB_CALLS_PER_MINUTE = 55
+FINNHUB_BURST = 5
+
+
+def get_finnhub_client() -> "finnhub.Client":
+    def _build():
+        import finnhub
+
+        return finnhub.Client(api_key=env.FINNHUB_API_KEY)
+
+    return clients.registry.get(Provider.FINNHUB, _build)
+
+
+class FinnhubFetcher:
+    """Rate-limited, concurrent access to the finnhub client.
+
+    Every call takes a token from one shared bucket, identical calls that are
+    already in flight share the same future, and independent endpoints run
+    side by side on a small thread pool.
+    """
+
+    def __init__(
+        self,
+        calls_per_minute: float = FINNHUB_CALLS_PER_MINUTE,
+        burst: int = FINNHUB_BURST,
+        max_workers: int = 8,
+    ):
+        self.limiter = TokenBucket(calls_per_minute, per=60, burst=burst)
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="finnhub"
+        )
+        self._in_flight: dict[tuple, Future] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.deduped = 0
+
+    def _call(self, endpoint: str, params: dict):
+        self.limiter.acquire()
+        return getattr(get_finnhub_client(), endpoint)(**params)
+
+    def submit(self, endpoint: str, **params) -> Future:
+        key = (endpoint, tuple(sorted(params.items())))
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.deduped += 1
+                return future
+            self.calls += 1
+            future = self._pool.submit(api_metrics.carry(self._call), endpoint, params)
+            self._in_flight[key] = future
+
+        def _done(_, key=key):
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+        future.add_done_callback(_done)
+        return future
+
+    def fetch(self, endpoint: str, **params):
+        return self.submit(endpoint, **params).result()
+
+    def fetch_many(self, requests: dict[str, tuple[str, dict]]) -> dict:
+        """Run {name: (endpoint, params)} concurrently and return {name: result}."""
+        futures = {
+            name: self.submit(endpoint, **params)
+            for name, (endpoint, params) in requests.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+
+_fetcher: FinnhubFetcher | None = None
+_fetcher_lock = threading.Lock()
+
+
+def get_finnhub_fetcher() -> FinnhubFetcher:
+    # one per process so every task shares the same quota
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = FinnhubFetcher()
+    return _fetcher
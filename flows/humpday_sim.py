@@ -0,0 +1,248 @@
+"""Monte Carlo replay of the humpday pick: a random ticker bought at the open,
+sold after a fixed hold.
+
+    python -m flows.humpday_sim --seeds 10000 --hold 1 15 30 60 120 390
+
+Reads 1-minute bars from `<bars>/<SYMBOL>.csv` (Alpaca bar columns, t in
+UTC). Every trade's return for every hold window is computed up front as
+one (holds, days, symbols) array; a seed is then just a row of random
+symbol indices into it, so whole blocks of seeds are evaluated with fancy
+indexing. Blocks of seeds are spread over a process pool, and each block
+has its own seed stream, so results don't depend on the number of
+processes.
+
+Symbols are whatever has bars on the day, today's constituents replayed
+into the past carry survivorship bias unless the bar files say otherwise.
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+from flows import const
+from flows.utils.market_time import MARKET_TZ
+
+SESSION_MINUTES = 390
+POSITION_DOLLARS = 1000  # what trader.submit_buy_order spends
+SEED_BLOCK = 1000
+
+
+@dataclass
+class SessionPrices:
+    dates: np.ndarray  # datetime64[D], (D,)
+    symbols: list[str]
+    # (D, 391, N): open of every session minute, forward filled, and the
+    # session's last close at index 390. NaN before a symbol's first trade
+    prices: np.ndarray
+
+
+def load_session_prices(
+    directory: str = const.MINUTE_BARS_DIR,
+    symbols: list[str] | None = None,
+    weekday: int = 2,
+) -> SessionPrices:
+    """Regular-session minute prices on one weekday (2 = wednesday) for `symbols`."""
+    import pandas as pd
+
+    if symbols is None:
+        symbols = sorted(
+            f.removesuffix(".csv") for f in os.listdir(directory) if f.endswith(".csv")
+        )
+    frames = []
+    for n, symbol in enumerate(symbols):
+        df = pd.read_csv(
+            os.path.join(directory, f"{symbol}.csv"), usecols=["t", "o", "c"]
+        )
+        ts = pd.to_datetime(df["t"], utc=True).dt.tz_convert(MARKET_TZ)
+        minute = ts.dt.hour.to_numpy() * 60 + ts.dt.minute.to_numpy() - (9 * 60 + 30)
+        keep = (
+            (ts.dt.weekday.to_numpy() == weekday)
+            & (minute >= 0)
+            & (minute < SESSION_MINUTES)
+        )
+        frames.append(
+            pd.DataFrame(
+                {
+                    "day": ts[keep].dt.strftime("%Y-%m-%d").to_numpy(),
+                    "minute": minute[keep],
+                    "symbol": n,
+                    "o": df["o"].to_numpy()[keep],
+                    "c": df["c"].to_numpy()[keep],
+                }
+            )
+        )
+    bars = pd.concat(frames, ignore_index=True)
+    days = bars["day"].to_numpy().astype("datetime64[D]")
+    dates = np.unique(days)
+    day = np.searchsorted(dates, days)
+    minute = bars["minute"].to_numpy()
+    symbol = bars["symbol"].to_numpy()
+
+    prices = np.full((len(dates), SESSION_MINUTES + 1, len(symbols)), np.nan)
+    prices[day, minute, symbol] = bars["o"].to_numpy()
+    # forward fill minutes without a trade
+    filled = np.where(
+        ~np.isnan(prices[:, :SESSION_MINUTES]),
+        np.arange(SESSION_MINUTES)[None, :, None],
+        0,
+    )
+    filled = np.maximum.accumulate(filled, axis=1)
+    prices[:, :SESSION_MINUTES] = np.take_along_axis(
+        prices[:, :SESSION_MINUTES], filled, axis=1
+    )
+    # last close of the day goes in the closing slot
+    last = pd.DataFrame(
+        {"day": day, "symbol": symbol, "minute": minute, "c": bars["c"].to_numpy()}
+    )
+    last = last.sort_values("minute").drop_duplicates(["day", "symbol"], keep="last")
+    prices[last["day"].to_numpy(), SESSION_MINUTES, last["symbol"].to_numpy()] = last[
+        "c"
+    ].to_numpy()
+    return SessionPrices(dates=dates, symbols=list(symbols), prices=prices)
+
+
+def trade_returns(
+    prices: SessionPrices, holds: list[int], entry_minute: int = 0
+) -> np.ndarray:
+    """(holds, days, symbols) return of buying at `entry_minute` and selling `hold` minutes later.
+
+    A hold that runs past the session sells at the close.
+    """
+    entry = prices.prices[:, entry_minute, :]
+    exits = [min(entry_minute + h, SESSION_MINUTES) for h in holds]
+    return prices.prices[:, exits, :].transpose(1, 0, 2) / entry[None] - 1
+
+
+def _pickable(returns: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # per day, the symbols with a return for every hold, packed to the front
+    valid = ~np.isnan(returns).any(axis=0)  # (D, N)
+    order = np.argsort(~valid, axis=1, kind="stable")
+    return order, valid.sum(axis=1)
+
+
+def simulate_block(
+    returns: np.ndarray, n_seeds: int, block: int, seed: int = 0
+) -> np.ndarray:
+    """Per-seed P&L in dollars for every hold, (holds, n_seeds)."""
+    order, counts = _pickable(returns)
+    days = np.flatnonzero(counts > 0)
+    rng = np.random.default_rng(np.random.SeedSequence([seed, block]))
+    u = rng.random((n_seeds, len(days)))
+    picks = order[days[None, :], (u * counts[days]).astype(int)]  # (S, days)
+    # every hold sees the same picks, so the windows are compared like for like
+    picked = returns[:, days[None, :], picks]  # (H, S, days)
+    return POSITION_DOLLARS * picked.sum(axis=2)
+
+
+_worker_returns: np.ndarray | None = None
+
+
+def _init_worker(returns: np.ndarray):
+    global _worker_returns
+    _worker_returns = returns
+
+
+def _run_block(args: tuple[int, int, int]) -> np.ndarray:
+    n_seeds, block, seed = args
+    return simulate_block(_worker_returns, n_seeds, block, seed)
+
+
+def simulate(
+    returns: np.ndarray,
+    n_seeds: int,
+    seed: int = 0,
+    processes: int | None = None,
+) -> np.ndarray:
+    """P&L per (hold, seed), with blocks of seeds sharded over a process pool."""
+    blocks = [
+        (min(SEED_BLOCK, n_seeds - start), i, seed)
+        for i, start in enumerate(range(0, n_seeds, SEED_BLOCK))
+    ]
+    if processes == 1 or len(blocks) == 1:
+        return np.concatenate([simulate_block(returns, *b) for b in blocks], axis=1)
+    with ProcessPoolExecutor(
+        max_workers=processes or os.cpu_count(),
+        initializer=_init_worker,
+        initargs=(returns,),
+    ) as pool:
+        return np.concatenate(list(pool.map(_run_block, blocks)), axis=1)
+
+
+def summarize(pnl: np.ndarray, holds: list[int], n_trades: int) -> list[dict]:
+    invested = POSITION_DOLLARS * n_trades
+    rows = []
+    for h, seeds in zip(holds, pnl):
+        p5, p50, p95 = np.percentile(seeds, [5, 50, 95])
+        rows.append(
+            {
+                "hold_minutes": h,
+                "mean_pnl": float(seeds.mean()),
+                "p5_pnl": float(p5),
+                "median_pnl": float(p50),
+                "p95_pnl": float(p95),
+                "mean_return_per_trade": float(seeds.mean() / invested)
+                if invested
+                else 0.0,
+                "p_loss": float((seeds < 0).mean()),
+            }
+        )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--bars",
+        default=const.MINUTE_BARS_DIR,
+        help="directory of <SYMBOL>.csv minute bars",
+    )
+    parser.add_argument("--symbols", nargs="+", help="defaults to every file in --bars")
+    parser.add_argument(
+        "--hold", type=int, nargs="+", default=[1, 15, 30, 60, 120, SESSION_MINUTES]
+    )
+    parser.add_argument(
+        "--entry-minute", type=int, default=0, help="minutes after the open"
+    )
+    parser.add_argument("--weekday", type=int, default=2)
+    parser.add_argument("--seeds", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processes", type=int)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    prices = load_session_prices(args.bars, args.symbols, args.weekday)
+    returns = trade_returns(prices, args.hold, args.entry_minute)
+    t1 = time.perf_counter()
+    pnl = simulate(returns, args.seeds, args.seed, args.processes)
+    t2 = time.perf_counter()
+
+    n_trades = int((_pickable(returns)[1] > 0).sum())
+    print(
+        f"{len(prices.symbols)} symbols, {n_trades} trade days, {args.seeds} seeds "
+        f"(load {t1 - t0:.2f}s, simulate {t2 - t1:.2f}s)"
+    )
+    columns = [
+        "hold_minutes",
+        "mean_pnl",
+        "p5_pnl",
+        "median_pnl",
+        "p95_pnl",
+        "mean_return_per_trade",
+        "p_loss",
+    ]
+    print("".join(f"{c:>22}" for c in columns))
+    for row in summarize(pnl, args.hold, n_trades):
+        print(
+            "".join(
+                f"{row[c]:>22.4f}" if isinstance(row[c], float) else f"{row[c]:>22}"
+                for c in columns
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
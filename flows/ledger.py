@@ -0,0 +1,309 @@
+import fcntl
+import os
+import threading
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import UTC, date, datetime
+from typing import TYPE_CHECKING
+
+from flows import const
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+# kind of row
+ORDER = "order"
+FILL = "fill"
+PRICE = "price"
+
+COLUMNS = [
+    ("ts", "timestamp"),
+    ("kind", "string"),
+    ("source", "string"),
+    ("symbol", "string"),
+    ("side", "string"),
+    ("qty", "float64"),
+    ("price", "float64"),
+    ("notional", "float64"),
+    ("order_id", "string"),
+    ("client_order_id", "string"),
+    ("status", "string"),
+    ("account_type", "string"),
+    ("run_id", "string"),
+]
+# a day's partition is rewritten as one file once it has this many
+COMPACT_AFTER_FILES = 16
+
+
+def _schema() -> "pa.Schema":
+    import pyarrow as pa
+
+    types = {
+        "timestamp": pa.timestamp("us", tz="UTC"),
+        "string": pa.string(),
+        "float64": pa.float64(),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in COLUMNS])
+
+
+class TradeLedger:
+    """Append-only record of orders, fills and prices, as Parquet under
+    `root/date=YYYY-MM-DD/`.
+
+    Every append is a new file written next to the others and renamed into
+    place, so a reader never sees half a file and nothing already written is
+    touched. Busy days are folded into a single file by `compact` (a reader
+    listing that day mid-compaction can see its rows twice), under a file
+    lock on the partition so deployments sharing a worker take turns. Reads go
+    through a pyarrow dataset over memory-mapped files, prune partitions by
+    date and can stream record batches instead of loading everything.
+    """
+
+    def __init__(
+        self, root: str = const.LEDGER_DIR, compact_after: int = COMPACT_AFTER_FILES
+    ):
+        self.root = root
+        self.compact_after = compact_after
+        self._lock = threading.Lock()
+
+    def _partition(self, day: date) -> str:
+        return os.path.join(self.root, f"date={day.isoformat()}")
+
+    def _write(self, table: "pa.Table", directory: str, prefix: str) -> str:
+        import pyarrow.parquet as pq
+
+        os.makedirs(directory, exist_ok=True)
+        name = f"{prefix}-{datetime.now(UTC):%H%M%S%f}-{uuid.uuid4().hex[:8]}.parquet"
+        path = os.path.join(directory, name)
+        tmp = os.path.join(directory, f".{os.path.basename(path)}.tmp")
+        pq.write_table(table, tmp)
+        os.replace(tmp, path)
+        return path
+
+    def append(self, rows: list[dict]) -> list[str]:
+        """Write `rows` (missing columns are null), one file per day they fall on."""
+        import pyarrow as pa
+
+        if not rows:
+            return []
+        schema = _schema()
+        by_day: dict[date, list[dict]] = {}
+        for row in rows:
+            row = dict(row)
+            if row.get("ts") is None:
+                row["ts"] = datetime.now(UTC)
+            if isinstance(row["ts"], str):
+                row["ts"] = datetime.fromisoformat(row["ts"])
+            by_day.setdefault(row["ts"].astimezone(UTC).date(), []).append(row)
+        paths = []
+        with self._lock:
+            for day, day_rows in sorted(by_day.items()):
+                table = pa.Table.from_pylist(day_rows, schema=schema)
+                directory = self._partition(day)
+                paths.append(self._write(table, directory, "part"))
+                if len(self._files(directory)) >= self.compact_after:
+                    self._compact_partition(directory)
+        return paths
+
+    def _files(self, directory: str) -> list[str]:
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            os.path.join(directory, f)
+            for f in os.listdir(directory)
+            if f.endswith(".parquet")
+        )
+
+    @contextmanager
+    def _partition_lock(self, directory: str):
+        # self._lock only covers this process; flows running side by side on a
+        # worker each have their own ledger over the same directory
+        fd = os.open(
+            os.path.join(directory, "_compact.lock"), os.O_RDWR | os.O_CREAT, 0o644
+        )
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _compact_partition(self, directory: str) -> bool:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        with self._partition_lock(directory):
+            # listed under the lock, another process may have just compacted
+            files = self._files(directory)
+            if len(files) < 2:
+                return False
+            table = pa.concat_tables([pq.read_table(f, memory_map=True) for f in files])
+            table = table.sort_by("ts")
+            self._write(table, directory, "compacted")
+            for f in files:
+                os.remove(f)
+        return True
+
+    def compact(self, min_files: int = 2) -> int:
+        """Fold every partition with at least `min_files` files into one. Returns partitions compacted."""
+        if not os.path.isdir(self.root):
+            return 0
+        compacted = 0
+        with self._lock:
+            for name in sorted(os.listdir(self.root)):
+                directory = os.path.join(self.root, name)
+                if (
+                    name.startswith("date=")
+                    and len(self._files(directory)) >= min_files
+                ):
+                    compacted += self._compact_partition(directory)
+        return compacted
+
+    def dataset(self) -> "ds.Dataset":
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        from pyarrow.fs import LocalFileSystem
+
+        return ds.dataset(
+            self.root,
+            format="parquet",
+            schema=_schema().append(pa.field("date", pa.string())),
+            partitioning=ds.partitioning(
+                pa.schema([("date", pa.string())]), flavor="hive"
+            ),
+            filesystem=LocalFileSystem(use_mmap=True),
+            # files still being written start with a dot
+            ignore_prefixes=[".", "_"],
+        )
+
+    def _filter(
+        self,
+        start: date | None,
+        end: date | None,
+        symbols: list[str] | None,
+        kind: str | None,
+    ):
+        import pyarrow.dataset as ds
+
+        conditions = []
+        # the partition column is the ISO date, so string comparison prunes whole days
+        if start is not None:
+            conditions.append(ds.field("date") >= start.isoformat())
+        if end is not None:
+            conditions.append(ds.field("date") <= end.isoformat())
+        if symbols:
+            conditions.append(ds.field("symbol").isin(symbols))
+        if kind:
+            conditions.append(ds.field("kind") == kind)
+        expression = None
+        for c in conditions:
+            expression = c if expression is None else expression & c
+        return expression
+
+    def batches(
+        self,
+        start: date | None = None,
+        end: date | None = None,
+        columns: list[str] | None = None,
+        symbols: list[str] | None = None,
+        kind: str | None = None,
+    ) -> Iterator["pa.RecordBatch"]:
+        if not os.path.isdir(self.root):
+            return iter(())
+        return self.dataset().to_batches(
+            columns=columns, filter=self._filter(start, end, symbols, kind)
+        )
+
+    def read(
+        self,
+        start: date | None = None,
+        end: date | None = None,
+        columns: list[str] | None = None,
+        symbols: list[str] | None = None,
+        kind: str | None = None,
+    ) -> "pa.Table":
+        if not os.path.isdir(self.root):
+            return _schema().empty_table()
+        return self.dataset().to_table(
+            columns=columns, filter=self._filter(start, end, symbols, kind)
+        )
+
+
+def order_rows(
+    orders: list, kind: str, source: str, account_type: str, run_id: str | None = None
+) -> list[dict]:
+    """Ledger rows for alpaca orders (models or their json dicts).
+
+    A fill row uses the fill time, quantity and average price; an order row
+    the submission.
+    """
+    rows = []
+    for order in orders:
+        o = order if isinstance(order, dict) else order.model_dump(mode="json")
+        if kind == FILL:
+            ts, qty, price = (
+                o.get("filled_at"),
+                o.get("filled_qty"),
+                o.get("filled_avg_price"),
+            )
+        else:
+            ts, qty, price = o.get("submitted_at"), o.get("qty"), o.get("limit_price")
+        qty = float(qty) if qty is not None else None
+        price = float(price) if price is not None else None
+        rows.append(
+            {
+                "ts": ts or datetime.now(UTC),
+                "kind": kind,
+                "source": source,
+                "symbol": o.get("symbol"),
+                "side": o.get("side"),
+                "qty": qty,
+                "price": price,
+                "notional": qty * price
+                if qty is not None and price is not None
+                else None,
+                "order_id": str(o["id"]) if o.get("id") else None,
+                "client_order_id": o.get("client_order_id"),
+                "status": o.get("status"),
+                "account_type": str(account_type),
+                "run_id": run_id,
+            }
+        )
+    return rows
+
+
+def price_row(
+    symbol: str, price: float, source: str, run_id: str | None = None
+) -> dict:
+    return {
+        "kind": PRICE,
+        "source": source,
+        "symbol": symbol,
+        "price": float(price),
+        "run_id": run_id,
+    }
+
+
+_ledger: TradeLedger | None = None
+
+
+def get_ledger() -> TradeLedger:
+    global _ledger
+    if _ledger is None:
+        _ledger = TradeLedger()
+    return _ledger
+
+
+def record(rows: list[dict]):
+    """Append to the process ledger. Never raises, the trade already happened."""
+    try:
+        from prefect.runtime import flow_run
+
+        run_id = flow_run.id
+        for row in rows:
+            if row.get("run_id") is None:
+                row["run_id"] = run_id
+        get_ledger().append(rows)
+    except Exception as e:
+        print(f"couldn't write {len(rows)} rows to the ledger: {e}")
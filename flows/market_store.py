@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+
+from flows import const
+from flows.finnhub_client import get_finnhub_fetcher
+
+DAY = 24 * 60 * 60
+
+# how long a stored response is good for, per finnhub endpoint
+TTL_SECONDS = {
+    "quote": 60,
+    "company_profile2": 30 * DAY,
+    "company_basic_financials": DAY,
+    "recommendation_trends": 7 * DAY,
+    # for insider transactions this is the time between incremental syncs
+    "stock_insider_transactions": DAY,
+}
+
+# form 4s can be filed a few days after the transaction, so re-read a bit of
+# history on every sync instead of starting exactly at the last stored date
+INSIDER_SYNC_OVERLAP = timedelta(days=7)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    symbol TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (symbol, endpoint)
+);
+CREATE TABLE IF NOT EXISTS insider_transactions (
+    symbol TEXT NOT NULL,
+    row_hash TEXT NOT NULL,
+    transaction_date TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (symbol, row_hash)
+);
+CREATE INDEX IF NOT EXISTS insider_by_date
+    ON insider_transactions (symbol, transaction_date);
+CREATE TABLE IF NOT EXISTS sync_state (
+    symbol TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (symbol, endpoint)
+);
+"""
+
+
+class MarketStore:
+    """On-disk cache of finnhub responses keyed by symbol and endpoint.
+
+    With `offline=True` nothing is ever fetched and whatever is stored is
+    served regardless of age, which lets a run be replayed without network;
+    `get(..., max_age=)` still holds a read to an age limit.
+    """
+
+    def __init__(self, path: str = const.MARKET_STORE_FILE, offline: bool = False):
+        self.path = path
+        self.offline = offline
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _fresh(self, fetched_at: float, endpoint: str) -> bool:
+        return self.offline or time.time() - fetched_at < TTL_SECONDS.get(endpoint, DAY)
+
+    def get(self, symbol: str, endpoint: str, max_age: float | None = None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fetched_at, payload FROM snapshots WHERE symbol=? AND endpoint=?",
+                (symbol, endpoint),
+            ).fetchone()
+        if row is None or not self._fresh(row[0], endpoint):
+            return None
+        if max_age is not None and time.time() - row[0] >= max_age:
+            return None
+        return json.loads(row[1])
+
+    def put(self, symbol: str, endpoint: str, payload):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)",
+                (symbol, endpoint, time.time(), json.dumps(payload)),
+            )
+
+    def needs_sync(self, symbol: str, endpoint: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT synced_at FROM sync_state WHERE symbol=? AND endpoint=?",
+                (symbol, endpoint),
+            ).fetchone()
+        return row is None or not self._fresh(row[0], endpoint)
+
+    def last_insider_date(self, symbol: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(transaction_date) FROM insider_transactions WHERE symbol=?",
+                (symbol,),
+            ).fetchone()
+        return row[0]
+
+    def add_insider_transactions(self, symbol: str, transactions: list[dict]) -> int:
+        rows = []
+        for t in transactions:
+            payload = json.dumps(t, sort_keys=True)
+            row_hash = hashlib.sha1(payload.encode()).hexdigest()
+            rows.append((symbol, row_hash, t.get("transactionDate") or "", payload))
+        with self._lock, self._conn:
+            inserted = self._conn.executemany(
+                "INSERT OR IGNORE INTO insider_transactions VALUES (?, ?, ?, ?)", rows
+            ).rowcount
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)",
+                (symbol, "stock_insider_transactions", time.time()),
+            )
+        return inserted
+
+    def insider_transactions(self, symbol: str, _from: str, to: str) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT payload FROM insider_transactions
+                WHERE symbol=? AND transaction_date BETWEEN ? AND ?
+                ORDER BY transaction_date""",
+                (symbol, _from, to),
+            ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+
+def insider_sync_start(last_date: str | None, _from: str) -> str:
+    if last_date is None:
+        return _from
+    start = date.fromisoformat(last_date) - INSIDER_SYNC_OVERLAP
+    return max(start.isoformat(), _from)
+
+
+def get_symbol_data(symbol: str, _from: str, to: str, store: MarketStore) -> dict:
+    """Finnhub data for a symbol, reading through the store.
+
+    Only stale endpoints are fetched (concurrently, through the shared
+    fetcher) and insider transactions are synced from the last stored date.
+    Returns the same shape as the raw endpoints so callers don't care where
+    it came from.
+    """
+    endpoints = {
+        "quote": ("quote", {"symbol": symbol}),
+        "profile": ("company_profile2", {"symbol": symbol}),
+        "basic_financials": (
+            "company_basic_financials",
+            {"symbol": symbol, "metric": "all"},
+        ),
+        "recommendation_trends": ("recommendation_trends", {"symbol": symbol}),
+    }
+    results = {}
+    to_fetch = {}
+    for name, (endpoint, params) in endpoints.items():
+        cached = store.get(symbol, endpoint)
+        if cached is not None:
+            results[name] = cached
+        else:
+            to_fetch[name] = (endpoint, params)
+
+    if not store.offline and store.needs_sync(symbol, "stock_insider_transactions"):
+        sync_from = insider_sync_start(store.last_insider_date(symbol), _from)
+        to_fetch["insider_info"] = (
+            "stock_insider_transactions",
+            {"symbol": symbol, "_from": sync_from, "to": to},
+        )
+
+    if to_fetch:
+        if store.offline:
+            raise KeyError(
+                f"{symbol} has nothing stored for {sorted(to_fetch)} and the store is offline"
+            )
+        fetched = get_finnhub_fetcher().fetch_many(to_fetch)
+        for name, payload in fetched.items():
+            endpoint = to_fetch[name][0]
+            if endpoint == "stock_insider_transactions":
+                store.add_insider_transactions(symbol, payload.get("data") or [])
+            else:
+                store.put(symbol, endpoint, payload)
+                results[name] = payload
+
+    results["insider_info"] = {
+        "data": store.insider_transactions(symbol, _from, to),
+        "symbol": symbol,
+    }
+    return results
@@ -0,0 +1,278 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import wait as wait_futures
+from dataclasses import dataclass, field
+
+from flows.const import Provider
+from flows.utils import api_metrics
+
+SLACK_CREDENTIALS_BLOCK = "slackbot-cred"
+# sends waiting to go out; enqueueing blocks once it's full
+MAX_QUEUE = 100
+# slack rejects a message with more blocks than this
+MAX_BLOCKS = 50
+
+
+@dataclass
+class _Send:
+    method: str  # "message" or "file"
+    channel: str
+    kwargs: dict
+    future: Future = field(default_factory=Future)
+    queued_at: float = field(default_factory=time.perf_counter)
+    # sent from the dispatcher thread, so the runs are taken when it's queued
+    runs: tuple[str, ...] = field(default_factory=api_metrics.current_runs)
+
+
+class SlackDispatcher:
+    """Sends slack messages and file uploads from a background event loop.
+
+    One `AsyncWebClient` (one aiohttp session) serves the whole process.
+    `post_message` and `upload_file` return futures right away, so a flow
+    can put out a message and its chart together and wait once. Messages to
+    the same channel that are waiting at the same time go out as one post. A
+    429 pauses every send for the `Retry-After` slack asks for and then tries
+    again. Latency of each send is printed and kept in `latencies`.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        base_url: str | None = None,
+        max_queue: int = MAX_QUEUE,
+        max_concurrency: int = 4,
+        attempts: int = 5,
+        batch: bool = True,
+        linger: float = 0.05,
+    ):
+        self._token = token
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.attempts = attempts
+        self.batch = batch
+        self.linger = linger
+        self.latencies: list[dict] = []
+        self.rate_limited = 0
+        self._loop = asyncio.new_event_loop()
+        self._queue: asyncio.Queue[_Send] = asyncio.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="slack-dispatcher", daemon=True
+        )
+        self._resume_at = 0.0
+        self._started = threading.Lock()
+
+    def start(self) -> "SlackDispatcher":
+        with self._started:
+            if not self._thread.is_alive():
+                self._thread.start()
+                asyncio.run_coroutine_threadsafe(self._run(), self._loop)
+        return self
+
+    def close(self):
+        if not self._thread.is_alive():
+            return
+
+        async def _shutdown():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(_shutdown(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _enqueue(self, send: _Send) -> Future:
+        self.start()
+        # waits here while the queue is full
+        asyncio.run_coroutine_threadsafe(self._queue.put(send), self._loop).result()
+        return send.future
+
+    def post_message(
+        self, channel: str, blocks: list[dict] | None = None, text: str | None = None
+    ) -> Future:
+        return self._enqueue(
+            _Send("message", channel, {"blocks": blocks, "text": text})
+        )
+
+    def upload_file(
+        self,
+        channel: str,
+        file: str | bytes,
+        title: str | None = None,
+        filename: str | None = None,
+    ) -> Future:
+        """`channel` is the channel id here, slack's upload API doesn't take names."""
+        return self._enqueue(
+            _Send("file", channel, {"file": file, "title": title, "filename": filename})
+        )
+
+    def wait(self, futures: list[Future], timeout: float | None = 120) -> list[dict]:
+        _, pending = wait_futures(futures, timeout=timeout)
+        if pending:
+            raise TimeoutError(
+                f"{len(pending)} slack sends still queued after {timeout}s"
+            )
+        return [f.result() for f in futures]
+
+    def _batches(self, sends: list[_Send]) -> list[list[_Send]]:
+        batches: list[list[_Send]] = []
+        open_batch: dict[str, list[_Send]] = {}
+        for send in sends:
+            mergeable = (
+                self.batch and send.method == "message" and send.kwargs["blocks"]
+            )
+            current = open_batch.get(send.channel) if mergeable else None
+            if current is not None:
+                # a divider goes between merged messages
+                size = sum(len(s.kwargs["blocks"]) + 1 for s in current) + len(
+                    send.kwargs["blocks"]
+                )
+                if size <= MAX_BLOCKS:
+                    current.append(send)
+                    continue
+            batches.append([send])
+            if mergeable:
+                open_batch[send.channel] = batches[-1]
+        return batches
+
+    async def _run(self):
+        from slack_sdk.web.async_client import AsyncWebClient
+
+        kwargs = {"base_url": self.base_url} if self.base_url else {}
+        client = AsyncWebClient(token=self._token, **kwargs)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks = set()
+        while True:
+            sends = [await self._queue.get()]
+            # give whatever else the run queues right after a chance to join
+            await asyncio.sleep(self.linger)
+            while not self._queue.empty():
+                sends.append(self._queue.get_nowait())
+            for batch in self._batches(sends):
+                task = asyncio.create_task(self._send(client, batch, semaphore))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+    async def _call(self, fn, **kwargs):
+        from slack_sdk.errors import SlackApiError
+
+        for attempt in range(self.attempts):
+            wait = self._resume_at - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                return await fn(**kwargs), attempt
+            except SlackApiError as e:
+                if e.response.status_code != 429 or attempt == self.attempts - 1:
+                    raise
+                headers = {k.lower(): v for k, v in (e.response.headers or {}).items()}
+                delay = float(headers.get("retry-after", 1))
+                self.rate_limited += 1
+                # slack limits per method and workspace, so everyone backs off
+                self._resume_at = max(self._resume_at, time.monotonic() + delay)
+
+    async def _send(self, client, batch: list[_Send], semaphore: asyncio.Semaphore):
+        first = batch[0]
+        runs = tuple(dict.fromkeys(r for send in batch for r in send.runs))
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                if first.method == "file":
+                    endpoint = "files_upload_v2"
+                    file = first.kwargs["file"]
+                    sent = len(file) if isinstance(file, bytes) else 0
+                    response, retries = await self._call(
+                        client.files_upload_v2, channel=first.channel, **first.kwargs
+                    )
+                else:
+                    endpoint = "chat.postMessage"
+                    blocks = []
+                    for send in batch:
+                        if blocks:
+                            blocks.append({"type": "divider"})
+                        blocks += send.kwargs["blocks"] or []
+                    text = (
+                        "\n".join(s.kwargs["text"] for s in batch if s.kwargs["text"])
+                        or None
+                    )
+                    sent = len(json.dumps(blocks)) + len(text or "")
+                    response, retries = await self._call(
+                        client.chat_postMessage,
+                        channel=first.channel,
+                        blocks=blocks or None,
+                        text=text,
+                    )
+            except Exception as e:
+                status = (
+                    getattr(getattr(e, "response", None), "status_code", None)
+                    or type(e).__name__
+                )
+                api_metrics.metrics.observe(
+                    Provider.SLACK,
+                    endpoint,
+                    status,
+                    time.perf_counter() - started,
+                    runs=runs,
+                )
+                for send in batch:
+                    send.future.set_exception(e)
+                return
+        finished = time.perf_counter()
+        api_metrics.metrics.observe(
+            Provider.SLACK,
+            endpoint,
+            response.status_code,
+            finished - started,
+            sent=sent,
+            retries=retries,
+            runs=runs,
+        )
+        latency = {
+            "method": first.method,
+            "channel": first.channel,
+            "messages": len(batch),
+            "queued_s": started - min(s.queued_at for s in batch),
+            "send_s": finished - started,
+            "retries": retries,
+        }
+        self.latencies.append(latency)
+        print(
+            f"slack {first.method} to {first.channel}: {len(batch)} queued, "
+            f"{latency['send_s']:.2f}s (waited {latency['queued_s']:.2f}s, {retries} retries)"
+        )
+        for send in batch:
+            send.future.set_result(response.data)
+
+
+_dispatcher: SlackDispatcher | None = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_slack_dispatcher() -> SlackDispatcher:
+    # the credentials block is read once per process
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            from prefect_slack import SlackCredentials
+
+            credentials = SlackCredentials.load(SLACK_CREDENTIALS_BLOCK)
+            _dispatcher = SlackDispatcher(credentials.token.get_secret_value())
+    return _dispatcher.start()
+
+
+def close_slack_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is not None:
+            _dispatcher.close()
+            _dispatcher = None
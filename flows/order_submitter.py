@@ -0,0 +1,167 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from pydantic import BaseModel
+
+from flows.alpaca_client import get_client
+from flows.const import AccountType
+from flows.utils import api_metrics
+from flows.utils.rate_limit import TokenBucket
+
+if TYPE_CHECKING:
+    from alpaca.trading.client import TradingClient
+    from alpaca.trading.requests import OrderRequest
+
+# alpaca allows 200 requests a minute per account, keep some for everything else
+ORDERS_PER_MINUTE = 150
+ORDER_BURST = 10
+
+
+class OrderResult(BaseModel):
+    symbol: str
+    side: str
+    qty: float | None = None
+    client_order_id: str
+    status: str  # "submitted", "existing" (accepted on an earlier try) or "failed"
+    order: dict | None = None
+    latency_ms: float = 0.0
+    error: str | None = None
+
+
+def client_order_id(run_key: str, symbol: str, side: str, occurrence: int = 0) -> str:
+    """Same run, symbol and side always give the same id.
+
+    The quantity is left out on purpose: a retried run recomputes it from
+    fresh prices and it shouldn't turn into a second order.
+    """
+    digest = hashlib.sha256(
+        f"{run_key}|{symbol}|{side}|{occurrence}".encode()
+    ).hexdigest()
+    return f"hdt-{digest[:32]}"
+
+
+class BatchOrderSubmitter:
+    """Submits a batch of orders concurrently under a shared rate limit.
+
+    Sells go out (and are all accepted) before any buy, and every order gets
+    a deterministic `client_order_id`, so submitting the same batch again
+    (say from a task retry) picks up orders the broker already has instead
+    of placing them twice.
+    """
+
+    def __init__(
+        self,
+        client: "TradingClient",
+        limiter: TokenBucket | None = None,
+        max_workers: int = 8,
+    ):
+        self.client = client
+        self.limiter = limiter or TokenBucket(
+            ORDERS_PER_MINUTE, per=60, burst=ORDER_BURST
+        )
+        self.max_workers = max_workers
+
+    def _submit_one(self, order_data: "OrderRequest") -> OrderResult:
+        side = str(getattr(order_data.side, "value", order_data.side))
+        result = OrderResult(
+            symbol=order_data.symbol,
+            side=side,
+            qty=order_data.qty,
+            client_order_id=order_data.client_order_id,
+            status="submitted",
+        )
+        self.limiter.acquire()
+        started = time.perf_counter()
+        try:
+            order = self.client.submit_order(order_data=order_data)
+        except Exception as e:
+            # a duplicate client_order_id is rejected, and a timeout may still
+            # have gone through, either way the broker knows better than us
+            try:
+                self.limiter.acquire()
+                order = self.client.get_order_by_client_id(order_data.client_order_id)
+                result.status = "existing"
+            except Exception:
+                result.status = "failed"
+                result.error = str(e)
+                order = None
+        result.latency_ms = (time.perf_counter() - started) * 1000
+        if order is not None:
+            result.order = (
+                order if isinstance(order, dict) else order.model_dump(mode="json")
+            )
+        return result
+
+    def submit(
+        self, order_datas: "list[OrderRequest]", run_key: str
+    ) -> list[OrderResult]:
+        seen = Counter()
+        tagged = []
+        for order_data in order_datas:
+            side = str(getattr(order_data.side, "value", order_data.side))
+            occurrence = seen[(order_data.symbol, side)]
+            seen[(order_data.symbol, side)] += 1
+            coid = client_order_id(run_key, order_data.symbol, side, occurrence)
+            tagged.append(order_data.model_copy(update={"client_order_id": coid}))
+
+        is_sell = [str(getattr(o.side, "value", o.side)) == "sell" for o in tagged]
+        sells = [i for i, sell in enumerate(is_sell) if sell]
+        buys = [i for i, sell in enumerate(is_sell) if not sell]
+        results: list[OrderResult | None] = [None] * len(tagged)
+        with ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="orders"
+        ) as pool:
+            for batch in (sells, buys):
+                for i, result in zip(
+                    batch,
+                    pool.map(
+                        api_metrics.carry(self._submit_one), [tagged[i] for i in batch]
+                    ),
+                ):
+                    results[i] = result
+        # same order as `order_datas`
+        return results
+
+
+def summarize(results: list[OrderResult]) -> str:
+    lines = [f"{'symbol':<8}{'side':<6}{'qty':>10}  {'status':<10}{'ms':>8}"]
+    for r in results:
+        qty = "" if r.qty is None else f"{r.qty:g}"
+        lines.append(
+            f"{r.symbol:<8}{r.side:<6}{qty:>10}  {r.status:<10}{r.latency_ms:>8.0f}"
+        )
+        if r.error:
+            lines.append(f"    {r.error}")
+    if results:
+        latencies = sorted(r.latency_ms for r in results)
+        counts = Counter(r.status for r in results)
+        lines.append(
+            f"{len(results)} orders {dict(counts)}, "
+            f"p50 {latencies[len(latencies) // 2]:.0f} ms, max {latencies[-1]:.0f} ms"
+        )
+    return "\n".join(lines)
+
+
+_limiters: dict[AccountType, TokenBucket] = {}
+_limiters_lock = threading.Lock()
+
+
+def submit_orders(
+    order_datas: "list[OrderRequest]",
+    run_key: str,
+    account_type: AccountType = AccountType.PAPER,
+) -> list[OrderResult]:
+    # the quota is per account, so every batch in the process shares a bucket
+    with _limiters_lock:
+        if account_type not in _limiters:
+            _limiters[account_type] = TokenBucket(
+                ORDERS_PER_MINUTE, per=60, burst=ORDER_BURST
+            )
+    submitter = BatchOrderSubmitter(
+        get_client(account_type), limiter=_limiters[account_type]
+    )
+    return submitter.submit(order_datas, run_key)
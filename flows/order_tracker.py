@@ -0,0 +1,314 @@
+import asyncio
+import json
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future
+from concurrent.futures import wait as wait_futures
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING
+
+from flows import const
+from flows.alpaca_client import get_account_creds, get_client
+from flows.const import AccountType
+
+if TYPE_CHECKING:
+    from alpaca.trading.models import Order
+
+# once an order is in one of these it won't change any more
+TERMINAL_STATUSES = {
+    "filled",
+    "canceled",
+    "expired",
+    "rejected",
+    "replaced",
+    "done_for_day",
+}
+
+
+def fetch_orders(
+    account_type: AccountType, symbols: list[str], after: datetime
+) -> list[dict]:
+    """Every order (open or closed) for `symbols` submitted after `after`, in one call."""
+    from alpaca.trading.enums import QueryOrderStatus
+    from alpaca.trading.requests import GetOrdersRequest
+
+    request = GetOrdersRequest(
+        status=QueryOrderStatus.ALL, symbols=symbols, after=after, limit=500
+    )
+    return [
+        o.model_dump(mode="json") for o in get_client(account_type).get_orders(request)
+    ]
+
+
+def _as_dict(order: "Order | dict") -> dict:
+    return order if isinstance(order, dict) else order.model_dump(mode="json")
+
+
+class OrderTracker:
+    """Futures that resolve when orders reach a terminal state.
+
+    One websocket to the broker's trade_updates stream serves every order in
+    the run. When the stream can't be reached (or drops for good) it falls
+    back to one `get_orders` call per interval covering all pending orders.
+    After any gap in the stream, pending orders are reconciled with a single
+    poll so a fill that happened while we weren't listening isn't missed.
+    """
+
+    def __init__(
+        self,
+        account_type: AccountType = AccountType.PAPER,
+        stream_url: str | None = None,
+        fetch: Callable[[list[str], datetime], list[dict]] | None = None,
+        credentials: dict | None = None,
+        connect_timeout: float = 5.0,
+        reconnect_attempts: int = 3,
+        poll_interval: float = 1.0,
+        max_poll_interval: float = 30.0,
+    ):
+        self.account_type = account_type
+        self.stream_url = stream_url or const.ALPACA_STREAM_URL[account_type]
+        self._fetch = fetch or (
+            lambda symbols, after: fetch_orders(account_type, symbols, after)
+        )
+        self._credentials = credentials
+        self.connect_timeout = connect_timeout
+        self.reconnect_attempts = reconnect_attempts
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+
+        self.mode = "starting"  # then "stream" or "poll"
+        self.connections = 0
+        self.events = 0
+        self.polls = 0
+        self._pending: dict[str, tuple[dict, Future, float]] = {}
+        # terminal updates seen on the stream, tracked or not yet
+        self._done: dict[str, dict] = {}
+        self.latencies: dict[str, float] = {}
+        self._connected_at: datetime | None = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="order-tracker", daemon=True
+        )
+        self._wake: asyncio.Event | None = None
+
+    def start(self) -> "OrderTracker":
+        if not self._thread.is_alive():
+            self._thread.start()
+            asyncio.run_coroutine_threadsafe(self._run(), self._loop)
+            self._ready.wait(self.connect_timeout * (self.reconnect_attempts + 1))
+        return self
+
+    def close(self):
+        if not self._thread.is_alive():
+            return
+
+        async def _shutdown():
+            # let the websocket close cleanly before the loop goes away
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(_shutdown(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def track(self, orders: "list[Order | dict]") -> dict[str, Future]:
+        self.start()
+        futures = {}
+        needs_check = False
+        with self._lock:
+            for order in map(_as_dict, orders):
+                order_id = str(order["id"])
+                if order_id in self._pending:
+                    futures[order_id] = self._pending[order_id][1]
+                    continue
+                future = Future()
+                futures[order_id] = future
+                done = self._done.get(order_id)
+                if done is None and order.get("status") in TERMINAL_STATUSES:
+                    done = order
+                if done is not None:
+                    future.set_result(done)
+                    self.latencies[order_id] = 0.0
+                    continue
+                self._pending[order_id] = (order, future, time.perf_counter())
+                # submitted before we were listening, the stream may have missed it
+                submitted = order.get("submitted_at")
+                if (
+                    self.mode != "stream"
+                    or submitted is None
+                    or self._connected_at is None
+                ) or datetime.fromisoformat(submitted) < self._connected_at:
+                    needs_check = True
+        if needs_check and self.mode == "stream":
+            asyncio.run_coroutine_threadsafe(self._reconcile(), self._loop)
+        if self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+        return futures
+
+    def wait(
+        self, orders: "list[Order | dict]", timeout: float | None = None
+    ) -> list[dict]:
+        """Block until every order is done and return their final state, in order."""
+        futures = self.track(orders)
+        started = time.perf_counter()
+        _, not_done = wait_futures(futures.values(), timeout=timeout)
+        if not_done:
+            pending = [i for i, f in futures.items() if f in not_done]
+            raise TimeoutError(
+                f"{len(pending)} orders still open after {timeout}s: {pending}"
+            )
+        print(
+            f"{len(futures)} orders done in {time.perf_counter() - started:.2f}s via {self.mode} "
+            f"(events={self.events}, polls={self.polls}, connections={self.connections})"
+        )
+        return [f.result() for f in futures.values()]
+
+    def _resolve(self, order: dict):
+        if order.get("status") not in TERMINAL_STATUSES:
+            return
+        order_id = str(order["id"])
+        with self._lock:
+            self._done[order_id] = order
+            tracked = self._pending.pop(order_id, None)
+        if tracked is not None:
+            self.latencies[order_id] = time.perf_counter() - tracked[2]
+            tracked[1].set_result(order)
+
+    async def _reconcile(self):
+        with self._lock:
+            pending = [order for order, _, _ in self._pending.values()]
+        if not pending:
+            return
+        symbols = sorted({o["symbol"] for o in pending})
+        submitted = [
+            datetime.fromisoformat(o["submitted_at"])
+            for o in pending
+            if o.get("submitted_at")
+        ]
+        if submitted:
+            after = min(submitted) - timedelta(seconds=1)
+        else:
+            after = datetime.now().astimezone() - timedelta(days=1)
+        self.polls += 1
+        try:
+            orders = await asyncio.to_thread(self._fetch, symbols, after)
+        except Exception as e:
+            print(f"order poll failed: {e}")
+            return
+        for order in orders:
+            self._resolve(order)
+
+    async def _run(self):
+        self._wake = asyncio.Event()
+        failures = 0
+        while failures <= self.reconnect_attempts:
+            try:
+                await self._stream()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"trade updates stream unavailable ({type(e).__name__}: {e})")
+            if self.mode == "stream":
+                # we were listening until now, so it's a fresh start
+                failures = 0
+                self.mode = "reconnecting"
+            else:
+                failures += 1
+            if failures <= self.reconnect_attempts:
+                await asyncio.sleep(min(0.5 * 2**failures, 5))
+        self.mode = "poll"
+        self._ready.set()
+        await self._poll_forever()
+
+    async def _stream(self):
+        from websockets.asyncio.client import connect
+
+        creds = self._credentials or get_account_creds(self.account_type)
+        async with connect(
+            self.stream_url, open_timeout=self.connect_timeout, ping_interval=10
+        ) as ws:
+            self.connections += 1
+            await ws.send(
+                json.dumps(
+                    {
+                        "action": "authenticate",
+                        "data": {
+                            "key_id": creds["api_key"],
+                            "secret_key": creds["api_secret"],
+                        },
+                    }
+                )
+            )
+            reply = json.loads(await asyncio.wait_for(ws.recv(), self.connect_timeout))
+            if reply.get("data", {}).get("status") != "authorized":
+                raise PermissionError(f"trade updates auth failed: {reply}")
+            await ws.send(
+                json.dumps({"action": "listen", "data": {"streams": ["trade_updates"]}})
+            )
+            await asyncio.wait_for(ws.recv(), self.connect_timeout)
+
+            self._connected_at = datetime.now().astimezone()
+            self.mode = "stream"
+            self._ready.set()
+            # anything that finished while we weren't listening
+            await self._reconcile()
+            async for message in ws:
+                msg = json.loads(message)
+                if msg.get("stream") == "trade_updates":
+                    self.events += 1
+                    self._resolve(msg["data"]["order"])
+
+    def _pending_count(self) -> int:
+        # track() and _resolve() change _pending from other threads
+        with self._lock:
+            return len(self._pending)
+
+    async def _poll_forever(self):
+        interval = self.poll_interval
+        while True:
+            if not self._pending_count():
+                self._wake.clear()
+                await self._wake.wait()
+                interval = self.poll_interval
+            before = self._pending_count()
+            await self._reconcile()
+            if self._pending_count() < before:
+                interval = self.poll_interval
+            else:
+                interval = min(interval * 1.5, self.max_poll_interval)
+            try:
+                # newly tracked orders get checked right away
+                self._wake.clear()
+                await asyncio.wait_for(self._wake.wait(), interval)
+            except TimeoutError:
+                pass
+
+
+_trackers: dict[AccountType, OrderTracker] = {}
+_trackers_lock = threading.Lock()
+
+
+def get_order_tracker(account_type: AccountType = AccountType.PAPER) -> OrderTracker:
+    # one stream connection per account for the whole process
+    with _trackers_lock:
+        if account_type not in _trackers:
+            _trackers[account_type] = OrderTracker(account_type)
+    return _trackers[account_type].start()
+
+
+def close_order_trackers():
+    with _trackers_lock:
+        for tracker in _trackers.values():
+            tracker.close()
+        _trackers.clear()
@@ -0,0 +1,317 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import deque
+
+import numpy as np
+
+from flows import const
+from flows.alpaca_client import AccountType, get_client
+
+ACTIVITIES_PAGE_SIZE = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fills (
+    account_type TEXT NOT NULL,
+    id TEXT NOT NULL,
+    transaction_time TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    side TEXT NOT NULL,
+    qty REAL NOT NULL,
+    price REAL NOT NULL,
+    order_id TEXT,
+    PRIMARY KEY (account_type, id)
+);
+CREATE TABLE IF NOT EXISTS trades (
+    account_type TEXT NOT NULL,
+    order_id TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    closed_at TEXT NOT NULL,
+    qty REAL NOT NULL,
+    cost REAL NOT NULL,
+    proceeds REAL NOT NULL,
+    PRIMARY KEY (account_type, order_id)
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    account_type TEXT PRIMARY KEY,
+    state TEXT NOT NULL
+);
+"""
+
+
+def fetch_fill_activities(
+    account_type: AccountType,
+    after_id: str | None = None,
+    page_size: int = ACTIVITIES_PAGE_SIZE,
+    client=None,
+) -> list[dict]:
+    """Every FILL activity after `after_id`, oldest first.
+
+    Activity ids sort by time, so paging ascending with the last id as the
+    page token picks up exactly where the previous page (or sync) stopped.
+    """
+    client = client or get_client(account_type)
+    fills = []
+    page_token = after_id
+    while True:
+        params = {"direction": "asc", "page_size": page_size}
+        if page_token:
+            params["page_token"] = page_token
+        page = client.get("/account/activities/FILL", params) or []
+        fills.extend(page)
+        if len(page) < page_size:
+            return fills
+        page_token = page[-1]["id"]
+
+
+def _empty_state() -> dict:
+    return {
+        "last_fill_id": None,
+        # open FIFO lots per symbol, [qty, price]
+        "lots": {},
+        "trades": 0,
+        "wins": 0,
+        "realized_pnl": 0.0,
+        # account equity before the first trade we matched, and the high-water
+        # mark of that plus the realized P&L
+        "base_equity": None,
+        "peak_equity": None,
+        "max_drawdown": 0.0,
+        "unmatched_qty": 0.0,
+    }
+
+
+class PerformanceStore:
+    """Fills pulled from the account activities API and the realized trades
+    built from them, kept in sqlite next to the market store.
+
+    `update` only asks the broker for fills after the newest one stored and
+    only runs the new ones through the FIFO lot matching, carrying open lots
+    and running totals over in a per-account checkpoint. A trade is one sell
+    order; fills of an order that arrive over several updates are added to
+    its row. Returns are realized P&L over account equity, not compounded
+    per trade, since a trade only ever used part of the account. This is the
+    broker's view of what was filled, the ledger is what our own flows saw.
+    """
+
+    def __init__(self, path: str = const.PERFORMANCE_FILE):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def state(self, account_type: AccountType) -> dict:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM checkpoints WHERE account_type=?",
+                (str(account_type),),
+            ).fetchone()
+        # checkpoints from before a field was added pick up its default
+        return {**_empty_state(), **json.loads(row[0])} if row else _empty_state()
+
+    def last_fill_id(self, account_type: AccountType) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(id) FROM fills WHERE account_type=?", (str(account_type),)
+            ).fetchone()
+        return row[0]
+
+    def add_fills(self, account_type: AccountType, activities: list[dict]) -> int:
+        rows = [
+            (
+                str(account_type),
+                a["id"],
+                a["transaction_time"],
+                a["symbol"],
+                # sell_short closes nothing, it's counted like any other sell
+                "buy" if a["side"] == "buy" else "sell",
+                float(a["qty"]),
+                float(a["price"]),
+                a.get("order_id"),
+            )
+            for a in activities
+        ]
+        with self._lock, self._conn:
+            return self._conn.executemany(
+                "INSERT OR IGNORE INTO fills VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            ).rowcount
+
+    def sync(self, account_type: AccountType, client=None) -> int:
+        activities = fetch_fill_activities(
+            account_type, self.last_fill_id(account_type), client=client
+        )
+        return self.add_fills(account_type, activities)
+
+    def update(self, account_type: AccountType, equity: float | None = None) -> dict:
+        """Match the fills stored since the last checkpoint and move it forward.
+
+        `equity` is the account's current equity, needed the first time to
+        set the base returns are measured against. Returns the checkpoint
+        state plus `new_trades`, the trades closed (or added to) by this
+        update.
+        """
+        state = self.state(account_type)
+        with self._lock:
+            fills = self._conn.execute(
+                """SELECT id, transaction_time, symbol, side, qty, price, order_id FROM fills
+                WHERE account_type=? AND id > ? ORDER BY id""",
+                (str(account_type), state["last_fill_id"] or ""),
+            ).fetchall()
+        if not fills:
+            return {**state, "new_trades": 0}
+
+        # the lot matching has to go fill by fill, but only over the new ones
+        lots = {s: deque(book) for s, book in state["lots"].items()}
+        # sell order id -> [symbol, closed_at, qty, cost, proceeds]
+        closed: dict[str, list] = {}
+        for fill_id, ts, symbol, side, qty, price, order_id in fills:
+            book = lots.setdefault(symbol, deque())
+            if side == "buy":
+                book.append([qty, price])
+                continue
+            left, cost = qty, 0.0
+            while left > 1e-9 and book:
+                take = min(left, book[0][0])
+                cost += take * book[0][1]
+                left -= take
+                book[0][0] -= take
+                if book[0][0] <= 1e-9:
+                    book.popleft()
+            # bought before the activity history starts, no cost to match against
+            state["unmatched_qty"] += left
+            matched = qty - left
+            if matched <= 0:
+                continue
+            # partial fills of one order are one trade
+            trade = closed.setdefault(order_id or fill_id, [symbol, ts, 0.0, 0.0, 0.0])
+            trade[1] = ts
+            trade[2] += matched
+            trade[3] += cost
+            trade[4] += matched * price
+
+        # sells whose earlier fills closed in a previous update carry on that row
+        earlier = {}
+        with self._lock:
+            for order_id in closed:
+                row = self._conn.execute(
+                    "SELECT qty, cost, proceeds FROM trades WHERE account_type=? AND order_id=?",
+                    (str(account_type), order_id),
+                ).fetchone()
+                if row is not None:
+                    earlier[order_id] = row
+        added_pnl = np.array([t[4] - t[3] for t in closed.values()])
+        was_win = np.array(
+            [o in earlier and earlier[o][2] > earlier[o][1] for o in closed], dtype=bool
+        )
+        for order_id, (qty, cost, proceeds) in earlier.items():
+            trade = closed[order_id]
+            trade[2] += qty
+            trade[3] += cost
+            trade[4] += proceeds
+        rows = [(str(account_type), order_id, *t) for order_id, t in closed.items()]
+        pnl = np.array([r[6] - r[5] for r in rows])
+        if len(rows):
+            if state["base_equity"] is None:
+                if equity is None:
+                    raise ValueError("the first update needs the account equity")
+                # equity already has these trades' P&L in it
+                state["base_equity"] = state["peak_equity"] = (
+                    equity - state["realized_pnl"] - float(added_pnl.sum())
+                )
+            value = state["base_equity"] + state["realized_pnl"] + np.cumsum(added_pnl)
+            peak = np.maximum(state["peak_equity"], np.maximum.accumulate(value))
+            state["max_drawdown"] = max(
+                state["max_drawdown"], float((1 - value / peak).max())
+            )
+            state["peak_equity"] = float(peak[-1])
+            state["trades"] += len(rows) - len(earlier)
+            state["wins"] += int((pnl > 0).sum()) - int(was_win.sum())
+            state["realized_pnl"] += float(added_pnl.sum())
+        state["lots"] = {
+            s: [list(lot) for lot in book] for s, book in lots.items() if book
+        }
+        state["last_fill_id"] = fills[-1][0]
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO trades VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?)",
+                (str(account_type), json.dumps(state)),
+            )
+        return {**state, "new_trades": len(rows)}
+
+    def trades(
+        self, account_type: AccountType, since: str | None = None
+    ) -> dict[str, np.ndarray]:
+        """Closed trades as columns, optionally only those closed at or after `since` (ISO time)."""
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT symbol, closed_at, qty, cost, proceeds FROM trades
+                WHERE account_type=? AND closed_at >= ? ORDER BY closed_at""",
+                (str(account_type), since or ""),
+            ).fetchall()
+        symbol, closed_at, qty, cost, proceeds = (
+            zip(*rows) if rows else ([], [], [], [], [])
+        )
+        return {
+            "symbol": np.array(symbol, dtype=str),
+            "closed_at": np.array(closed_at, dtype=str),
+            "qty": np.array(qty, dtype=float),
+            "cost": np.array(cost, dtype=float),
+            "pnl": np.array(proceeds, dtype=float) - np.array(cost, dtype=float),
+        }
+
+
+def summarize(state: dict, recent: dict[str, np.ndarray]) -> dict:
+    """Headline numbers from the running checkpoint, and the same for the `recent` trades."""
+    pnl, cost = recent["pnl"], recent["cost"]
+    returns = pnl / cost if len(cost) else pnl
+    base, peak = state["base_equity"], state["peak_equity"]
+    return {
+        "trades": state["trades"],
+        "win_rate": state["wins"] / state["trades"] if state["trades"] else 0.0,
+        "realized_pnl": state["realized_pnl"],
+        "cumulative_return": state["realized_pnl"] / base if base else 0.0,
+        "drawdown": 1 - (base + state["realized_pnl"]) / peak if peak else 0.0,
+        "max_drawdown": state["max_drawdown"],
+        "open_symbols": sorted(state["lots"]),
+        "recent_trades": len(pnl),
+        "recent_pnl": float(pnl.sum()),
+        "recent_win_rate": float((pnl > 0).mean()) if len(pnl) else 0.0,
+        "recent_mean_return": float(returns.mean()) if len(returns) else 0.0,
+    }
+
+
+def update_performance(
+    account_type: AccountType,
+    since: str | None = None,
+    path: str = const.PERFORMANCE_FILE,
+    client=None,
+) -> dict:
+    """Pull new fills, fold them into the checkpoint and summarize."""
+    client = client or get_client(account_type)
+    equity = float(client.get("/account")["equity"])
+    with PerformanceStore(path) as store:
+        new_fills = store.sync(account_type, client=client)
+        state = store.update(account_type, equity)
+        summary = summarize(state, store.trades(account_type, since))
+    print(f"{new_fills} new fills, {state['new_trades']} trades closed")
+    if state["unmatched_qty"]:
+        print(
+            f"{state['unmatched_qty']} shares sold with no recorded buy, left out of the P&L"
+        )
+    return summary
@@ -1,56 +1,61 @@
-import asyncio
 from datetime import datetime, timedelta
 import os
+import time
 
-import finnhub
-import matplotlib
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
-from matplotlib.ticker import FuncFormatter
-import pandas as pd
-from prefect import flow, task
-from prefect_slack import SlackCredentials
-from prefect_slack.messages import send_chat_message
-import seaborn as sns
-
-from flows import env
-from flows import const
+from prefect import flow, task, unmapped
+from prefect.task_runners import ThreadPoolTaskRunner
 
-# non-interactive backend as to not crash the thread
-matplotlib.use("agg")
+from flows import const
+from flows.const import PickMethod
+from flows.market_store import MarketStore, get_symbol_data
+from flows.notifier import get_slack_dispatcher
+from flows.run_state import atomic_write, get_run_state
+from flows.utils import api_metrics
 
+# pandas, matplotlib, slack and the screener (numpy) are imported inside the
+# tasks that use them so that importing the flow (and everything that imports
+# it) stays cheap
 
-def get_wikipedia_nasdaq100() -> pd.DataFrame:
-    url = "https://en.m.wikipedia.org/wiki/Nasdaq-100"
-    return (
-        pd.read_html(url, attrs={"id": "constituents"}, index_col="Symbol")[0]
-        .reset_index()
-        .rename(columns={"Symbol": "Ticker"})
-    )
+PROSPECT_CHART = "prospect_chart.png"
+# get_stock_data calls in flight during a universe scan, they all queue on
+# the same finnhub rate limit so more only adds waiting threads
+UNIVERSE_FETCH_THREADS = 16
 
 
 @task
-def pick_stock(ticker: str | None = None) -> dict:
-    if ticker is None:
-        nasdaq_100 = get_wikipedia_nasdaq100()
+def pick_stock(ticker: str | None = None, pick_method: PickMethod = PickMethod.RANDOM, k: int = 10) -> dict:
+    from flows.constituents import ConstituentIndex
+
+    if ticker is not None:
+        return {"Ticker": ticker}
+    with ConstituentIndex() as index:
+        nasdaq_100 = index.members()
+    if pick_method == PickMethod.RANDOM:
+        return nasdaq_100.sample(n=1).to_dict("records")[0]
+
+    from flows.screener import load_factors, pick, screen
+
+    # ranks whatever is in the store (a universe scan fills it), nothing is fetched
+    with MarketStore(offline=True) as store:
+        factors = load_factors(nasdaq_100["Ticker"].tolist(), store)
+    if factors.empty:
+        print("no recent stored data to screen on, picking at random")
         return nasdaq_100.sample(n=1).to_dict("records")[0]
-    return {"Ticker": ticker}
+    ranked = screen(factors)
+    print(ranked.head(k).to_string())
+    choice = pick(ranked, pick_method, k=k)
+    return nasdaq_100[nasdaq_100["Ticker"] == choice].to_dict("records")[0]
 
 
 @task
 def save_current_stock(stock: dict):
-    def safe_open_w(path):
-        """Open "path" for writing, creating any parent directories as needed."""
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        return open(path, "w+")
-
-    p = os.path.join(os.getcwd(), const.CURRENT_STOCK_FILE)
-    with safe_open_w(p) as f:
-        f.write(stock["Ticker"])
+    get_run_state().put("ticker", stock["Ticker"])
+    # the last pick, for trader/reporter runs started on their own without a ticker
+    atomic_write(os.path.join(os.getcwd(), const.CURRENT_STOCK_FILE), stock["Ticker"].encode())
 
 
 @task
-def get_stock_data(stock: dict) -> dict:
+def get_stock_data(stock: dict, offline: bool = False) -> dict:
     symbol: str = stock["Ticker"]
     today: str = datetime.now().date().strftime("%Y-%m-%d")
     one_year_ago: str = (datetime.now().date() - timedelta(days=3 * 365)).strftime(
@@ -60,34 +65,30 @@ def get_stock_data(stock: dict) -> dict:
     data.update(stock)
     data = {k.lower().replace(" ", "_"): v for k, v in data.items()}
 
-    # use finnhub to collect some data
-    # limit 60 API calls / minute
-    finnhub_client = finnhub.Client(api_key=env.FINNHUB_API_KEY)
-    quote = finnhub_client.quote(symbol=symbol)
-    data["current_price"] = quote["c"]
-    profile = finnhub_client.company_profile2(symbol=symbol)
+    # read through the local store so repeat tickers barely touch finnhub
+    # (60 API calls / minute), stale endpoints are fetched concurrently
+    with MarketStore(offline=offline) as store:
+        results = get_symbol_data(symbol, _from=one_year_ago, to=today, store=store)
+    data["current_price"] = results["quote"]["c"]
+    profile = results["profile"]
     data["company"] = profile["name"]
-    basic_fiancials = finnhub_client.company_basic_financials(symbol, metric="all")
+    basic_fiancials = results["basic_financials"]
     data.update({m: basic_fiancials["metric"][m] for m in ["52WeekHigh", "52WeekLow"]})
-    insider_info = finnhub_client.stock_insider_transactions(
-        symbol=symbol,
-        _from=one_year_ago,
-        to=today,
-    )
-    data["insider_transactions"] = insider_info["data"]
-    company_profile = finnhub_client.company_profile2(symbol=symbol)
-    data.update({m: company_profile[m] for m in ["name", "weburl"]})
+    data["insider_transactions"] = results["insider_info"]["data"]
+    data.update({m: profile[m] for m in ["name", "weburl"]})
     # company_news = finnhub_client.company_news(
     #     symbol,
     #     _from=one_year_ago,
     #     to=today,
     # )
-    data["recommendation_trends"] = finnhub_client.recommendation_trends(symbol)
+    data["recommendation_trends"] = results["recommendation_trends"]
     return data
 
 
-@task
-def build_report(stock_data):
+def render_report(stock_data: dict) -> tuple[str, bytes]:
+    """The slack markdown and the chart PNG for one stock."""
+    from flows.charts import render_prospect_chart
+    from flows.report_data import monthly_insider_frame
 
     # mkdown data
     sd = stock_data
@@ -95,81 +96,28 @@ def build_report(stock_data):
 :factory: GICS Sector:{sd.get("gics_sector")}\tGICS Sub-Industry:{sd.get("gics_sub-industry")} 
 :moneybag: *current price : {sd["current_price"]}*\t52WeekHigh : {sd["52WeekHigh"]}\t52WeekLow : {sd["52WeekLow"]}
     """
-    print(mkdown_data)
-    with open(const.CURRENT_MKDOWN_FILE, "w+") as f:
-        f.write(mkdown_data)
 
     # plot
-    # format the insider data
-    df = pd.DataFrame(stock_data["insider_transactions"])
-    # chrome-extension://oemmndcbldboiebfnladdacbdfmadadm/https://www.sec.gov/about/forms/form4data.pdf
-    # code S is the sale of private assets. There are others that might apply, but this
-    # is a simple one
-    df = df.query("transactionCode=='S'").reset_index(drop=True)
-
-    df.transactionDate = pd.to_datetime(df.transactionDate)
-    df = df.sort_values("transactionDate", ascending=True)
-    # we drop a bit of data, but we expect these values to be very similar so it's fine
-    df = df.drop_duplicates(subset="transactionDate")
-    df = df.set_index("transactionDate")
-
-    rule = 30
-    sparse = df.index.to_series().diff().dt.days.ge(rule)
-    new_timestamps = df.index[sparse] - pd.Timedelta(days=rule)
-    df_ = df.reindex(df.index.union(new_timestamps))
-    df_["month"] = df_.index.astype(str).str[0:7]
-    month_ma = df_.groupby("month").transactionPrice.mean().interpolate()
-    month_ma.name = "month_moving_average"
-    df_ = df_.merge(month_ma, on="month")
-    insider_price_month_average = (
-        df_[["month", "month_moving_average"]].drop_duplicates().reset_index(drop=True)
+    pdf = monthly_insider_frame(
+        stock_data["insider_transactions"], stock_data["recommendation_trends"]
     )
+    return mkdown_data, render_prospect_chart(pdf, stock_data["ticker"])
 
-    # add in the analyst data
-    ar_data = pd.DataFrame(stock_data["recommendation_trends"])
-    ar_data["month"] = ar_data["period"].str[0:7]
-    pdf = insider_price_month_average.merge(ar_data, on="month", how="outer")
-
-    # build a plot and save it
-    _, axes = plt.subplots(2, 1, figsize=(12, 6))
-    sns.lineplot(
-        pdf,
-        x="month",
-        y="month_moving_average",
-        ax=axes[0],
-    )
-    axes[0].tick_params(axis="x", rotation=45)
-    axes[0].set_title(f"({stock_data['ticker']}) Insider sell price")
-
-    patches = [
-        ("strongBuy", "darkblue"),
-        ("buy", "lightblue"),
-        ("hold", "orange"),
-        ("sell", "red"),
-        ("strongSell", "darkred"),
-    ]
-    legend_handles = []
-    for c, col in patches:
-        sns.barplot(x="month", y=c, data=pdf, color=col, ax=axes[1])
-        legend_handles.append(mpatches.Patch(color=col, label=c))
-
-    plt.legend(handles=legend_handles)
-
-    axes[1].tick_params(axis="x", rotation=45)
-    axes[1].set_ylabel("number of analysts")
-    axes[1].set_title(f"({stock_data['ticker']}) Analyst reccomendations")
-    axes[1].yaxis.set_major_formatter(FuncFormatter(lambda x, _: int(x)))
-    plt.tight_layout()
-    plt.savefig(const.CURRENT_PLOT_FILE)
+
+@task
+def build_report(stock_data):
+    mkdown_data, png = render_report(stock_data)
+    print(mkdown_data)
+    state = get_run_state()
+    state.put("report_md", mkdown_data)
+    # the chart stays in memory until it's uploaded
+    state.put_artifact(PROSPECT_CHART, png)
     return mkdown_data
 
 
 @task
-async def send_prospect_message(
-    slack_credentials,
-    mkdown_data,
-    slack_channel: const.SlackChannel,
-):
+def send_prospect(mkdown_data, slack_channel: const.SlackChannel):
+    title, body = mkdown_data.split(" | ")[:2]
     blocks = [
         {
             "type": "section",
@@ -182,68 +130,131 @@ async def send_prospect_message(
             "type": "header",
             "text": {
                 "type": "plain_text",
-                "text": mkdown_data.split(" | ")[0],
+                "text": title,
             },
         },
         {"type": "divider"},
         {
             "type": "section",
-            "text": {"type": "mrkdwn", "text": mkdown_data.split(" | ")[1]},
+            "text": {"type": "mrkdwn", "text": body},
         },
     ]
-    await send_chat_message(
-        slack_credentials=slack_credentials,
-        slack_blocks=blocks,
-        channel=slack_channel.name,
-        text=f'{mkdown_data.split(" | ")[0]}\n{mkdown_data.split(" | ")[1]}',
-    )
-
-
-@task
-async def send_prospect_graph(
-    slack_credentials,
-    slack_channel: const.SlackChannel,
-):
-    client = slack_credentials.get_client()
-    _ = await client.files_upload_v2(
-        file=const.CURRENT_PLOT_FILE,
-        channel=slack_channel.id,
+    slack = get_slack_dispatcher()
+    # message and chart go out together
+    message = slack.post_message(slack_channel.name, blocks=blocks, text=f"{title}\n{body}")
+    graph = slack.upload_file(
+        slack_channel.id,
+        file=get_run_state().artifact(PROSPECT_CHART),
+        filename=PROSPECT_CHART,
         title="bomb proof technical analysis",
     )
-    # can't do this because not paid workspace
+    # can't share the upload inside the message because not paid workspace
     # https://stackoverflow.com/questions/58186399/how-to-create-a-slack-message-containing-an-uploaded-image
     # would also need to change the token type to user instead of bot
-    # file_id = json.loads(result.req_args["params"]["files"])[0]["id"]
-    # result = await client.files_sharedPublicURL(
-    #     file=file_id,
-    # )
+    slack.wait([message, graph])
 
 
 @flow(log_prints=True)
 def prospector(
     slack_channel_name: const.SlackChannelName = const.SlackChannelName.BOT_TEST,
     ticker: str | None = None,
+    pick_method: PickMethod = PickMethod.RANDOM,
 ) -> str:
+    api_calls = api_metrics.metrics.mark()
     slack_channel = const.CHANNELS[slack_channel_name]
-    stock = pick_stock(ticker=ticker)
+    stock = pick_stock(ticker=ticker, pick_method=pick_method)
     save_current_stock(stock=stock)
     stock_data = get_stock_data(stock)
     mkdown_data = build_report(stock_data=stock_data)
-    slack_credentials = SlackCredentials.load("slackbot-cred")
-    asyncio.run(
-        send_prospect_message(
-            slack_credentials=slack_credentials,
-            mkdown_data=mkdown_data,
-            slack_channel=slack_channel,
+    send_prospect(mkdown_data=mkdown_data, slack_channel=slack_channel)
+    api_metrics.publish_summary(api_calls, "prospector")
+    return stock["Ticker"]
+
+
+@task
+def render_universe_report(stock_data: dict) -> dict:
+    mkdown_data, png = render_report(stock_data)
+    return {"ticker": stock_data["ticker"], "markdown": mkdown_data, "chart": png}
+
+
+def gather(tickers: list[str], futures) -> tuple[list, dict[str, str]]:
+    """Results of mapped task futures, and {ticker: error} for the ones that raised."""
+    results, failed = [], {}
+    for ticker, future in zip(tickers, futures):
+        try:
+            results.append(future.result())
+        except Exception as e:
+            failed[ticker] = repr(e)
+    return results, failed
+
+
+@flow(log_prints=True)
+def render_reports(stock_datas: list[dict]) -> tuple[list[dict], dict[str, str]]:
+    return gather([d["ticker"] for d in stock_datas], render_universe_report.map(stock_datas))
+
+
+@flow(log_prints=True, task_runner=ThreadPoolTaskRunner(max_workers=UNIVERSE_FETCH_THREADS))
+def prospect_universe(
+    tickers: list[str] | None = None,
+    processes: int | None = None,
+    offline: bool = False,
+) -> dict:
+    """Prospect report for every Nasdaq-100 constituent (or `tickers`) in one run.
+
+    Finnhub data is fetched on threads in this process, so every request
+    comes out of the one shared fetcher and its 55 calls / minute bucket
+    however wide the scan is. Rendering is CPU bound and is fanned out over
+    a local Dask cluster with one single-threaded worker per core
+    (`processes=1` renders here instead). Reports and charts end up in the
+    run state; the return value is {"reports": {ticker: markdown}, "failed":
+    {ticker: error}}.
+    """
+    from flows.finnhub_client import get_finnhub_fetcher
+
+    started = time.perf_counter()
+    api_calls = api_metrics.metrics.mark()
+    if tickers is None:
+        from flows.constituents import ConstituentIndex
+
+        with ConstituentIndex() as index:
+            stocks = index.members().to_dict("records")
+    else:
+        stocks = [{"Ticker": t} for t in tickers]
+
+    fetched = get_stock_data.map(stocks, offline=unmapped(offline))
+    stock_datas, failed = gather([s["Ticker"] for s in stocks], fetched)
+    fetch_done = time.perf_counter()
+
+    processes = processes or os.cpu_count() or 1
+    if processes > 1 and len(stock_datas) > 1:
+        from prefect_dask import DaskTaskRunner
+
+        runner = DaskTaskRunner(
+            cluster_kwargs={"n_workers": processes, "threads_per_worker": 1, "processes": True}
         )
-    )
-    asyncio.run(
-        send_prospect_graph(
-            slack_credentials=slack_credentials,
-            slack_channel=slack_channel,
+        reports, render_failed = render_reports.with_options(task_runner=runner)(stock_datas)
+    else:
+        reports, render_failed = gather(
+            [d["ticker"] for d in stock_datas], render_universe_report.map(stock_datas)
         )
+    failed.update(render_failed)
+
+    state = get_run_state()
+    for report in reports:
+        state.put_artifact(f"{report['ticker']}.png", report["chart"])
+    markdown = {r["ticker"]: r["markdown"] for r in reports}
+    state.put("universe_reports", markdown)
+
+    fetcher = get_finnhub_fetcher()
+    print(
+        f"{len(reports)} of {len(stocks)} tickers prospected in {time.perf_counter() - started:.1f}s "
+        f"(fetch {fetch_done - started:.1f}s, {fetcher.calls} finnhub calls, "
+        f"{fetcher.limiter.waited:.1f}s waiting on the rate limit; render on {processes} processes)"
     )
-    return stock["Ticker"]
+    for ticker, error in failed.items():
+        print(f"{ticker} failed: {error}")
+    api_metrics.publish_summary(api_calls, "prospect-universe")
+    return {"reports": markdown, "failed": failed}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+ANALYST_COLUMNS = ["strongBuy", "buy", "hold", "sell", "strongSell"]
+
+
+def monthly_insider_frame(
+    insider_transactions: list[dict],
+    recommendation_trends: list[dict],
+) -> pd.DataFrame:
+    """Monthly insider sell price next to the analyst recommendation counts.
+
+    One row per month ("YYYY-MM") covering both inputs, with the mean price
+    of insider sales (code S) interpolated over months without any, and the
+    analyst columns from `recommendation_trends`.
+    """
+    # https://www.sec.gov/about/forms/form4data.pdf
+    # code S is the sale of private assets. There are others that might apply,
+    # but this is a simple one
+    sales = [t for t in insider_transactions if t.get("transactionCode") == "S"]
+    dates = np.array([t["transactionDate"] for t in sales], dtype="datetime64[D]")
+    prices = np.array([t["transactionPrice"] for t in sales], dtype=float)
+    order = np.argsort(dates, kind="stable")
+    dates, prices = dates[order], prices[order]
+    # we drop a bit of data, but we expect same-day values to be very similar
+    first_of_day = (
+        np.r_[True, dates[1:] != dates[:-1]] if len(dates) else np.array([], bool)
+    )
+    prices = pd.Series(
+        prices[first_of_day], index=pd.DatetimeIndex(dates[first_of_day])
+    )
+    # resample gives every month in the range, empty ones come out NaN and get
+    # filled by the interpolation
+    monthly = prices.resample("MS").mean().interpolate()
+    insider_month = pd.DataFrame(
+        {"month_moving_average": monthly.to_numpy()},
+        index=pd.Index(monthly.index.strftime("%Y-%m"), name="month"),
+    )
+
+    analysts = pd.DataFrame(recommendation_trends)
+    if analysts.empty:
+        analysts = pd.DataFrame(columns=["period", *ANALYST_COLUMNS])
+    analysts.index = pd.Index(analysts["period"].astype(str).str[0:7], name="month")
+
+    pdf = insider_month.join(analysts, how="outer", sort=True).reset_index()
+    for c in ANALYST_COLUMNS:
+        if c in pdf:
+            pdf[c] = pdf[c].astype(float)
+    pdf["month_moving_average"] = pdf["month_moving_average"].astype(np.float64)
+    return pdf
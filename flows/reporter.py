@@ -1,23 +1,27 @@
-import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING
 
-from alpaca.trading.requests import MarketOrderRequest
-from alpaca.trading.enums import OrderSide, TimeInForce
-from alpaca.trading.models import Order
 from prefect import flow, task
-from prefect_slack import SlackCredentials
-from prefect_slack.messages import send_chat_message
 
+from flows import ledger
 from flows.alpaca_client import AccountType, get_client
 import flows.const as const
+from flows.notifier import get_slack_dispatcher
+from flows.order_tracker import close_order_trackers, get_order_tracker
+from flows.run_state import current_ticker
 from flows.trader import get_market_price
+from flows.utils import api_metrics
+
+if TYPE_CHECKING:
+    from alpaca.trading.models import Order
 
 
 @task
-async def post_to_slack(
-    order: Order,
+def post_to_slack(
+    order: "Order",
     market_price: float,
     slack_channel: const.SlackChannel,
-    slack_credentials,
+    performance: dict | None = None,
 ):
     blocks = [
         {
@@ -43,15 +47,35 @@ async def post_to_slack(
             },
         },
     ]
-    await send_chat_message(
-        slack_credentials=slack_credentials,
-        slack_blocks=blocks,
-        channel=slack_channel.name,
-    )
+    if performance:
+        blocks += [
+            {"type": "divider"},
+            {
+                "type": "section",
+                "text": {
+                    "type": "mrkdwn",
+                    "text": (
+                        f"*this week*: {performance['recent_trades']} trades, "
+                        f"P&L {performance['recent_pnl']:.2f}, "
+                        f"win rate {performance['recent_win_rate']:.0%}\n"
+                        f"*all time*: {performance['trades']} trades, "
+                        f"P&L {performance['realized_pnl']:.2f}, "
+                        f"win rate {performance['win_rate']:.0%}, "
+                        f"return {performance['cumulative_return']:.2%}, "
+                        f"max drawdown {performance['max_drawdown']:.2%}"
+                    ),
+                },
+            },
+        ]
+    slack = get_slack_dispatcher()
+    slack.wait([slack.post_message(slack_channel.name, blocks=blocks)])
 
 
 @task
 def sell_position(account_type: AccountType, ticker):
+    from alpaca.trading.enums import OrderSide, TimeInForce
+    from alpaca.trading.requests import MarketOrderRequest
+
     trading_client = get_client(account_type=account_type)
     postions = trading_client.get_all_positions()
     pos = [p for p in postions if p.symbol == ticker][0]
@@ -63,39 +87,81 @@ def sell_position(account_type: AccountType, ticker):
         time_in_force=TimeInForce.DAY,
     )
     market_order = trading_client.submit_order(order_data=market_order_data)
+    ledger.record(
+        ledger.order_rows([market_order], ledger.ORDER, "reporter", account_type)
+    )
     return market_order
 
 
+@task
+def wait_for_sale(
+    order: "Order",
+    account_type: AccountType,
+    timeout: float = 8 * 3600,
+) -> dict | None:
+    # the P&L report only has this trade in it once the broker has filled it.
+    # market orders placed outside market hours sit until the next open
+    try:
+        final = get_order_tracker(account_type).wait([order], timeout=timeout)[0]
+    except TimeoutError as e:
+        print(f"{e}, reporting without it")
+        return None
+    if float(final.get("filled_qty") or 0) > 0:
+        ledger.record(ledger.order_rows([final], ledger.FILL, "reporter", account_type))
+    return final
+
+
+@task
+def report_performance(account_type: AccountType, days: int = 7) -> dict | None:
+    # activity times are UTC, compared as strings
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).strftime(
+        "%Y-%m-%dT%H:%M:%S"
+    )
+    # numpy comes with it, so it's only loaded by runs that report
+    from flows.performance import update_performance
+
+    try:
+        performance = update_performance(account_type, since=since)
+    except Exception as e:
+        # the sale went through, a missing report shouldn't fail the run
+        print(f"performance report failed: {e}")
+        return None
+    print(performance)
+    return performance
+
+
 @flow(log_prints=True)
 def reporter(
     ticker: str | None = None,
     account_type: AccountType = AccountType.PAPER,
     slack_channel_name: const.SlackChannelName = const.SlackChannelName.BOT_TEST,
 ):
-
+    api_calls = api_metrics.metrics.mark()
     if ticker is None:
-        with open(const.CURRENT_STOCK_FILE, "r") as f:
-            ticker = f.readlines()[0]
+        ticker = current_ticker()
     print(ticker)
     slack_channel = const.CHANNELS[slack_channel_name]
+    # listening on the trade updates stream before the sell goes out
+    get_order_tracker(account_type)
     sell_order = sell_position(account_type=account_type, ticker=ticker)
-    market_price = get_market_price(ticker=ticker)
-    slack_credentials = SlackCredentials.load("slackbot-cred")
-    asyncio.run(
-        post_to_slack(
-            order=sell_order,
-            market_price=market_price,
-            slack_credentials=slack_credentials,
-            slack_channel=slack_channel,
-        )
+    market_price = get_market_price(ticker=ticker, account_type=account_type)
+    ledger.record([ledger.price_row(ticker, market_price, "reporter")])
+    wait_for_sale(sell_order, account_type=account_type)
+    close_order_trackers()
+    performance = report_performance(account_type=account_type)
+    post_to_slack(
+        order=sell_order,
+        market_price=market_price,
+        slack_channel=slack_channel,
+        performance=performance,
     )
+    api_metrics.publish_summary(api_calls, "reporter")
 
     # read the stock name for the file
     # read the parquet information, make sure the two match
     # send request to the alpaca API to confirm that the postion has been exited
     # if not, then send the sell request immediatly
-    # write the stock information to the parquet
-    # generate a report on the performance, adding to the prospectors report
+    # add the performance report to the prospectors report
     # send to slack
 
 
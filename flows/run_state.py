@@ -0,0 +1,140 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from flows import const
+
+# states kept in memory at once, the oldest run is dropped first
+MAX_RUN_STATES = 32
+
+
+def atomic_write(path: str, data: bytes):
+    """Write `data` to `path` so a reader sees the old file or the new one, never half of it."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class RunState:
+    """Values and binary artifacts belonging to one flow run.
+
+    Everything lives in memory, so a chart rendered by one task goes
+    straight to the next as bytes. With `persist=True` every put is also
+    written atomically under `root/<run_id>/`, and gets fall back to disk,
+    which lets another process (or a later run given the id) pick it up.
+    """
+
+    def __init__(
+        self, run_id: str, root: str = const.RUN_STATE_DIR, persist: bool = False
+    ):
+        self.run_id = run_id
+        self.directory = os.path.join(root, run_id)
+        self.persist = persist
+        self._values: dict[str, Any] = {}
+        self._artifacts: dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, name: str) -> str:
+        if os.path.basename(name) != name or name.startswith("."):
+            raise ValueError(f"bad state key {name!r}")
+        return os.path.join(self.directory, name)
+
+    def put(self, key: str, value):
+        with self._lock:
+            self._values[key] = value
+        if self.persist:
+            atomic_write(self._path(f"{key}.json"), json.dumps(value).encode())
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            if key in self._values:
+                return self._values[key]
+        try:
+            with open(self._path(f"{key}.json"), "rb") as f:
+                value = json.load(f)
+        except FileNotFoundError:
+            return default
+        with self._lock:
+            self._values[key] = value
+        return value
+
+    def put_artifact(self, name: str, data: bytes):
+        with self._lock:
+            self._artifacts[name] = data
+        if self.persist:
+            atomic_write(self._path(name), data)
+
+    def artifact(self, name: str) -> bytes:
+        with self._lock:
+            if name in self._artifacts:
+                return self._artifacts[name]
+        try:
+            with open(self._path(name), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            raise KeyError(f"run {self.run_id} has no artifact {name!r}") from None
+        with self._lock:
+            self._artifacts[name] = data
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+            self._artifacts.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+_states: OrderedDict[str, RunState] = OrderedDict()
+_states_lock = threading.Lock()
+
+
+def current_run_id() -> str:
+    # subflows share their parent's state, so a strategy run and the
+    # prospector/trader/reporter it calls all see the same values
+    from prefect.runtime import flow_run
+
+    return flow_run.root_flow_run_id or flow_run.id or "local"
+
+
+def get_run_state(run_id: str | None = None, persist: bool = False) -> RunState:
+    run_id = run_id or current_run_id()
+    with _states_lock:
+        state = _states.get(run_id)
+        if state is None:
+            state = _states[run_id] = RunState(run_id, persist=persist)
+            while len(_states) > MAX_RUN_STATES:
+                _states.popitem(last=False)
+        else:
+            state.persist = state.persist or persist
+            _states.move_to_end(run_id)
+    return state
+
+
+def discard_run_state(run_id: str | None = None):
+    run_id = run_id or current_run_id()
+    with _states_lock:
+        state = _states.pop(run_id, None)
+    # clears what a persisted state left on disk even if it isn't in memory
+    (state or RunState(run_id)).clear()
+
+
+def current_ticker() -> str:
+    """The ticker this run picked, or else the last one the prospector picked anywhere."""
+    ticker = get_run_state().get("ticker")
+    if ticker is None:
+        with open(const.CURRENT_STOCK_FILE, "r") as f:
+            ticker = f.readlines()[0].strip()
+    return ticker
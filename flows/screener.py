@@ -0,0 +1,198 @@
+from datetime import date, timedelta
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from flows.const import PickMethod
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from flows.market_store import MarketStore
+
+# score weights per factor, a negative weight prefers low values
+DEFAULT_WEIGHTS = {
+    # 0 at the 52 week low, 1 at the high
+    "range_position": -0.5,
+    # log dollars of insider sales (code S) in the lookback
+    "insider_selling": -1.0,
+    # latest analyst consensus, -2 (all strong sell) to 2 (all strong buy)
+    "analyst_consensus": 1.0,
+}
+INSIDER_LOOKBACK = timedelta(days=90)
+# z-scores are clipped so a single outlier can't own the ranking
+Z_CLIP = 3.0
+# a stored quote older than this (a day's universe scan) doesn't get ranked;
+# the other endpoints are held to the market store's own TTLs
+QUOTE_MAX_AGE = 24 * 60 * 60
+
+ANALYST_POINTS = {"strongBuy": 2, "buy": 1, "hold": 0, "sell": -1, "strongSell": -2}
+
+
+def factor_frame(records: list[dict], as_of: date | None = None) -> "pd.DataFrame":
+    """Factor matrix, one row per ticker, from `get_stock_data`-shaped dicts.
+
+    Each record needs ticker, current_price, 52WeekHigh, 52WeekLow,
+    insider_transactions and recommendation_trends. Missing values come out
+    NaN and score as average.
+    """
+    import pandas as pd
+
+    as_of = as_of or date.today()
+    tickers = [r["ticker"] for r in records]
+    price = np.array([r.get("current_price") or np.nan for r in records], dtype=float)
+    high = np.array([r.get("52WeekHigh") or np.nan for r in records], dtype=float)
+    low = np.array([r.get("52WeekLow") or np.nan for r in records], dtype=float)
+    width = high - low
+    range_position = np.divide(
+        price - low, width, out=np.full(len(records), np.nan), where=width > 0
+    )
+
+    # every insider sale of every ticker in one frame, summed by owner
+    sales = pd.DataFrame(
+        [
+            (i, t.get("transactionDate"), t.get("change"), t.get("transactionPrice"))
+            for i, r in enumerate(records)
+            for t in r.get("insider_transactions") or []
+            if t.get("transactionCode") == "S"
+        ],
+        columns=["owner", "date", "change", "price"],
+    )
+    since = pd.Timestamp(as_of - INSIDER_LOOKBACK)
+    recent = sales[
+        pd.to_datetime(sales["date"], format="ISO8601", errors="coerce") >= since
+    ]
+    dollars = recent["change"].astype(float).abs().fillna(0) * recent["price"].astype(
+        float
+    ).fillna(0)
+    sold = (
+        dollars.groupby(recent["owner"])
+        .sum()
+        .reindex(range(len(records)), fill_value=0.0)
+        .to_numpy()
+    )
+
+    # latest period only, trends come newest first
+    counts = np.array(
+        [
+            [
+                (r.get("recommendation_trends") or [{}])[0].get(k) or 0
+                for k in ANALYST_POINTS
+            ]
+            for r in records
+        ],
+        dtype=float,
+    ).reshape(len(records), len(ANALYST_POINTS))
+    analysts = counts.sum(axis=1)
+    consensus = np.divide(
+        counts @ np.array(list(ANALYST_POINTS.values()), dtype=float),
+        analysts,
+        out=np.full(len(records), np.nan),
+        where=analysts > 0,
+    )
+    return pd.DataFrame(
+        {
+            "range_position": range_position,
+            "insider_selling": np.log1p(sold),
+            "analyst_consensus": consensus,
+        },
+        index=pd.Index(tickers, name="ticker"),
+    )
+
+
+def load_factors(
+    symbols: list[str],
+    store: "MarketStore",
+    as_of: date | None = None,
+    quote_max_age: float = QUOTE_MAX_AGE,
+) -> "pd.DataFrame":
+    """Factor matrix for `symbols` from whatever the market store holds, without fetching.
+
+    Symbols with no quote from the last `quote_max_age` seconds are left out,
+    and older financials or analyst trends count as missing, even from an
+    offline store.
+    """
+    from flows.market_store import TTL_SECONDS
+
+    as_of = as_of or date.today()
+    _from, to = (as_of - INSIDER_LOOKBACK).isoformat(), as_of.isoformat()
+    records = []
+    for symbol in symbols:
+        quote = store.get(symbol, "quote", max_age=quote_max_age)
+        if quote is None:
+            continue
+        financials = store.get(
+            symbol,
+            "company_basic_financials",
+            max_age=TTL_SECONDS["company_basic_financials"],
+        )
+        metrics = (financials or {}).get("metric") or {}
+        records.append(
+            {
+                "ticker": symbol,
+                "current_price": quote.get("c"),
+                "52WeekHigh": metrics.get("52WeekHigh"),
+                "52WeekLow": metrics.get("52WeekLow"),
+                "insider_transactions": store.insider_transactions(symbol, _from, to),
+                "recommendation_trends": store.get(
+                    symbol,
+                    "recommendation_trends",
+                    max_age=TTL_SECONDS["recommendation_trends"],
+                )
+                or [],
+            }
+        )
+    return factor_frame(records, as_of)
+
+
+def screen(
+    factors: "pd.DataFrame", weights: dict[str, float] | None = None
+) -> "pd.DataFrame":
+    """Rank tickers by the weighted sum of robust z-scores, best first.
+
+    Each factor is centred on its median and scaled by its MAD (so a few
+    extreme names don't squash everyone else), clipped to +-3 and missing
+    values count as 0. Adds a z-column per factor, `score` and `rank`.
+    """
+    weights = weights or DEFAULT_WEIGHTS
+    columns = list(weights)
+    x = factors[columns].to_numpy(dtype=float)
+    median = np.nanmedian(x, axis=0) if len(x) else np.zeros(len(columns))
+    mad = (
+        1.4826 * np.nanmedian(np.abs(x - median), axis=0)
+        if len(x)
+        else np.ones(len(columns))
+    )
+    # a factor with no spread can't tell names apart
+    mad = np.where(np.isfinite(mad) & (mad > 0), mad, np.inf)
+    z = np.nan_to_num(np.clip((x - median) / mad, -Z_CLIP, Z_CLIP))
+    score = z @ np.array([weights[c] for c in columns], dtype=float)
+
+    ranked = factors.copy()
+    for i, c in enumerate(columns):
+        ranked[f"{c}_z"] = z[:, i]
+    ranked["score"] = score
+    ranked = ranked.sort_values("score", ascending=False, kind="stable")
+    ranked["rank"] = np.arange(1, len(ranked) + 1)
+    return ranked
+
+
+def pick(
+    ranked: "pd.DataFrame",
+    method: PickMethod = PickMethod.TOP_K,
+    k: int = 10,
+    temperature: float = 1.0,
+    rng: np.random.Generator | None = None,
+) -> str:
+    """One ticker from a `screen` result."""
+    rng = rng or np.random.default_rng()
+    if ranked.empty:
+        raise ValueError("nothing to pick from")
+    tickers = ranked.index.to_numpy()
+    if method == PickMethod.RANDOM:
+        return str(rng.choice(tickers))
+    if method == PickMethod.TOP_K:
+        return str(rng.choice(tickers[:k]))
+    logits = ranked["score"].to_numpy() / temperature
+    p = np.exp(logits - logits.max())
+    return str(rng.choice(tickers, p=p / p.sum()))
@@ -1,28 +1,121 @@
+from datetime import datetime, timedelta
+import enum
 import time
 
 from pydantic import BaseModel
 from prefect import flow, task
 
+from flows.alpaca_client import get_market_sessions
 from flows.prospector import prospector
 from flows.reporter import reporter
+from flows.run_state import discard_run_state
 from flows.trader import trader
 from flows.const import AccountType, SlackChannelName
+from flows.utils import api_metrics, market_time
+
+
+class SuspendAnchor(enum.StrEnum):
+    NOW = "now"
+    OPEN = "open"  # market open of the current / next session
+    CLOSE = "close"
+
+
+class SuspendMode(enum.StrEnum):
+    # wait on a timer inside this run
+    SLEEP = "sleep"
+    # end this run and schedule the rest of the flow for the wake time, so
+    # nothing is held while waiting. Only possible when run from a deployment
+    RESCHEDULE = "reschedule"
 
 
 class SuspendConfig(BaseModel):
     h: int = 0  # hours
     m: int = 0  # minutes
     s: int = 0  # seconds
+    anchor: SuspendAnchor = SuspendAnchor.NOW  # offset is from here, can be negative
+    mode: SuspendMode = SuspendMode.SLEEP
+
+    @property
+    def offset(self) -> timedelta:
+        return timedelta(hours=self.h, minutes=self.m, seconds=self.s)
+
+
+class Stage(enum.StrEnum):
+    PROSPECT = "prospect"
+    TRADE = "trade"
+    REPORT = "report"
+
+
+@task
+def wake_time(config: SuspendConfig, account_type: AccountType = AccountType.PAPER) -> datetime:
+    now = market_time.market_now()
+    sessions = []
+    if config.anchor != SuspendAnchor.NOW:
+        # two weeks always covers the next session, even over holidays
+        sessions = get_market_sessions(now.date(), now.date() + timedelta(days=14), account_type)
+    target = market_time.resolve_wake_time(config.anchor, config.offset, sessions, now)
+    print(f"waking at {target:%Y-%m-%d %H:%M:%S %Z} ({config.anchor} {config.offset})")
+    return target
+
+
+@task
+def sleep_until(target: datetime, report_every: float = 60) -> float:
+    """Block until `target` and return how late we woke (s).
+
+    Wakes up once a `report_every` for the progress line instead of every
+    second, and the remaining time is taken from the wall clock each time so
+    long waits don't drift.
+    """
+    started, cpu_started = time.time(), time.process_time()
+    while (remaining := target.timestamp() - time.time()) > 0:
+        if remaining > report_every:
+            print(f"... sleeping for {remaining:.0f} more seconds")
+        time.sleep(min(remaining, report_every))
+    late = time.time() - target.timestamp()
+    print(
+        f"woke {late * 1000:.1f} ms after target, waited {time.time() - started:.0f}s"
+        f" using {(time.process_time() - cpu_started) * 1000:.0f} ms of process cpu"
+    )
+    return late
 
 
 @task
-def suspend(config: SuspendConfig):
-    total_wait = (config.h * 3600) + (config.m * 60) + config.s
-    print(f"waiting for {total_wait} seconds")
-    for i in range(total_wait):
-        time.sleep(1)
-        if i % 60 == 0 and i > 0:
-            print(f"... sleeping for {total_wait-i} more seconds")
+def reschedule(target: datetime, parameters: dict) -> bool:
+    """Schedule this deployment again at `target`. False when not in a deployment."""
+    from prefect.deployments import run_deployment
+    from prefect.runtime import deployment, flow_run
+
+    if not deployment.id:
+        print("not running from a deployment, can't reschedule")
+        return False
+    run = run_deployment(
+        f"{flow_run.flow_name}/{deployment.name}",
+        parameters=parameters,
+        scheduled_time=target,
+        timeout=0,
+        as_subflow=False,
+        # a retried run shouldn't schedule the next stage twice
+        idempotency_key=f"{flow_run.id}-{parameters.get('stage')}",
+    )
+    print(f"scheduled {run.name} for {target:%Y-%m-%d %H:%M:%S %Z}, ending this run")
+    return True
+
+
+def suspend(
+    config: SuspendConfig,
+    account_type: AccountType = AccountType.PAPER,
+    resume_parameters: dict | None = None,
+) -> bool:
+    """Wait as `config` says. True if the rest of the flow was handed to a
+    scheduled run (RESCHEDULE with `resume_parameters`) and the caller should
+    return."""
+    target = wake_time(config, account_type)
+    if config.mode == SuspendMode.RESCHEDULE and resume_parameters is not None:
+        if reschedule(target, resume_parameters):
+            return True
+        print("falling back to sleeping")
+    sleep_until(target)
+    return False
 
 
 @flow(
@@ -36,23 +129,43 @@ def humpday_day_trader_basic(
     ticker: str | None = None,
     account_type: AccountType = AccountType.PAPER,
     slack_channel_name: SlackChannelName = SlackChannelName.BOT_TEST,
+    stage: Stage = Stage.PROSPECT,
 ):
-    ticker = prospector(
-        ticker=ticker,
-        slack_channel_name=slack_channel_name,
-    )
-    suspend(prospect_buy_suspend)
-    order = trader(
-        ticker=ticker,
-        account_type=account_type,
-        slack_channel_name=slack_channel_name,
-    )
-    suspend(buy_sell_suspend)
-    reporter(
-        ticker=ticker,
-        account_type=account_type,
-        slack_channel_name=slack_channel_name,
-    )
+    parameters = {
+        "prospect_buy_suspend": prospect_buy_suspend.model_dump(mode="json"),
+        "buy_sell_suspend": buy_sell_suspend.model_dump(mode="json"),
+        "account_type": account_type,
+        "slack_channel_name": slack_channel_name,
+    }
+    api_calls = api_metrics.metrics.mark()
+    try:
+        if stage == Stage.PROSPECT:
+            ticker = prospector(
+                ticker=ticker,
+                slack_channel_name=slack_channel_name,
+            )
+            resume = {**parameters, "ticker": ticker, "stage": Stage.TRADE}
+            if suspend(prospect_buy_suspend, account_type, resume):
+                return
+            stage = Stage.TRADE
+        if stage == Stage.TRADE:
+            order = trader(
+                ticker=ticker,
+                account_type=account_type,
+                slack_channel_name=slack_channel_name,
+            )
+            resume = {**parameters, "ticker": ticker, "stage": Stage.REPORT}
+            if suspend(buy_sell_suspend, account_type, resume):
+                return
+        reporter(
+            ticker=ticker,
+            account_type=account_type,
+            slack_channel_name=slack_channel_name,
+        )
+    finally:
+        # ticker, report and chart of this run aren't needed past here
+        discard_run_state()
+        api_metrics.publish_summary(api_calls, "humpday")
 
 
 @flow(
@@ -1,25 +1,25 @@
-import asyncio
+from typing import TYPE_CHECKING
 
-from alpaca.trading.requests import MarketOrderRequest
-from alpaca.trading.enums import OrderSide, TimeInForce
-from alpaca.trading.models import Order
-import finnhub
 from prefect import flow, task
-from prefect_slack import SlackCredentials
-from prefect_slack.messages import send_chat_message
 
 import flows.const as const
+from flows.notifier import get_slack_dispatcher
+from flows.run_state import current_ticker
 from flows.const import AccountType
-import flows.env as env
-from flows.alpaca_client import get_client
+from flows import ledger
+from flows.alpaca_client import get_client, get_latest_trades
+from flows.finnhub_client import get_finnhub_fetcher
+from flows.utils import api_metrics
+
+if TYPE_CHECKING:
+    from alpaca.trading.models import Order
 
 
 @task
-async def post_to_slack(
-    order: Order,
+def post_to_slack(
+    order: "Order",
     market_price: float,
     slack_channel: const.SlackChannel,
-    slack_credentials,
 ):
     blocks = [
         {
@@ -46,17 +46,17 @@ async def post_to_slack(
         },
     ]
 
-    await send_chat_message(
-        slack_credentials=slack_credentials,
-        slack_blocks=blocks,
-        channel=slack_channel.name,
-    )
+    slack = get_slack_dispatcher()
+    slack.wait([slack.post_message(slack_channel.name, blocks=blocks)])
 
 
 @task
 def submit_buy_order(
     ticker: str, market_price: float, account_type: AccountType
-) -> Order:
+) -> "Order":
+    from alpaca.trading.enums import OrderSide, TimeInForce
+    from alpaca.trading.requests import MarketOrderRequest
+
     dollar_value = 1000
     qty = round((dollar_value / market_price), 2)
 
@@ -68,13 +68,22 @@ def submit_buy_order(
         time_in_force=TimeInForce.DAY,
     )
     market_order = trading_client.submit_order(order_data=market_order_data)
+    ledger.record(
+        ledger.order_rows([market_order], ledger.ORDER, "trader", account_type)
+        + [ledger.price_row(ticker, market_price, "trader")]
+    )
     return market_order
 
 
 @task
-def get_market_price(ticker: str) -> float:
-    finnhub_client = finnhub.Client(api_key=env.FINNHUB_API_KEY)
-    quote = finnhub_client.quote(symbol=ticker)
+def get_market_price(
+    ticker: str, account_type: AccountType = AccountType.PAPER
+) -> float:
+    prices = get_latest_trades([ticker], account_type=account_type).prices
+    if ticker in prices:
+        return prices[ticker]
+    # iex doesn't have everything, finnhub's quote does
+    quote = get_finnhub_fetcher().fetch("quote", symbol=ticker)
     return quote["c"]
 
 
@@ -84,31 +93,26 @@ def trader(
     account_type: AccountType = AccountType.PAPER,
     slack_channel_name: const.SlackChannelName = const.SlackChannelName.BOT_TEST,
 ):
-
+    api_calls = api_metrics.metrics.mark()
     # get the current ticker
     if ticker is None:
-        with open(const.CURRENT_STOCK_FILE, "r") as f:
-            ticker = f.readlines()[0]
+        ticker = current_ticker()
     print(ticker)
     slack_channel = const.CHANNELS[slack_channel_name]
-    market_price = get_market_price(ticker=ticker)
+    market_price = get_market_price(ticker=ticker, account_type=account_type)
     order = submit_buy_order(
         ticker=ticker,
         market_price=market_price,
         account_type=account_type,
     )
-    slack_credentials = SlackCredentials.load("slackbot-cred")
-    asyncio.run(
-        post_to_slack(
-            order=order,
-            market_price=market_price,
-            slack_channel=slack_channel,
-            slack_credentials=slack_credentials,
-        )
+    post_to_slack(
+        order=order,
+        market_price=market_price,
+        slack_channel=slack_channel,
     )
+    api_metrics.publish_summary(api_calls, "trader")
     return order
 
-    # write the postition information to a parquet
     # send a request to the alpaca API to sell the stock 30 mintues later
     # send a report to a slack channel
 
@@ -0,0 +1,443 @@
+"""Latency, bytes, status, retry and rate-limit figures for every outbound API call.
+
+The pooled sessions in `clients.registry` report through a requests response
+hook; httpx, Secret Manager (gRPC), Wikipedia and slack calls report with
+`metrics.observe` / `timed`. Flows take a `mark()` when they start, which
+tags every call made from the flow's context (its tasks and subflows too)
+with the flow run id, and `publish_summary(run, key)` at the end puts a
+table of just the calls carrying that tag up as a markdown artifact, so
+flows sharing a worker don't see each other's calls. Work handed to another
+thread takes the tags along through `carry`. With API_METRICS_PROM_FILE set the
+process totals are also written there in Prometheus text format (for the
+node_exporter textfile collector or a pushgateway).
+"""
+
+import os
+import re
+import statistics
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+PROMETHEUS_FILE_VAR = "API_METRICS_PROM_FILE"
+# latency histogram buckets (s), prometheus style
+BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+# calls kept for per-run summaries, the totals keep counting past this
+MAX_CALLS = 100_000
+
+# order ids, numbers and tickers would give every call its own endpoint
+_ID = re.compile(r"\d+|[0-9a-f]{8}-[0-9a-f\-]{27}")
+# only after these, /account/activities/FILL isn't a ticker
+_SYMBOL_PARENTS = {"stocks", "positions", "assets"}
+# runs the calls made from this context count towards, outermost first
+_runs: ContextVar[tuple[str, ...]] = ContextVar("api_metrics_runs", default=())
+
+
+def current_runs() -> tuple[str, ...]:
+    return _runs.get()
+
+
+def carry(fn):
+    """`fn` tagged with the calling context's runs, for handing to a thread pool."""
+    runs = _runs.get()
+
+    def _tagged(*args, **kwargs):
+        token = _runs.set(runs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _runs.reset(token)
+
+    return _tagged
+
+
+def endpoint_name(url: str) -> str:
+    """URL path with ids and symbols replaced: /v2/stocks/{symbol}/trades."""
+    parts = []
+    # finnhub's client joins with an extra slash, //quote is still /quote
+    for part in filter(None, urlsplit(url).path.split("/")):
+        if _ID.fullmatch(part):
+            part = "{id}"
+        elif parts and parts[-1] in _SYMBOL_PARENTS:
+            part = "{symbol}"
+        parts.append(part)
+    return "/" + "/".join(parts)
+
+
+def quota_from_headers(headers) -> tuple[int | None, int | None]:
+    """(limit, remaining) from X-RateLimit-* headers, alpaca and finnhub both send them."""
+    if not headers:
+        return None, None
+    lowered = {k.lower(): v for k, v in headers.items()}
+
+    def _int(name):
+        try:
+            return int(lowered[name])
+        except (KeyError, ValueError):
+            return None
+
+    return _int("x-ratelimit-limit"), _int("x-ratelimit-remaining")
+
+
+def _is_error(status: str) -> bool:
+    # http statuses, or "ok" / an exception name from `timed`
+    return int(status) >= 400 if status.isdigit() else status != "ok"
+
+
+@dataclass
+class _Call:
+    runs: tuple[str, ...]
+    provider: str
+    endpoint: str
+    status: str
+    latency: float
+    sent: int
+    received: int
+    retries: int
+    limit: int | None
+    remaining: int | None
+
+
+@dataclass
+class _Series:
+    count: int = 0
+    seconds: float = 0.0
+    buckets: list[int] = field(default_factory=lambda: [0] * len(BUCKETS))
+    sent: int = 0
+    received: int = 0
+    retries: int = 0
+    statuses: Counter = field(default_factory=Counter)
+
+
+class ApiMetrics:
+    """Thread-safe per (provider, endpoint) totals plus a log of recent calls."""
+
+    def __init__(self, max_calls: int = MAX_CALLS):
+        self._series: dict[tuple[str, str], _Series] = {}
+        self._quota: dict[str, tuple[int | None, int]] = {}
+        self._calls: deque[_Call] = deque(maxlen=max_calls)
+        self._lock = threading.Lock()
+
+    def observe(
+        self,
+        provider: str,
+        endpoint: str,
+        status: int | str,
+        latency: float,
+        sent: int = 0,
+        received: int = 0,
+        retries: int = 0,
+        limit: int | None = None,
+        remaining: int | None = None,
+        runs: tuple[str, ...] | None = None,
+    ):
+        """Record one call. It counts towards `runs`, the calling context's by default."""
+        provider = str(provider)
+        runs = _runs.get() if runs is None else runs
+        with self._lock:
+            series = self._series.get((provider, endpoint))
+            if series is None:
+                series = self._series[(provider, endpoint)] = _Series()
+            series.count += 1
+            series.seconds += latency
+            series.buckets[
+                next(i for i, le in enumerate(BUCKETS) if latency <= le)
+            ] += 1
+            series.sent += sent
+            series.received += received
+            series.retries += retries
+            series.statuses[str(status)] += 1
+            if remaining is not None:
+                self._quota[provider] = (limit, remaining)
+            self._calls.append(
+                _Call(
+                    runs,
+                    provider,
+                    endpoint,
+                    str(status),
+                    latency,
+                    sent,
+                    received,
+                    retries,
+                    limit,
+                    remaining,
+                )
+            )
+
+    def mark(self) -> str:
+        """Tag the calls made from here on in this context, take one when a run starts.
+
+        The tag is the flow run id, inside a flow. Ended by `end`.
+        """
+        from prefect.runtime import flow_run
+
+        run = flow_run.id or uuid.uuid4().hex
+        _runs.set(_runs.get() + (run,))
+        return run
+
+    def end(self, run: str):
+        # prefect runs a subflow in its parent's context, so its tag has to
+        # come off again or the parent's later calls would carry it
+        _runs.set(tuple(r for r in _runs.get() if r != run))
+
+    def summary(self, run: str | None = None) -> dict:
+        """Per endpoint figures and the tightest quota seen, for the calls tagged
+        with `run` (all of them by default)."""
+        with self._lock:
+            calls = [c for c in self._calls if run is None or run in c.runs]
+        grouped: dict[tuple[str, str], list[_Call]] = {}
+        quota: dict[str, dict] = {}
+        for c in calls:
+            grouped.setdefault((c.provider, c.endpoint), []).append(c)
+            if c.remaining is not None:
+                q = quota.setdefault(
+                    c.provider, {"limit": c.limit, "lowest_remaining": c.remaining}
+                )
+                q["lowest_remaining"] = min(q["lowest_remaining"], c.remaining)
+                q["remaining"] = c.remaining
+        endpoints = []
+        for (provider, endpoint), group in sorted(
+            grouped.items(), key=lambda kv: -sum(c.latency for c in kv[1])
+        ):
+            latencies = sorted(c.latency for c in group)
+            if len(latencies) > 1:
+                cuts = statistics.quantiles(latencies, n=20, method="inclusive")
+                p50, p95 = cuts[9], cuts[18]
+            else:
+                p50 = p95 = latencies[0]
+            statuses = Counter(c.status for c in group)
+            endpoints.append(
+                {
+                    "provider": provider,
+                    "endpoint": endpoint,
+                    "calls": len(group),
+                    "errors": sum(n for s, n in statuses.items() if _is_error(s)),
+                    "retries": sum(c.retries for c in group),
+                    "total_s": sum(latencies),
+                    "p50_s": p50,
+                    "p95_s": p95,
+                    "max_s": latencies[-1],
+                    "sent": sum(c.sent for c in group),
+                    "received": sum(c.received for c in group),
+                    "statuses": dict(statuses),
+                }
+            )
+        return {"calls": len(calls), "endpoints": endpoints, "quota": quota}
+
+    def prometheus(self) -> str:
+        """Process totals in Prometheus text exposition format."""
+        with self._lock:
+            series = {
+                k: (
+                    s.count,
+                    s.seconds,
+                    list(s.buckets),
+                    s.sent,
+                    s.received,
+                    s.retries,
+                    dict(s.statuses),
+                )
+                for k, s in self._series.items()
+            }
+            quota = dict(self._quota)
+
+        def _labels(provider, endpoint, **extra):
+            labels = {"provider": provider, "endpoint": endpoint, **extra}
+            return ",".join(f'{k}="{v}"' for k, v in labels.items())
+
+        lines = [
+            "# HELP api_request_duration_seconds Outbound API call latency, retries included.",
+            "# TYPE api_request_duration_seconds histogram",
+        ]
+        for (provider, endpoint), (count, seconds, buckets, *_) in sorted(
+            series.items()
+        ):
+            cumulative = 0
+            for le, n in zip(BUCKETS, buckets):
+                cumulative += n
+                le = "+Inf" if le == float("inf") else repr(le)
+                lines.append(
+                    f"api_request_duration_seconds_bucket{{{_labels(provider, endpoint, le=le)}}} {cumulative}"
+                )
+            lines.append(
+                f"api_request_duration_seconds_sum{{{_labels(provider, endpoint)}}} {seconds}"
+            )
+            lines.append(
+                f"api_request_duration_seconds_count{{{_labels(provider, endpoint)}}} {count}"
+            )
+        lines += [
+            "# HELP api_requests_total Outbound API calls by status.",
+            "# TYPE api_requests_total counter",
+        ]
+        for (provider, endpoint), (*_, statuses) in sorted(series.items()):
+            for status, n in sorted(statuses.items()):
+                lines.append(
+                    f"api_requests_total{{{_labels(provider, endpoint, status=status)}}} {n}"
+                )
+        counters = [
+            ("api_sent_bytes_total", "Request body bytes sent.", 3),
+            ("api_received_bytes_total", "Response body bytes received.", 4),
+            ("api_retries_total", "Retries made inside a call.", 5),
+        ]
+        for name, help_text, i in counters:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            lines += [
+                f"{name}{{{_labels(p, e)}}} {values[i]}"
+                for (p, e), values in sorted(series.items())
+            ]
+        lines += [
+            "# HELP api_ratelimit_remaining Calls left in the provider's current rate limit window.",
+            "# TYPE api_ratelimit_remaining gauge",
+        ]
+        lines += [
+            f'api_ratelimit_remaining{{provider="{p}"}} {r}'
+            for p, (_, r) in sorted(quota.items())
+        ]
+        lines += [
+            "# HELP api_ratelimit_limit Size of the provider's rate limit window.",
+            "# TYPE api_ratelimit_limit gauge",
+        ]
+        lines += [
+            f'api_ratelimit_limit{{provider="{p}"}} {limit}'
+            for p, (limit, _) in sorted(quota.items())
+            if limit is not None
+        ]
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+            self._quota.clear()
+            self._calls.clear()
+
+
+metrics = ApiMetrics()
+
+
+def observe_response(provider: str, response, registry: ApiMetrics | None = None):
+    """Record a requests response. Reads the body so its download counts too."""
+    started = time.perf_counter()
+    received = len(response.content or b"")
+    elapsed = getattr(response, "elapsed", None)
+    latency = (
+        (elapsed.total_seconds() if elapsed is not None else 0.0)
+        + time.perf_counter()
+        - started
+    )
+    request = getattr(response, "request", None)
+    body = getattr(request, "body", None) or b""
+    # urllib3 keeps the retries it made on the raw response
+    retries = getattr(getattr(response, "raw", None), "retries", None)
+    limit, remaining = quota_from_headers(response.headers)
+    (registry or metrics).observe(
+        provider,
+        endpoint_name(
+            getattr(response, "url", None) or getattr(request, "url", None) or ""
+        ),
+        response.status_code,
+        latency,
+        sent=len(body),
+        received=received,
+        retries=len(getattr(retries, "history", None) or ()),
+        limit=limit,
+        remaining=remaining,
+    )
+    return response
+
+
+def instrument(session, provider: str, registry: ApiMetrics | None = None):
+    """Have every response of a requests.Session recorded under `provider`."""
+
+    def _hook(response, *args, **kwargs):
+        return observe_response(provider, response, registry)
+
+    session.hooks["response"].append(_hook)
+    return session
+
+
+@contextmanager
+def timed(provider: str, endpoint: str, registry: ApiMetrics | None = None):
+    """Record the call made inside the block, for clients that aren't requests sessions.
+
+    The block can fill in `sent`, `received`, `retries` and `status` on the
+    dict it gets; an exception is recorded with its class name as the status.
+    """
+    call = {"status": "ok", "sent": 0, "received": 0, "retries": 0}
+    started = time.perf_counter()
+    try:
+        yield call
+    except Exception as e:
+        call["status"] = type(e).__name__
+        raise
+    finally:
+        (registry or metrics).observe(
+            provider,
+            endpoint,
+            call["status"],
+            time.perf_counter() - started,
+            sent=call["sent"],
+            received=call["received"],
+            retries=call["retries"],
+        )
+
+
+def summary_markdown(summary: dict) -> str:
+    lines = [
+        f"# API calls\n{summary['calls']} calls\n",
+        "| provider | endpoint | calls | errors | retries | total s | p50 ms | p95 ms | max ms | KB out | KB in | statuses |",
+        "| :-- | :-- | --: | --: | --: | --: | --: | --: | --: | --: | --: | :-- |",
+    ]
+    for e in summary["endpoints"]:
+        statuses = ", ".join(f"{s}: {n}" for s, n in sorted(e["statuses"].items()))
+        lines.append(
+            f"| {e['provider']} | `{e['endpoint']}` | {e['calls']} | {e['errors']} | {e['retries']} "
+            f"| {e['total_s']:.2f} | {e['p50_s'] * 1000:.0f} | {e['p95_s'] * 1000:.0f} | {e['max_s'] * 1000:.0f} "
+            f"| {e['sent'] / 1024:.1f} | {e['received'] / 1024:.1f} | {statuses} |"
+        )
+    if summary["quota"]:
+        lines += [
+            "",
+            "| provider | rate limit | remaining | lowest remaining |",
+            "| :-- | --: | --: | --: |",
+        ]
+        for provider, q in sorted(summary["quota"].items()):
+            lines.append(
+                f"| {provider} | {q['limit'] or ''} | {q['remaining']} | {q['lowest_remaining']} |"
+            )
+    return "\n".join(lines)
+
+
+def publish_summary(run: str, key: str, registry: ApiMetrics | None = None) -> dict:
+    """Put the calls of `run` (from `mark`) up as a markdown artifact and stop tagging.
+
+    Never raises, a metrics problem shouldn't fail a flow.
+    """
+    registry = registry or metrics
+    summary = registry.summary(run)
+    registry.end(run)
+    try:
+        from prefect.artifacts import create_markdown_artifact
+
+        create_markdown_artifact(
+            key=f"api-calls-{key}",
+            markdown=summary_markdown(summary),
+            description=f"outbound API calls of this {key} run",
+        )
+        path = os.environ.get(PROMETHEUS_FILE_VAR)
+        if path:
+            from flows.run_state import atomic_write
+
+            atomic_write(path, registry.prometheus().encode())
+    except Exception as e:
+        print(f"api metrics not published: {e}")
+    for e in summary["endpoints"]:
+        print(
+            f"{e['provider']} {e['endpoint']}: {e['calls']} calls, {e['total_s']:.2f}s, "
+            f"p95 {e['p95_s'] * 1000:.0f} ms, {e['errors']} errors, {e['retries']} retries"
+        )
+    return summary
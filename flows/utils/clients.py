@@ -0,0 +1,125 @@
+import threading
+from collections.abc import Callable
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from flows.const import AccountType, Provider
+from flows.utils import api_metrics
+
+# statuses worth backing off on; everything else is our fault and retrying
+# won't help
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRIES = 4
+
+
+def pooled_adapter(pool_maxsize: int = 16, retries: int = RETRIES) -> HTTPAdapter:
+    # urllib3 leaves POST out of the retried methods, so order submission is
+    # never replayed behind our back
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=RETRY_STATUSES,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    return HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=retry)
+
+
+def mount_pool(session: requests.Session, retries: int = RETRIES) -> requests.Session:
+    adapter = pooled_adapter(retries=retries)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class ClientRegistry:
+    """Process-wide cache of API clients, one per (provider, account type).
+
+    Clients are built once and share a keep-alive connection pool, so tasks
+    and flows in the same worker stop paying a TCP+TLS handshake for every
+    call. The pool backs off on 429/5xx per request, except under alpaca-py
+    clients, which do their own retrying. Every response is recorded in
+    `api_metrics.metrics`.
+    """
+
+    def __init__(self):
+        self._clients: dict[tuple, Any] = {}
+        self._sessions: dict[tuple, requests.Session] = {}
+        self._building: dict[tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+        self,
+        provider: Provider,
+        factory: Callable[[], Any],
+        account_type: AccountType | None = None,
+    ) -> Any:
+        key = (provider, account_type)
+        with self._lock:
+            if key in self._clients:
+                self.hits += 1
+                return self._clients[key]
+            building = self._building.setdefault(key, threading.Lock())
+        # building a client can mean a Secret Manager round trip and importing
+        # alpaca-py, only the threads after this same client wait for it
+        with building:
+            with self._lock:
+                if key in self._clients:
+                    self.hits += 1
+                    return self._clients[key]
+                self.misses += 1
+            client = factory()
+            # alpaca-py and finnhub both keep a plain requests.Session on
+            # `_session`; the raw market-data client is a session itself
+            session = getattr(client, "_session", client)
+            # alpaca-py already retries 429/504 around every request, a second
+            # layer underneath would multiply the attempts and the backoff
+            retries = 0 if hasattr(client, "_retry_codes") else RETRIES
+            session = api_metrics.instrument(
+                mount_pool(session, retries=retries), provider
+            )
+            with self._lock:
+                self._sessions[key] = session
+                self._clients[key] = client
+            return client
+
+    def stats(self) -> dict:
+        connections = {}
+        with self._lock:
+            for (provider, account_type), session in self._sessions.items():
+                opened = requests_made = 0
+                for adapter in set(session.adapters.values()):
+                    # RecentlyUsedContainer refuses plain iteration, keys() is a locked copy
+                    for pool_key in adapter.poolmanager.pools.keys():  # noqa: SIM118
+                        pool = adapter.poolmanager.pools.get(pool_key)
+                        if pool is not None:
+                            opened += pool.num_connections
+                            requests_made += pool.num_requests
+                name = (
+                    provider if account_type is None else f"{provider}:{account_type}"
+                )
+                connections[name] = {
+                    "requests": requests_made,
+                    "connections_opened": opened,
+                    "connections_reused": max(requests_made - opened, 0),
+                }
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "connections": connections,
+            }
+
+    def clear(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._clients.clear()
+            self._sessions.clear()
+
+
+registry = ClientRegistry()
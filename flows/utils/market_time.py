@@ -0,0 +1,61 @@
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+# everything the exchange does is in eastern time, so do the math there and let
+# the offset (EST / EDT) fall out of the zone instead of hard-coding one
+MARKET_TZ = ZoneInfo("America/New_York")
+MARKET_OPEN = time(9, 30)
+MARKET_CLOSE = time(16, 0)
+
+
+def market_now() -> datetime:
+    return datetime.now(MARKET_TZ)
+
+
+def market_today() -> date:
+    return market_now().date()
+
+
+def session_bounds(day: date) -> tuple[datetime, datetime]:
+    """Regular-hours open and close for a day, as tz-aware datetimes."""
+    return (
+        datetime.combine(day, MARKET_OPEN, tzinfo=MARKET_TZ),
+        datetime.combine(day, MARKET_CLOSE, tzinfo=MARKET_TZ),
+    )
+
+
+def resolve_wake_time(
+    anchor: str,
+    offset: timedelta,
+    sessions: list[tuple[datetime, datetime]],
+    now: datetime,
+) -> datetime:
+    """When to wake up for "`anchor` + `offset`", e.g. open + 15m.
+
+    `anchor` is "now", "open" or "close". The open / close is taken from the
+    first of `sessions` (oldest first) that hasn't closed yet, so on a
+    weekend or after the close it's the next trading day. A time that has
+    already passed in the current session comes back as `now`.
+    """
+    if anchor == "now":
+        return now + offset
+    current = next(((o, c) for o, c in sessions if c > now), None)
+    if current is None:
+        raise ValueError(f"no open session in the calendar after {now}")
+    target = (current[0] if anchor == "open" else current[1]) + offset
+    return max(target, now)
+
+
+def recent_sessions(asof: date, n: int) -> list[tuple[datetime, datetime]]:
+    """Session windows for the last `n` weekdays on or before `asof`, newest first.
+
+    Holidays aren't known here, so an empty window should be read as
+    "market was closed" and the caller should move on to the next one.
+    """
+    sessions = []
+    day = asof
+    while len(sessions) < n:
+        if day.weekday() < 5:
+            sessions.append(session_bounds(day))
+        day -= timedelta(days=1)
+    return sessions
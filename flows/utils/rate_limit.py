@@ -0,0 +1,40 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket.
+
+    `acquire` blocks until a token is free instead of raising, so callers near
+    the quota just queue up. Over any `per` seconds at most
+    `calls + burst` calls get through.
+    """
+
+    def __init__(self, calls: float, per: float = 60.0, burst: int = 1):
+        self.rate = calls / per  # tokens per second
+        self.capacity = max(burst, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0  # total seconds spent queued, handy for reporting
+
+    def _refill(self, now: float):
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Take `tokens` now and return how long the caller has to wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= tokens
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+            self.waited += wait
+            return wait
+
+    def acquire(self, tokens: float = 1):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
@@ -1,11 +1,61 @@
-from google.cloud import secretmanager
-import google_crc32c
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import os
+import threading
+import time
+
+from dotenv import dotenv_values
+
+from flows.const import Provider
+from flows.utils import api_metrics
+
+GSM_PROJECT = "humpday-day-trader"
+SECRET_TTL_SECONDS = 60 * 60
+
+# SECRETS_BACKEND=local never talks to Secret Manager, which is what tests and
+# offline runs want. Either way a secret can be supplied as an env var named
+# after it in upper case (FINNHUB_API_KEY) or in the dotenv file at SECRETS_FILE
+SECRETS_BACKEND_VAR = "SECRETS_BACKEND"
+SECRETS_FILE_VAR = "SECRETS_FILE"
+
+_cache: dict[str, tuple[str, float]] = {}
+_cache_lock = threading.Lock()
+_client = None
+_client_lock = threading.Lock()
+
+
+def _get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            # imported here so that importing flows.* doesn't drag in grpc
+            from google.cloud import secretmanager
+
+            _client = secretmanager.SecretManagerServiceClient()
+    return _client
+
+
+@functools.cache
+def _local_secrets(path: str) -> dict:
+    return {k.lower(): v for k, v in dotenv_values(path).items() if v is not None}
+
+
+def _local_secret(secret_name: str) -> str | None:
+    if secret_name.upper() in os.environ:
+        return os.environ[secret_name.upper()]
+    path = os.environ.get(SECRETS_FILE_VAR)
+    if path:
+        return _local_secrets(path).get(secret_name.lower())
+    return None
 
 
 def get_gsm_secret(secret_name: str):
-    client = secretmanager.SecretManagerServiceClient()
-    name = f"projects/humpday-day-trader/secrets/{secret_name}/versions/latest"
-    response = client.access_secret_version(request={"name": name})
+    import google_crc32c
+
+    name = f"projects/{GSM_PROJECT}/secrets/{secret_name}/versions/latest"
+    with api_metrics.timed(Provider.SECRET_MANAGER, "access_secret_version") as call:
+        response = _get_client().access_secret_version(request={"name": name})
+        call["received"] = len(response.payload.data)
     crc32c = google_crc32c.Checksum()
     crc32c.update(response.payload.data)
     if response.payload.data_crc32c != int(crc32c.hexdigest(), 16):
@@ -13,3 +63,40 @@ def get_gsm_secret(secret_name: str):
         return response
     payload = response.payload.data.decode("UTF-8")
     return payload
+
+
+def get_secret(secret_name: str, ttl: float = SECRET_TTL_SECONDS):
+    """Secret value from the local backend or Secret Manager, cached for `ttl` seconds."""
+    now = time.monotonic()
+    with _cache_lock:
+        hit = _cache.get(secret_name)
+        if hit is not None and hit[1] > now:
+            return hit[0]
+
+    value = _local_secret(secret_name)
+    if value is None:
+        if os.environ.get(SECRETS_BACKEND_VAR, "gsm") == "local":
+            raise KeyError(
+                f"secret {secret_name!r} not found in the environment or {SECRETS_FILE_VAR}"
+            )
+        value = get_gsm_secret(secret_name)
+        if not isinstance(value, str):
+            # corrupted payload, don't hold on to it
+            return value
+
+    with _cache_lock:
+        _cache[secret_name] = (value, now + ttl)
+    return value
+
+
+def get_secrets(secret_names: list[str], ttl: float = SECRET_TTL_SECONDS) -> dict:
+    """Resolve several secrets at once, fetching the uncached ones concurrently."""
+    with ThreadPoolExecutor(max_workers=max(len(secret_names), 1)) as pool:
+        values = pool.map(api_metrics.carry(lambda s: get_secret(s, ttl=ttl)), secret_names)
+        return dict(zip(secret_names, values))
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+    _local_secrets.cache_clear()
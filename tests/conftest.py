@@ -0,0 +1,4 @@
+import os
+
+# never reach out to Secret Manager from the test suite
+os.environ.setdefault("SECRETS_BACKEND", "local")
@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import pytest
+import requests
+from alpaca.trading.client import TradingClient
+
+from benchmarks.stub_server import StubServer
+from flows import alpaca_client
+from flows.const import AccountType, Provider
+from flows.utils import market_time
+from flows.utils.clients import RETRIES, ClientRegistry
+
+
+class FakeDataSession:
+    def __init__(self, known):
+        self.known = known
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get(self, url, params):
+        symbols = params["symbols"].split(",")
+        with self.lock:
+            self.calls.append(symbols)
+        trades = {s: {"p": self.known[s]} for s in symbols if s in self.known}
+        return FakeResponse({"trades": trades})
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+def test_latest_trades_are_chunked_merged_and_report_missing(monkeypatch):
+    symbols = [f"S{i}" for i in range(450)]
+    session = FakeDataSession({s: float(i) for i, s in enumerate(symbols) if s != "S7"})
+    monkeypatch.setattr(alpaca_client, "get_data_session", lambda account_type: session)
+
+    latest = alpaca_client.get_latest_trades(symbols + ["S1"], chunk_size=200)
+
+    assert latest.requests == 3 and len(session.calls) == 3
+    assert sorted(len(c) for c in session.calls) == [50, 200, 200]
+    assert latest.missing == ["S7"]
+    assert latest.prices["S449"] == 449.0 and len(latest.prices) == 449
+
+
+def test_symbol_chunks_respect_url_budget():
+    chunks = alpaca_client._symbol_chunks(["ABCD"] * 10, size=100, max_chars=12)
+    assert [len(c) for c in chunks] == [2, 2, 2, 2, 2]
+
+
+def test_alpaca_py_sessions_get_a_single_retry_layer():
+    registry = ClientRegistry()
+    trading = registry.get(
+        Provider.ALPACA_TRADING,
+        lambda: TradingClient("key", "secret", paper=True),
+        AccountType.PAPER,
+    )
+    data = registry.get(Provider.ALPACA_DATA, requests.Session, AccountType.PAPER)
+
+    assert trading._session.get_adapter("https://x").max_retries.total == 0
+    assert data.get_adapter("https://x").max_retries.total == RETRIES
+
+
+def _trades_route(days: dict, slow: set, gate: threading.Event):
+    # one trade at the open of every day in `days`, the ones in `slow` only answer once `gate` is set
+    def handler(match, query, _):
+        start = datetime.fromisoformat(query["start"])
+        day = start.astimezone(market_time.MARKET_TZ).date()
+        if day in slow:
+            gate.wait(5)
+        trades = [{"t": start.isoformat(), "p": days[day]}] if day in days else []
+        return 200, {
+            "symbol": match.group(1),
+            "trades": trades,
+            "next_page_token": None,
+        }
+
+    return {r"GET /v2/stocks/([A-Z]+)/trades": handler}
+
+
+@pytest.fixture
+def data_creds(monkeypatch):
+    monkeypatch.setenv("ALPACA_PAPER_API_KEY", "key")
+    monkeypatch.setenv("ALPACA_PAPER_API_SECRET", "secret")
+    # a monday, so 2 days back is a saturday and 4 is the 4th of july
+    monkeypatch.setattr(market_time, "market_today", lambda: date(2024, 7, 8))
+
+
+def test_historical_trades_fall_back_over_weekends_and_holidays(data_creds):
+    days = {date(2024, 7, 5): 5.0, date(2024, 7, 3): 3.0}
+    with StubServer(_trades_route(days, set(), threading.Event()), latency=0) as stub:
+        base_url = f"{stub.url}/v2"
+        weekend = asyncio.run(
+            alpaca_client.aget_historical_trades(
+                ["SPY"], timedelta(days=2), base_url=base_url
+            )
+        )
+        assert weekend["SPY"]["p"] == 5.0
+        # recent_sessions skips the weekend itself, so that was one request
+        assert stub.total_requests == 1
+
+        stub.reset()
+        holiday = asyncio.run(
+            alpaca_client.aget_historical_trades(
+                ["SPY", "QQQ"], timedelta(days=4), base_url=base_url
+            )
+        )
+        assert {s: t["p"] for s, t in holiday.items()} == {"SPY": 3.0, "QQQ": 3.0}
+        # the 4th came back empty and only then was the 3rd asked for
+        assert stub.total_requests == 4
+
+
+def test_historical_trades_cancel_older_probes_once_resolved(data_creds):
+    gate = threading.Event()
+    days = {date(2024, 7, 5): 5.0, date(2024, 7, 3): 3.0}
+
+    async def lookup(base_url):
+        found = await alpaca_client.aget_historical_trades(
+            ["SPY"], timedelta(days=3), probe_width=2, base_url=base_url
+        )
+        # the probe for the 4th is still waiting on the server, nothing should be left awaiting it
+        return found, [
+            t for t in asyncio.all_tasks() if t is not asyncio.current_task()
+        ]
+
+    with StubServer(_trades_route(days, {date(2024, 7, 4)}, gate), latency=0) as stub:
+        t0 = time.perf_counter()
+        found, pending = asyncio.run(lookup(f"{stub.url}/v2"))
+        elapsed = time.perf_counter() - t0
+        gate.set()
+    assert found["SPY"]["p"] == 5.0
+    assert pending == []
+    assert elapsed < 2
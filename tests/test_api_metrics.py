@@ -0,0 +1,163 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from flows.const import Provider
+from flows.utils import api_metrics
+from flows.utils.api_metrics import ApiMetrics, endpoint_name
+from flows.utils.clients import mount_pool
+
+
+@pytest.fixture
+def server():
+    # the first call gets a 503, which the pooled adapter retries
+    state = {"unavailable": 1, "remaining": 200}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if state["unavailable"]:
+                state["unavailable"] -= 1
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            state["remaining"] -= 1
+            body = b'{"trades": []}'
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("X-RateLimit-Limit", "200")
+            self.send_header("X-RateLimit-Remaining", str(state["remaining"]))
+            self.end_headers()
+            self.wfile.write(body)
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def test_endpoint_names():
+    assert (
+        endpoint_name("https://data.alpaca.markets/v2/stocks/BRK.B/trades?limit=1")
+        == "/v2/stocks/{symbol}/trades"
+    )
+    assert (
+        endpoint_name("https://x/v2/orders/904837e3-3b76-47ec-b432-046db621571b")
+        == "/v2/orders/{id}"
+    )
+    assert (
+        endpoint_name("https://finnhub.io/api/v1//stock/profile2")
+        == "/api/v1/stock/profile2"
+    )
+    assert (
+        endpoint_name("https://x/v2/account/activities/FILL")
+        == "/v2/account/activities/FILL"
+    )
+    assert endpoint_name("https://x/v2/positions/AMD") == "/v2/positions/{symbol}"
+
+
+def test_session_calls_are_recorded_per_run(server):
+    metrics = ApiMetrics()
+    session = api_metrics.instrument(
+        mount_pool(requests.Session()), Provider.ALPACA_DATA, metrics
+    )
+
+    session.get(f"{server}/v2/stocks/AAPL/trades")
+    mark = metrics.mark()
+    session.get(f"{server}/v2/stocks/MSFT/trades")
+    session.get(f"{server}/v2/stocks/AMD/trades")
+
+    everything = metrics.summary()
+    assert everything["calls"] == 3
+    (row,) = everything["endpoints"]
+    assert row["endpoint"] == "/v2/stocks/{symbol}/trades"
+    assert (
+        row["retries"] == 1
+        and row["statuses"] == {"200": 3}
+        and row["received"] == 3 * 14
+    )
+    assert everything["quota"]["alpaca_data"] == {
+        "limit": 200,
+        "remaining": 197,
+        "lowest_remaining": 197,
+    }
+
+    run = metrics.summary(mark)
+    metrics.end(mark)
+    assert run["calls"] == 2 and run["endpoints"][0]["retries"] == 0
+    assert (
+        "| alpaca_data | `/v2/stocks/{symbol}/trades` | 2 | 0 | 0 |"
+        in api_metrics.summary_markdown(run)
+    )
+
+    text = metrics.prometheus()
+    labels = 'provider="alpaca_data",endpoint="/v2/stocks/{symbol}/trades"'
+    assert f'api_request_duration_seconds_bucket{{{labels},le="+Inf"}} 3' in text
+    assert f'api_requests_total{{{labels},status="200"}} 3' in text
+    assert f"api_retries_total{{{labels}}} 1" in text
+    assert 'api_ratelimit_remaining{provider="alpaca_data"} 197' in text
+
+
+def test_timed_records_failures():
+    metrics = ApiMetrics()
+    with api_metrics.timed(
+        Provider.SECRET_MANAGER, "access_secret_version", metrics
+    ) as call:
+        call["received"] = 10
+    with (
+        pytest.raises(TimeoutError),
+        api_metrics.timed(Provider.SECRET_MANAGER, "access_secret_version", metrics),
+    ):
+        raise TimeoutError()
+
+    (row,) = metrics.summary()["endpoints"]
+    assert row["statuses"] == {"ok": 1, "TimeoutError": 1}
+    assert row["errors"] == 1 and row["received"] == 10
+
+
+def test_runs_sharing_a_worker_only_see_their_own_calls():
+    metrics = ApiMetrics()
+    runs, ready = {}, threading.Barrier(2)
+
+    def flow(name, calls):
+        run = metrics.mark()
+        ready.wait()
+        for _ in range(calls):
+            metrics.observe(Provider.FINNHUB, "/quote", 200, 0.01)
+        # a nested run (a subflow) counts towards its parent as well
+        child = metrics.mark()
+        with ThreadPoolExecutor(2) as pool:
+            list(
+                pool.map(
+                    api_metrics.carry(
+                        lambda _: metrics.observe(
+                            Provider.SLACK, "chat.postMessage", 200, 0.01
+                        )
+                    ),
+                    range(2),
+                )
+            )
+        runs[f"{name}-child"] = metrics.summary(child)["calls"]
+        metrics.end(child)
+        metrics.observe(Provider.FINNHUB, "/quote", 200, 0.01)
+        runs[name] = metrics.summary(run)["calls"]
+        metrics.end(run)
+        assert api_metrics.current_runs() == ()
+
+    threads = [
+        threading.Thread(target=flow, args=(name, n))
+        for name, n in [("a", 3), ("b", 5)]
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert runs == {"a-child": 2, "a": 6, "b-child": 2, "b": 8}
+    assert metrics.summary()["calls"] == 14
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+from flows.etf_trading.backtest import BacktestParams, backtest, load_bars, sweep
+
+
+def write_bars(
+    directory, closes: dict[str, np.ndarray], lows: dict[str, np.ndarray] | None = None
+):
+    dates = pd.bdate_range("2024-01-01", periods=len(next(iter(closes.values()))))
+    for symbol, close in closes.items():
+        low = (lows or {}).get(symbol, close)
+        pd.DataFrame(
+            {
+                "t": dates.strftime("%Y-%m-%dT05:00:00Z"),
+                "o": close,
+                "h": close,
+                "l": low,
+                "c": close,
+                "v": 100,
+            }
+        ).to_csv(directory / f"{symbol}.csv", index=False)
+
+
+def test_flat_prices_keep_the_money(tmp_path):
+    write_bars(tmp_path, {"AAA": np.full(60, 50.0), "BBB": np.full(60, 20.0)})
+    bars = load_bars(str(tmp_path))
+    assert bars.symbols == ["AAA", "BBB"] and bars.close.shape == (60, 2)
+
+    result = backtest(bars, BacktestParams(lookback=5, initial_cash=10_000))
+    assert abs(result["total_return"]) < 1e-12
+    assert result["trades"] >= 2 and result["stop_outs"] == 0
+
+
+def test_stop_loss_exits_at_the_stop(tmp_path):
+    crash = np.full(40, 100.0)
+    crash[21:] = 50.0
+    # trades through the stop during day 20, gaps down the day after
+    low = crash.copy()
+    low[20] = 80.0
+    write_bars(tmp_path, {"AAA": np.full(40, 10.0), "CRASH": crash}, {"CRASH": low})
+    bars = load_bars(str(tmp_path))
+
+    result = backtest(
+        bars, BacktestParams(lookback=5, rebalance_every=100, initial_cash=10_000)
+    )
+    # half the money went into CRASH and came back out at 85
+    assert result["stop_outs"] == 1
+    assert abs(result["total_return"] - (-0.5 * 0.15)) < 1e-3
+
+    no_stop = backtest(
+        bars,
+        BacktestParams(
+            lookback=5, rebalance_every=100, initial_cash=10_000, stop_loss=0
+        ),
+    )
+    assert abs(no_stop["total_return"] - (-0.25)) < 1e-3
+
+    # a gap below the stop fills at the open, not the stop
+    low[20] = 100.0
+    write_bars(tmp_path, {"AAA": np.full(40, 10.0), "CRASH": crash}, {"CRASH": low})
+    gapped = backtest(
+        load_bars(str(tmp_path)),
+        BacktestParams(lookback=5, rebalance_every=100, initial_cash=10_000),
+    )
+    assert gapped["stop_outs"] == 1 and abs(gapped["total_return"] - (-0.25)) < 1e-3
+
+
+def test_sweep_runs_every_point(tmp_path):
+    rng = np.random.default_rng(1)
+    write_bars(
+        tmp_path,
+        {s: 100 * np.exp(np.cumsum(rng.normal(0, 0.01, 120))) for s in ["A", "B", "C"]},
+    )
+    results = sweep(
+        {"lookback": [5, 10], "sell_balancing": [False, True]},
+        str(tmp_path),
+        processes=2,
+    )
+    assert [(r["lookback"], r["sell_balancing"]) for r in results] == [
+        (5, False),
+        (5, True),
+        (10, False),
+        (10, True),
+    ]
+    assert all(r["runtime_ms"] > 0 for r in results)
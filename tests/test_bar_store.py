@@ -0,0 +1,99 @@
+from datetime import UTC, date, datetime, timedelta
+
+import numpy as np
+
+from flows.bar_store import DAY, MINUTE, BarStore
+
+
+def daily_bar(day: str, price: float) -> dict:
+    # alpaca stamps daily bars at midnight new york
+    return {
+        "t": f"{day}T04:00:00Z",
+        "o": price,
+        "h": price + 1,
+        "l": price - 1,
+        "c": price + 0.5,
+        "v": 100,
+    }
+
+
+class FakeBars:
+    def __init__(self, bars: dict[str, list[dict]]):
+        self.bars = bars
+        self.calls = []
+
+    def __call__(self, symbols, timeframe, start, end=None, account_type=None):
+        self.calls.append((sorted(symbols), timeframe, start, end))
+        return {
+            s: [
+                b
+                for b in self.bars.get(s, [])
+                if start <= datetime.fromisoformat(b["t"].replace("Z", "+00:00")) <= end
+            ]
+            for s in symbols
+        }
+
+
+def test_sync_only_fetches_new_bars(tmp_path):
+    days = ["2024-07-01", "2024-07-02", "2024-07-03", "2024-07-05", "2024-07-08"]
+    fake = FakeBars(
+        {
+            "SPY": [daily_bar(d, 100 + i) for i, d in enumerate(days)],
+            "QQQ": [daily_bar(d, 50) for d in days],
+        }
+    )
+    store = BarStore(str(tmp_path), fetch=fake)
+
+    # tuesday afternoon: the 2nd is still in progress and isn't stored
+    added = store.sync(["SPY", "QQQ"], DAY, now=datetime(2024, 7, 2, 18, tzinfo=UTC))
+    assert added == {"SPY": 1, "QQQ": 1}
+    assert len(fake.calls) == 1
+
+    added = store.sync(["SPY", "QQQ"], DAY, now=datetime(2024, 7, 9, 12, tzinfo=UTC))
+    assert added == {"SPY": 4, "QQQ": 4}
+    # both symbols resume from the same bar, one request
+    assert len(fake.calls) == 2
+    assert fake.calls[1][2] == datetime(2024, 7, 2, 4, tzinfo=UTC)
+
+    columns = store.columns("SPY", DAY)
+    assert columns["o"].tolist() == [100, 101, 102, 103, 104]
+    assert np.all(np.diff(columns["t"]) > 0)
+    assert store.sync(["SPY"], DAY, now=datetime(2024, 7, 9, 12, tzinfo=UTC)) == {
+        "SPY": 0
+    }
+
+
+def test_asof_lookups(tmp_path):
+    store = BarStore(str(tmp_path), fetch=None)
+    store.append(
+        "SPY",
+        DAY,
+        [daily_bar(d, p) for d, p in [("2024-07-03", 10), ("2024-07-05", 12)]],
+    )
+    store.append("SPY", DAY, [daily_bar("2024-07-08", 13), daily_bar("2024-07-05", 99)])
+
+    assert store.columns("SPY", DAY)["o"].tolist() == [10, 12, 13]
+    # the 4th was a holiday, so its session open is the 3rd's
+    assert store.session_open(["SPY", "NONE"], date(2024, 7, 4)) == {"SPY": 10.0}
+    assert store.session_open(["SPY"], date(2024, 7, 5)) == {"SPY": 12.0}
+    assert store.asof("SPY", datetime(2024, 7, 1, tzinfo=UTC)) is None
+    assert store.asof("SPY", datetime(2024, 7, 9, tzinfo=UTC)) == 13.5
+    # weeks past the last stored bar, the store missed some syncs
+    assert store.asof("SPY", datetime(2024, 8, 1, tzinfo=UTC)) is None
+    assert store.session_open(["SPY"], date(2024, 7, 20)) == {}
+
+    minutes = [
+        {
+            "t": (
+                datetime(2024, 7, 8, 13, 30, tzinfo=UTC) + timedelta(minutes=m)
+            ).isoformat(),
+            "o": m,
+            "h": m,
+            "l": m,
+            "c": m,
+            "v": 1,
+        }
+        for m in range(0, 390, 7)
+    ]
+    store.append("SPY", MINUTE, minutes)
+    assert store.asof("SPY", datetime(2024, 7, 8, 13, 40, tzinfo=UTC), MINUTE) == 7.0
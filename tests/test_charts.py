@@ -0,0 +1,43 @@
+import os
+
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from flows.charts import ChartCache, render_prospect_chart
+
+
+def frame():
+    return pd.DataFrame(
+        {
+            "month": ["2024-01", "2024-02", "2024-03"],
+            "month_moving_average": [10.0, 11.0, None],
+            "strongBuy": [None, 1.0, 2.0],
+            "buy": [None, 3.0, 3.0],
+            "hold": [None, 2.0, 1.0],
+            "sell": [None, 0.0, 0.0],
+            "strongSell": [None, 0.0, 0.0],
+        }
+    )
+
+
+def test_render_is_cached_and_leaks_no_figures(tmp_path):
+    cache = ChartCache(directory=str(tmp_path))
+    open_figures = len(plt.get_fignums())
+    png = render_prospect_chart(frame(), "ACME", cache=cache)
+    assert png.startswith(b"\x89PNG")
+    assert render_prospect_chart(frame(), "ACME", cache=cache) == png
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert len(plt.get_fignums()) == open_figures
+    # a fresh process would find it on disk
+    assert ChartCache(directory=str(tmp_path)).get(next(iter(cache._memory))) == png
+
+
+def test_disk_cache_keeps_the_most_recently_used(tmp_path):
+    cache = ChartCache(directory=str(tmp_path), max_items=1, max_files=2)
+    for i, key in enumerate(["a", "b"]):
+        cache.put(key, b"png")
+        os.utime(tmp_path / f"{key}.png", (i, i))
+    # reading "a" off disk makes "b" the oldest
+    assert ChartCache(directory=str(tmp_path)).get("a") == b"png"
+    cache.put("c", b"png")
+    assert sorted(os.listdir(tmp_path)) == ["a.png", "c.png"]
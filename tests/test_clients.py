@@ -0,0 +1,75 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from flows.const import AccountType, Provider
+from flows.utils.clients import ClientRegistry
+
+
+def test_clients_are_built_once_per_key():
+    registry = ClientRegistry()
+    built = []
+
+    def factory():
+        built.append(1)
+        return requests.Session()
+
+    with ThreadPoolExecutor(8) as pool:
+        sessions = list(
+            pool.map(
+                lambda _: registry.get(
+                    Provider.ALPACA_DATA, factory, AccountType.PAPER
+                ),
+                range(16),
+            )
+        )
+
+    assert len(built) == 1
+    assert all(s is sessions[0] for s in sessions)
+    assert (
+        registry.get(Provider.ALPACA_DATA, factory, AccountType.LIVE) is not sessions[0]
+    )
+    stats = registry.stats()
+    assert (stats["hits"], stats["misses"]) == (15, 2)
+    assert set(stats["connections"]) == {"alpaca_data:paper", "alpaca_data:live"}
+
+
+def test_slow_build_does_not_block_other_clients():
+    registry = ClientRegistry()
+    cached = registry.get(Provider.FINNHUB, requests.Session)
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return requests.Session()
+
+    with ThreadPoolExecutor(1) as pool:
+        pending = pool.submit(
+            registry.get, Provider.ALPACA_TRADING, slow, AccountType.PAPER
+        )
+        started.wait(5)
+        # a cache hit and another provider's first build both go through while the slow one is running
+        assert registry.get(Provider.FINNHUB, requests.Session) is cached
+        registry.get(Provider.ALPACA_DATA, requests.Session, AccountType.PAPER)
+        assert not pending.done()
+        release.set()
+        assert pending.result(5) is registry.get(
+            Provider.ALPACA_TRADING, slow, AccountType.PAPER
+        )
+
+
+def test_failed_build_is_retried():
+    registry = ClientRegistry()
+
+    def broken():
+        raise KeyError("alpaca_paper_api_key")
+
+    with pytest.raises(KeyError):
+        registry.get(Provider.ALPACA_DATA, broken, AccountType.PAPER)
+    assert isinstance(
+        registry.get(Provider.ALPACA_DATA, requests.Session, AccountType.PAPER),
+        requests.Session,
+    )
@@ -0,0 +1,101 @@
+import os
+from datetime import date
+
+import pytest
+import requests
+
+from flows import constituents
+from flows.constituents import ConstituentIndex
+
+PAGE = """<html><body><table id="constituents">
+<tr><th>Symbol</th><th>Company</th><th>GICS Sector</th><th>GICS Sub-Industry</th></tr>
+{rows}
+</table></body></html>"""
+ROW = "<tr><td>{0}</td><td>{0} Inc</td><td>{1}</td><td>Things</td></tr>"
+FIXTURE = os.path.join(
+    os.path.dirname(__file__), "fixtures", "nasdaq100_wikipedia.html"
+)
+
+
+class FakeResponse:
+    def __init__(self, status_code, text="", headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode()
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error", response=self)
+
+
+@pytest.fixture
+def responses(monkeypatch):
+    queue = []
+    sent_headers = []
+
+    def fake_get(url, headers, timeout):
+        sent_headers.append(headers)
+        return queue.pop(0)
+
+    monkeypatch.setattr(constituents.requests, "get", fake_get)
+    return queue, sent_headers
+
+
+def page(*rows):
+    return PAGE.format(rows="".join(ROW.format(*r) for r in rows))
+
+
+def test_refresh_respects_ttl_and_conditional_fetch(responses, tmp_path):
+    queue, sent_headers = responses
+    queue.append(
+        FakeResponse(200, page(("AAPL", "Tech"), ("PEP", "Staples")), {"ETag": "v1"})
+    )
+    with ConstituentIndex(str(tmp_path / "c.sqlite")) as index:
+        assert set(index.members().Ticker) == {"AAPL", "PEP"}
+        # inside the TTL: no request at all
+        index.members()
+        assert len(sent_headers) == 1
+        queue.append(FakeResponse(304))
+        assert index.refresh(force=True) is False
+    assert sent_headers[-1]["If-None-Match"] == "v1"
+
+
+def test_history_and_lookups(responses, tmp_path):
+    queue, _ = responses
+    queue.append(FakeResponse(200, page(("AAPL", "Tech"), ("PEP", "Staples"))))
+    with ConstituentIndex(str(tmp_path / "c.sqlite")) as index:
+        index._store(
+            constituents.parse_constituents(page(("AAPL", "Tech"), ("SIRI", "Media"))),
+            effective_date=date(2020, 1, 1),
+        )
+        assert set(index.members(as_of=date(2021, 1, 1)).Ticker) == {"AAPL", "SIRI"}
+        assert index.lookup("PEP")["GICS Sector"] == "Staples"
+        assert index.sector("Tech") == ["AAPL"]
+        assert index.history()[0] == date(2020, 1, 1)
+
+
+def test_parse_saved_page():
+    with open(FIXTURE) as f:
+        df = constituents.parse_constituents(f.read())
+    assert list(df.columns) == ["Ticker", "Company", "GICS Sector", "GICS Sub-Industry"]
+    assert len(df) == 10
+    assert df.set_index("Ticker").loc["GOOG", "Company"] == "Alphabet Inc. (Class C)"
+
+
+def test_outage_serves_the_latest_snapshot(responses, tmp_path):
+    queue, sent_headers = responses
+    queue.append(FakeResponse(200, page(("AAPL", "Tech"))))
+    with ConstituentIndex(str(tmp_path / "c.sqlite"), ttl=0) as index:
+        index.members()
+        queue.append(FakeResponse(503))
+        assert list(index.members().Ticker) == ["AAPL"]
+        # one failed refresh is enough for this index
+        assert index.lookup("AAPL") is not None and len(sent_headers) == 2
+
+    queue.append(FakeResponse(503))
+    with (
+        ConstituentIndex(str(tmp_path / "empty.sqlite")) as index,
+        pytest.raises(requests.HTTPError),
+    ):
+        index.members()
@@ -0,0 +1,58 @@
+import threading
+import time
+
+from flows import finnhub_client
+from flows.finnhub_client import FinnhubFetcher
+from flows.utils.rate_limit import TokenBucket
+
+
+class SlowClient:
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def quote(self, symbol):
+        with self.lock:
+            self.calls.append(("quote", symbol))
+        time.sleep(0.05)
+        return {"c": 1.0}
+
+    def company_profile2(self, symbol):
+        with self.lock:
+            self.calls.append(("company_profile2", symbol))
+        time.sleep(0.05)
+        return {"name": symbol}
+
+
+def test_identical_in_flight_calls_are_deduped(monkeypatch):
+    client = SlowClient()
+    monkeypatch.setattr(finnhub_client, "get_finnhub_client", lambda: client)
+    fetcher = FinnhubFetcher(calls_per_minute=6000, burst=10)
+    futures = [fetcher.submit("quote", symbol="AMD") for _ in range(5)]
+    assert {f.result()["c"] for f in futures} == {1.0}
+    assert client.calls == [("quote", "AMD")]
+    assert fetcher.deduped == 4
+
+
+def test_fetch_many_runs_endpoints_concurrently(monkeypatch):
+    client = SlowClient()
+    monkeypatch.setattr(finnhub_client, "get_finnhub_client", lambda: client)
+    fetcher = FinnhubFetcher(calls_per_minute=6000, burst=10)
+    t0 = time.perf_counter()
+    results = fetcher.fetch_many(
+        {
+            "quote": ("quote", {"symbol": "AMD"}),
+            "profile": ("company_profile2", {"symbol": "AMD"}),
+        }
+    )
+    assert time.perf_counter() - t0 < 0.09
+    assert results == {"quote": {"c": 1.0}, "profile": {"name": "AMD"}}
+
+
+def test_token_bucket_queues_instead_of_failing():
+    bucket = TokenBucket(calls=20, per=1, burst=2)
+    t0 = time.perf_counter()
+    for _ in range(4):
+        bucket.acquire()
+    # two from the burst, then two more at 20/s
+    assert 0.08 < time.perf_counter() - t0 < 0.3
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+from flows.humpday_sim import (
+    POSITION_DOLLARS,
+    load_session_prices,
+    simulate,
+    simulate_block,
+    trade_returns,
+)
+
+
+def write_minute_bars(directory, symbol, days, price_fn):
+    rows = []
+    for day in days:
+        # 09:30 new york is 13:30 utc in summer
+        start = pd.Timestamp(f"{day} 13:30", tz="UTC")
+        for m in range(0, 390, 5):  # sparse on purpose, gaps get forward filled
+            p = price_fn(day, m)
+            rows.append(
+                {
+                    "t": (start + pd.Timedelta(minutes=m)).isoformat(),
+                    "o": p,
+                    "h": p,
+                    "l": p,
+                    "c": p + 0.5,
+                    "v": 1,
+                }
+            )
+    pd.DataFrame(rows).to_csv(directory / f"{symbol}.csv", index=False)
+
+
+def test_trade_returns_from_minute_bars(tmp_path):
+    # two wednesdays and a thursday that should be ignored
+    days = ["2024-07-10", "2024-07-11", "2024-07-17"]
+    write_minute_bars(tmp_path, "UP", days, lambda d, m: 100 + m)
+    write_minute_bars(tmp_path, "FLAT", days[:2], lambda d, m: 50.0)
+
+    prices = load_session_prices(str(tmp_path))
+    assert prices.dates.astype(str).tolist() == ["2024-07-10", "2024-07-17"]
+    assert prices.symbols == ["FLAT", "UP"]
+
+    returns = trade_returns(prices, holds=[7, 390])
+    # minute 7 has no bar, it's the price from minute 5; the close is 385 + 0.5
+    assert returns[0, 0, 1] == 105 / 100 - 1
+    assert returns[1, 0, 1] == 485.5 / 100 - 1
+    assert returns[1, 0, 0] == 50.5 / 50 - 1
+    # FLAT didn't trade on the 17th
+    assert np.isnan(returns[:, 1, 0]).all()
+
+
+def test_simulation_matches_a_plain_loop_and_ignores_sharding():
+    rng = np.random.default_rng(5)
+    returns = rng.normal(0, 0.01, (3, 20, 8))
+    returns[:, 4, 2] = np.nan  # not tradeable that day
+    pnl = simulate_block(returns, n_seeds=50, block=0, seed=9)
+
+    # the same draws, one trade at a time
+    valid = ~np.isnan(returns).any(axis=0)
+    u = np.random.default_rng(np.random.SeedSequence([9, 0])).random((50, 20))
+    for s in range(50):
+        total = np.zeros(3)
+        for d in range(20):
+            candidates = np.flatnonzero(valid[d])
+            total += returns[:, d, candidates[int(u[s, d] * len(candidates))]]
+        np.testing.assert_allclose(pnl[:, s], POSITION_DOLLARS * total)
+
+    assert np.array_equal(
+        simulate(returns, 2500, seed=9, processes=1),
+        simulate(returns, 2500, seed=9, processes=2),
+    )
@@ -0,0 +1,97 @@
+import multiprocessing
+import os
+from datetime import UTC, date, datetime
+
+from flows.ledger import FILL, ORDER, TradeLedger, order_rows, price_row
+
+
+def fill(symbol, day, qty, price):
+    return {
+        "id": f"id-{symbol}-{day}",
+        "client_order_id": f"hdt-{symbol}",
+        "symbol": symbol,
+        "side": "buy",
+        "qty": str(qty),
+        "filled_qty": str(qty),
+        "filled_avg_price": str(price),
+        "submitted_at": f"{day}T14:30:00+00:00",
+        "filled_at": f"{day}T14:30:05+00:00",
+        "status": "filled",
+    }
+
+
+def test_appends_partition_by_day_and_prune_on_read(tmp_path):
+    ledger = TradeLedger(str(tmp_path), compact_after=100)
+    ledger.append(
+        order_rows(
+            [fill("SPY", "2024-07-10", 2, 500.0), fill("QQQ", "2024-07-11", 1, 450.0)],
+            FILL,
+            "test",
+            "paper",
+        )
+    )
+    ledger.append(
+        [
+            price_row("SPY", 501.0, "test")
+            | {"ts": datetime(2024, 7, 11, 15, tzinfo=UTC)}
+        ]
+    )
+
+    assert sorted(os.listdir(tmp_path)) == ["date=2024-07-10", "date=2024-07-11"]
+    table = ledger.read(start=date(2024, 7, 11))
+    assert sorted(table["symbol"].to_pylist()) == ["QQQ", "SPY"]
+
+    fills = (
+        ledger.read(kind=FILL, columns=["symbol", "qty", "price", "notional"])
+        .sort_by("symbol")
+        .to_pylist()
+    )
+    assert fills == [
+        {"symbol": "QQQ", "qty": 1.0, "price": 450.0, "notional": 450.0},
+        {"symbol": "SPY", "qty": 2.0, "price": 500.0, "notional": 1000.0},
+    ]
+    assert sum(b.num_rows for b in ledger.batches(symbols=["SPY"])) == 2
+
+
+def test_busy_day_is_compacted_to_one_file(tmp_path):
+    ledger = TradeLedger(str(tmp_path), compact_after=4)
+    for i in range(3):
+        ledger.append(
+            order_rows(
+                [fill(f"S{i}", "2024-07-10", 1, 10.0 + i)], ORDER, "test", "paper"
+            )
+        )
+    partition = tmp_path / "date=2024-07-10"
+    assert len(os.listdir(partition)) == 3
+
+    ledger.append(
+        order_rows([fill("S3", "2024-07-10", 1, 13.0)], ORDER, "test", "paper")
+    )
+    files = [f for f in os.listdir(partition) if f.endswith(".parquet")]
+    assert len(files) == 1 and files[0].startswith("compacted-")
+    assert ledger.read()["symbol"].to_pylist() == ["S0", "S1", "S2", "S3"]
+    assert ledger.compact() == 0
+
+
+def _compact(root):
+    TradeLedger(root).compact()
+
+
+def test_processes_compact_a_partition_one_at_a_time(tmp_path):
+    ledger = TradeLedger(str(tmp_path), compact_after=1000)
+    for i in range(40):
+        ledger.append(
+            order_rows([fill(f"S{i}", "2024-07-10", 1, 10.0)], ORDER, "test", "paper")
+        )
+
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=_compact, args=(str(tmp_path),)) for _ in range(4)
+    ]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+
+    assert all(w.exitcode == 0 for w in workers)
+    assert ledger.read().num_rows == 40
@@ -0,0 +1,66 @@
+import pytest
+
+from flows import market_store
+from flows.market_store import MarketStore, get_symbol_data
+
+
+class FakeFetcher:
+    def __init__(self):
+        self.requests = []
+
+    def fetch_many(self, requests):
+        self.requests.append(requests)
+        responses = {
+            "quote": {"c": 10.0},
+            "company_profile2": {"name": "Acme", "weburl": "acme.com"},
+            "company_basic_financials": {"metric": {"52WeekHigh": 12, "52WeekLow": 8}},
+            "recommendation_trends": [{"period": "2024-06-01", "buy": 3}],
+            "stock_insider_transactions": {
+                "data": [
+                    {"transactionDate": "2024-05-01", "transactionPrice": 9.0},
+                    {"transactionDate": "2024-06-03", "transactionPrice": 9.5},
+                ]
+            },
+        }
+        return {name: responses[endpoint] for name, (endpoint, _) in requests.items()}
+
+
+@pytest.fixture
+def fetcher(monkeypatch):
+    fake = FakeFetcher()
+    monkeypatch.setattr(market_store, "get_finnhub_fetcher", lambda: fake)
+    return fake
+
+
+def test_repeat_symbol_is_served_from_the_store(fetcher, tmp_path):
+    with MarketStore(str(tmp_path / "store.sqlite")) as store:
+        first = get_symbol_data("ACME", "2021-06-10", "2024-06-10", store)
+        second = get_symbol_data("ACME", "2021-06-10", "2024-06-10", store)
+    assert len(fetcher.requests) == 1
+    assert first == second
+    assert len(second["insider_info"]["data"]) == 2
+
+
+def test_insider_sync_is_incremental(fetcher, tmp_path):
+    with MarketStore(str(tmp_path / "store.sqlite")) as store:
+        get_symbol_data("ACME", "2021-06-10", "2024-06-10", store)
+        store._conn.execute("DELETE FROM sync_state")
+        get_symbol_data("ACME", "2021-06-10", "2024-06-10", store)
+        # re-fetched rows don't duplicate
+        assert len(store.insider_transactions("ACME", "2021-06-10", "2024-06-10")) == 2
+    _, params = fetcher.requests[-1]["insider_info"]
+    assert params["_from"] == "2024-05-27"
+
+
+def test_offline_store_never_fetches(fetcher, tmp_path):
+    path = str(tmp_path / "store.sqlite")
+    with MarketStore(path) as store:
+        get_symbol_data("ACME", "2021-06-10", "2024-06-10", store)
+    with MarketStore(path, offline=True) as store:
+        store._conn.execute("UPDATE snapshots SET fetched_at = 0")
+        assert get_symbol_data("ACME", "2021-06-10", "2024-06-10", store)["quote"] == {
+            "c": 10.0
+        }
+        with pytest.raises(KeyError):
+            get_symbol_data("OTHER", "2021-06-10", "2024-06-10", store)
+    assert len(fetcher.requests) == 1
@@ -0,0 +1,50 @@
+from datetime import date
+
+from flows.utils.market_time import recent_sessions, session_bounds
+
+
+def test_session_bounds_follow_dst():
+    winter_open, _ = session_bounds(date(2024, 1, 10))
+    summer_open, summer_close = session_bounds(date(2024, 7, 10))
+    assert winter_open.isoformat() == "2024-01-10T09:30:00-05:00"
+    assert summer_open.isoformat() == "2024-07-10T09:30:00-04:00"
+    assert summer_close.isoformat() == "2024-07-10T16:00:00-04:00"
+
+
+def test_recent_sessions_skip_weekends():
+    # 2024-07-14 is a sunday
+    sessions = recent_sessions(date(2024, 7, 14), 3)
+    assert [s[0].date() for s in sessions] == [
+        date(2024, 7, 12),
+        date(2024, 7, 11),
+        date(2024, 7, 10),
+    ]
+
+
+def test_resolve_wake_time_uses_current_or_next_session():
+    from datetime import datetime, timedelta
+
+    from flows.utils.market_time import MARKET_TZ, resolve_wake_time
+
+    # thursday 2024-07-04 is a holiday, so the calendar skips it
+    sessions = [session_bounds(date(2024, 7, 3)), session_bounds(date(2024, 7, 5))]
+    before_open = datetime(2024, 7, 3, 8, 0, tzinfo=MARKET_TZ)
+    fifteen = timedelta(minutes=15)
+    assert (
+        resolve_wake_time("open", fifteen, sessions, before_open).isoformat()
+        == "2024-07-03T09:45:00-04:00"
+    )
+    # already past open + 15m today, don't wait for tomorrow
+    midday = datetime(2024, 7, 3, 12, 0, tzinfo=MARKET_TZ)
+    assert resolve_wake_time("open", fifteen, sessions, midday) == midday
+    assert (
+        resolve_wake_time("close", -fifteen, sessions, midday).isoformat()
+        == "2024-07-03T15:45:00-04:00"
+    )
+    # after the close it's the next trading day
+    evening = datetime(2024, 7, 3, 18, 0, tzinfo=MARKET_TZ)
+    assert (
+        resolve_wake_time("open", fifteen, sessions, evening).isoformat()
+        == "2024-07-05T09:45:00-04:00"
+    )
+    assert resolve_wake_time("now", fifteen, sessions, evening) == evening + fifteen
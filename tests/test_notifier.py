@@ -0,0 +1,167 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+from flows.notifier import SlackDispatcher
+
+
+class SlackStandIn:
+    """Just enough of slack's web API on localhost: chat.postMessage and the
+    three steps of files_upload_v2. The first `rate_limit` calls get a 429."""
+
+    def __init__(self, rate_limit: int = 0, retry_after: str = "0.2"):
+        self.calls: list[tuple[str, dict]] = []
+        self.rate_limit = rate_limit
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self.do_POST()
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                path, _, query = self.path.partition("?")
+                method = path.rsplit("/", 1)[-1]
+                if query:
+                    params = {k: v[0] for k, v in parse_qs(query).items()}
+                elif self.headers.get("Content-Type", "").startswith(
+                    "application/json"
+                ):
+                    params = json.loads(body or b"{}")
+                elif method == "upload":
+                    params = {"bytes": len(body)}
+                else:
+                    params = {
+                        k: v[0]
+                        for k, v in parse_qs(body.decode(errors="replace")).items()
+                    }
+                stand_in.calls.append((method, params))
+                if stand_in.rate_limit > 0:
+                    stand_in.rate_limit -= 1
+                    self._reply(
+                        429,
+                        {"ok": False, "error": "ratelimited"},
+                        {"Retry-After": retry_after},
+                    )
+                    return
+                port = stand_in.server.server_address[1]
+                replies = {
+                    "chat.postMessage": {"ok": True, "ts": str(len(stand_in.calls))},
+                    "files.getUploadURLExternal": {
+                        "ok": True,
+                        "file_id": "F1",
+                        "upload_url": f"http://127.0.0.1:{port}/upload",
+                    },
+                    "files.completeUploadExternal": {
+                        "ok": True,
+                        "files": [{"id": "F1"}],
+                    },
+                }
+                self._reply(200, replies.get(method, {"ok": True}))
+
+            def _reply(self, status, payload, headers=None):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/api/"
+
+    def methods(self):
+        return [m for m, _ in self.calls]
+
+    def close(self):
+        self.server.shutdown()
+
+
+@pytest.fixture
+def slack():
+    stand_in = SlackStandIn()
+    yield stand_in
+    stand_in.close()
+
+
+def section(text):
+    return {"type": "section", "text": {"type": "mrkdwn", "text": text}}
+
+
+def test_message_and_chart_go_out_together(slack):
+    with SlackDispatcher("xoxb-test", base_url=slack.base_url) as dispatcher:
+        message = dispatcher.post_message("bot-test", blocks=[section("hi")], text="hi")
+        chart = dispatcher.upload_file(
+            "C1", file=b"\x89PNG fake", title="chart", filename="chart.png"
+        )
+        results = dispatcher.wait([message, chart])
+
+    assert results[0]["ok"] and results[1]["file"]["id"] == "F1"
+    assert sorted(slack.methods()) == sorted(
+        [
+            "chat.postMessage",
+            "files.getUploadURLExternal",
+            "upload",
+            "files.completeUploadExternal",
+        ]
+    )
+    assert [latency["method"] for latency in dispatcher.latencies].count("message") == 1
+    assert all(latency["send_s"] > 0 for latency in dispatcher.latencies)
+
+
+def test_queued_messages_to_a_channel_are_batched(slack):
+    with SlackDispatcher(
+        "xoxb-test", base_url=slack.base_url, linger=0.2
+    ) as dispatcher:
+        futures = [
+            dispatcher.post_message(
+                "bot-test", blocks=[section(f"msg {i}")], text=f"msg {i}"
+            )
+            for i in range(3)
+        ]
+        futures.append(dispatcher.post_message("other", blocks=[section("elsewhere")]))
+        results = dispatcher.wait(futures)
+
+    posts = [p for m, p in slack.calls if m == "chat.postMessage"]
+    assert len(posts) == 2
+    merged = next(p for p in posts if p["channel"] == "bot-test")
+    assert [b["type"] for b in merged["blocks"]] == [
+        "section",
+        "divider",
+        "section",
+        "divider",
+        "section",
+    ]
+    assert merged["text"] == "msg 0\nmsg 1\nmsg 2"
+    # everyone in the batch gets the same answer
+    assert results[0] == results[1] == results[2]
+
+
+def test_rate_limit_waits_for_retry_after():
+    slack = SlackStandIn(rate_limit=2, retry_after="0.2")
+    try:
+        with SlackDispatcher("xoxb-test", base_url=slack.base_url) as dispatcher:
+            result = dispatcher.wait(
+                [dispatcher.post_message("bot-test", text="hello")]
+            )[0]
+    finally:
+        slack.close()
+    assert result["ok"]
+    assert slack.methods() == ["chat.postMessage"] * 3
+    assert dispatcher.rate_limited == 2
+    assert (
+        dispatcher.latencies[0]["retries"] == 2
+        and dispatcher.latencies[0]["send_s"] >= 0.4
+    )
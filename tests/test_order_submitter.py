@@ -0,0 +1,85 @@
+import threading
+import time
+
+from alpaca.trading.enums import OrderSide, TimeInForce
+from alpaca.trading.requests import MarketOrderRequest
+
+from flows.order_submitter import BatchOrderSubmitter
+from flows.utils.rate_limit import TokenBucket
+
+
+class FakeBroker:
+    """Accepts each client_order_id once, like the real API."""
+
+    def __init__(self, fail_symbols=()):
+        self.orders = {}
+        self.submitted = []
+        self.fail_symbols = set(fail_symbols)
+        self.lock = threading.Lock()
+
+    def submit_order(self, order_data):
+        time.sleep(0.1)
+        with self.lock:
+            if order_data.symbol in self.fail_symbols:
+                raise RuntimeError("connection reset")
+            if order_data.client_order_id in self.orders:
+                raise RuntimeError("client_order_id must be unique")
+            order = {
+                "id": f"id-{len(self.orders)}",
+                "symbol": order_data.symbol,
+                "status": "accepted",
+            }
+            self.orders[order_data.client_order_id] = order
+            self.submitted.append((order_data.symbol, order_data.side.value))
+            return order
+
+    def get_order_by_client_id(self, client_id):
+        with self.lock:
+            if client_id not in self.orders:
+                raise KeyError(client_id)
+            return self.orders[client_id]
+
+
+def _order(symbol, side, qty=1):
+    return MarketOrderRequest(
+        symbol=symbol, qty=qty, side=side, time_in_force=TimeInForce.DAY
+    )
+
+
+def test_sells_first_and_retries_skip_accepted_orders():
+    broker = FakeBroker(fail_symbols={"IWM"})
+    submitter = BatchOrderSubmitter(broker, limiter=TokenBucket(6000, burst=20))
+    batch = [
+        _order("SPY", OrderSide.BUY),
+        _order("QQQ", OrderSide.SELL),
+        _order("IWM", OrderSide.BUY),
+    ]
+
+    started = time.perf_counter()
+    first = submitter.submit(batch, run_key="run-1")
+    elapsed = time.perf_counter() - started
+
+    assert [(r.symbol, r.status) for r in first] == [
+        ("SPY", "submitted"),
+        ("QQQ", "submitted"),
+        ("IWM", "failed"),
+    ]
+    assert broker.submitted[0] == ("QQQ", "sell")
+    # buys went out side by side, one after another would take 0.3s
+    assert elapsed < 0.28
+
+    # retry with a recomputed quantity, only IWM is new
+    broker.fail_symbols.clear()
+    batch[0] = _order("SPY", OrderSide.BUY, qty=2)
+    second = submitter.submit(batch, run_key="run-1")
+    assert {r.symbol: r.status for r in second} == {
+        "QQQ": "existing",
+        "SPY": "existing",
+        "IWM": "submitted",
+    }
+    assert [r.client_order_id for r in first] == [r.client_order_id for r in second]
+    assert len(broker.orders) == 3
+
+    # another run places new orders
+    third = submitter.submit(batch, run_key="run-2")
+    assert all(r.status == "submitted" for r in third)
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import queue
+import socket
+import threading
+from datetime import UTC, datetime
+
+from websockets.asyncio.server import serve
+
+from flows.order_tracker import OrderTracker
+
+CREDS = {"api_key": "key", "api_secret": "secret"}
+
+
+class StreamStandIn:
+    """Local trade_updates stream: accepts any key and sends what's queued."""
+
+    def __init__(self):
+        self.updates = queue.Queue()
+        self.connections = 0
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self._serve(), self._loop)
+        self._started.wait(5)
+
+    async def _serve(self):
+        self.server = await serve(self._handler, "127.0.0.1", 0)
+        self.url = f"ws://127.0.0.1:{self.server.sockets[0].getsockname()[1]}"
+        self._started.set()
+
+    async def _handler(self, ws):
+        self.connections += 1
+        await ws.recv()
+        await ws.send(
+            json.dumps({"stream": "authorization", "data": {"status": "authorized"}})
+        )
+        await ws.recv()
+        await ws.send(
+            json.dumps({"stream": "listening", "data": {"streams": ["trade_updates"]}})
+        )
+        while True:
+            try:
+                update = self.updates.get_nowait()
+            except queue.Empty:
+                await asyncio.sleep(0.005)
+                continue
+            await ws.send(
+                json.dumps({"stream": "trade_updates", "data": update}).encode()
+            )
+
+    def push(self, event: str, order: dict):
+        self.updates.put({"event": event, "order": order})
+
+
+def _order(order_id, symbol="SPY", status="new"):
+    submitted = datetime.now(UTC).isoformat()
+    return {
+        "id": order_id,
+        "symbol": symbol,
+        "status": status,
+        "submitted_at": submitted,
+    }
+
+
+def test_stream_resolves_orders_on_fill_cancel_and_reject():
+    stream = StreamStandIn()
+    polls = []
+    tracker = OrderTracker(
+        stream_url=stream.url,
+        credentials=CREDS,
+        fetch=lambda symbols, after: polls.append(symbols) or [],
+    )
+    with tracker:
+        orders = [_order("a"), _order("b", "QQQ"), _order("c", "IWM")]
+        futures = tracker.track(orders)
+        stream.push("partial_fill", {**orders[0], "status": "partially_filled"})
+        stream.push("fill", {**orders[0], "status": "filled"})
+        stream.push("canceled", {**orders[1], "status": "canceled"})
+        stream.push("rejected", {**orders[2], "status": "rejected"})
+        results = tracker.wait(orders, timeout=2)
+
+    assert [r["status"] for r in results] == ["filled", "canceled", "rejected"]
+    assert all(f.done() for f in futures.values())
+    assert tracker.mode == "stream"
+    assert stream.connections == 1
+    assert max(tracker.latencies.values()) < 1
+    assert polls == []
+
+
+def test_falls_back_to_one_poll_for_all_orders():
+    # nothing listens on this port
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    calls = []
+
+    def fetch(symbols, after):
+        calls.append(symbols)
+        status = "filled" if len(calls) > 1 else "new"
+        return [
+            {**_order(i, sym), "status": status}
+            for i, sym in [("a", "SPY"), ("b", "QQQ")]
+        ]
+
+    tracker = OrderTracker(
+        stream_url=f"ws://127.0.0.1:{port}",
+        credentials=CREDS,
+        fetch=fetch,
+        connect_timeout=0.5,
+        reconnect_attempts=0,
+        poll_interval=0.05,
+    )
+    with tracker:
+        results = tracker.wait([_order("a"), _order("b", "QQQ")], timeout=5)
+
+    assert tracker.mode == "poll"
+    assert [r["status"] for r in results] == ["filled", "filled"]
+    # both orders share every poll
+    assert calls[0] == ["QQQ", "SPY"] and len(calls) == 2
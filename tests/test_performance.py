@@ -0,0 +1,130 @@
+import pytest
+
+from flows.const import AccountType
+from flows.performance import (
+    PerformanceStore,
+    fetch_fill_activities,
+    update_performance,
+)
+
+
+class FakeActivities:
+    """Serves FILL activities the way alpaca pages them, ascending after page_token."""
+
+    def __init__(self, fills, equity=10_000.0):
+        self.fills = fills
+        self.equity = equity
+        self.calls = []
+
+    def get(self, path, params=None):
+        if path == "/account":
+            return {"equity": str(self.equity)}
+        self.calls.append(params)
+        after = params.get("page_token") or ""
+        rest = [f for f in self.fills if f["id"] > after]
+        return rest[: params["page_size"]]
+
+
+def activity(n, symbol, side, qty, price, order_id=None):
+    return {
+        "id": f"2024071{n // 10}1430{n % 10:02d}000::{n}",
+        "transaction_time": f"2024-07-1{n // 10}T14:30:{n % 10:02d}Z",
+        "symbol": symbol,
+        "side": side,
+        "qty": str(qty),
+        "price": str(price),
+        "order_id": order_id or f"order-{n}",
+    }
+
+
+def test_pagination_walks_every_page():
+    fills = [activity(n, "SPY", "buy", 1, 100) for n in range(25)]
+    client = FakeActivities(fills)
+    assert (
+        fetch_fill_activities(AccountType.PAPER, page_size=10, client=client) == fills
+    )
+    assert len(client.calls) == 3
+
+
+def test_fifo_pnl_and_running_stats(tmp_path):
+    fills = [
+        activity(0, "AAA", "buy", 10, 10.0),
+        activity(1, "AAA", "buy", 10, 12.0),
+        # one order in two partial fills, closes the 10 @ 10 lot and half of the 12s
+        activity(2, "AAA", "sell", 8, 13.0, "sell-1"),
+        activity(3, "AAA", "sell", 7, 13.0, "sell-1"),
+        activity(4, "BBB", "buy", 5, 20.0),
+        activity(5, "BBB", "sell", 5, 18.0),
+    ]
+    aaa = 15 * 13.0 - (10 * 10.0 + 5 * 12.0)
+    # the account's equity already includes both trades
+    client = FakeActivities(fills, equity=10_000 + aaa - 10.0)
+    path = str(tmp_path / "perf.sqlite")
+    summary = update_performance(AccountType.PAPER, path=path, client=client)
+
+    assert summary["trades"] == 2
+    assert summary["win_rate"] == 0.5
+    assert summary["realized_pnl"] == pytest.approx(aaa - 10.0)
+    # P&L against the account, not each trade's return compounded
+    assert summary["cumulative_return"] == pytest.approx((aaa - 10.0) / 10_000)
+    assert summary["max_drawdown"] == pytest.approx(10 / (10_000 + aaa))
+    assert summary["open_symbols"] == ["AAA"]
+
+
+def test_only_new_fills_are_processed(tmp_path):
+    fills = [
+        activity(0, "AAA", "buy", 10, 10.0),
+        # one sell order whose fills land in different syncs
+        activity(1, "AAA", "sell", 4, 9.0, "sell-1"),
+        activity(2, "AAA", "sell", 6, 9.5, "sell-1"),
+        activity(3, "BBB", "buy", 2, 50.0),
+        activity(4, "BBB", "sell", 2, 55.0),
+    ]
+    path = str(tmp_path / "perf.sqlite")
+    first = FakeActivities(fills[:2], equity=10_000 - 4.0)
+    update_performance(AccountType.PAPER, path=path, client=first)
+    second = FakeActivities(fills, equity=10_000 + 3.0)
+    incremental = update_performance(AccountType.PAPER, path=path, client=second)
+    # the second sync starts after the stored fills
+    assert second.calls[0]["page_token"] == fills[1]["id"]
+
+    everything = update_performance(
+        AccountType.PAPER,
+        path=str(tmp_path / "full.sqlite"),
+        client=FakeActivities(fills, equity=10_000 + 3.0),
+    )
+    assert everything["trades"] == 2
+    for key, value in everything.items():
+        assert incremental[key] == (
+            pytest.approx(value) if isinstance(value, float) else value
+        )
+
+    with PerformanceStore(path) as store:
+        assert store.update(AccountType.PAPER)["new_trades"] == 0
+        assert (
+            len(store.trades(AccountType.PAPER, since="2024-07-10T14:30:02")["pnl"])
+            == 2
+        )
+
+
+def test_a_sell_filled_across_updates_is_one_trade(tmp_path):
+    fills = [
+        activity(0, "AAA", "buy", 10, 10.0),
+        activity(1, "AAA", "sell", 5, 11.0, "sell-1"),
+        activity(2, "AAA", "sell", 5, 8.0, "sell-1"),
+    ]
+    path = str(tmp_path / "perf.sqlite")
+    assert (
+        update_performance(
+            AccountType.PAPER, path=path, client=FakeActivities(fills[:2])
+        )["win_rate"]
+        == 1.0
+    )
+    summary = update_performance(
+        AccountType.PAPER, path=path, client=FakeActivities(fills)
+    )
+
+    assert summary["trades"] == 1 and summary["win_rate"] == 0.0
+    assert summary["realized_pnl"] == pytest.approx(-5.0)
+    with PerformanceStore(path) as store:
+        assert store.trades(AccountType.PAPER)["qty"].tolist() == [10.0]
@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from flows.etf_trading.portfolio import PortfolioArrays
+
+
+def _held(symbol, qty, price):
+    return SimpleNamespace(
+        symbol=symbol,
+        qty=str(qty),
+        current_price=str(price),
+        market_value=str(qty * price),
+        cost_basis="1",
+    )
+
+
+def test_rebalance_quantities():
+    held = [_held("SPY", 10, 500.0), _held("QQQ", 10, 400.0), _held("OLD", 5, 10.0)]
+    portfolio = PortfolioArrays.from_holdings(
+        ["SPY", "QQQ", "IWM"], held, {"IWM": 200.0}, cash=1000
+    )
+
+    assert portfolio.index == {"SPY": 0, "QQQ": 1, "IWM": 2}
+    assert portfolio.new.tolist() == [False, False, True]
+    np.testing.assert_allclose(portfolio.proportions, [0.5, 0.4, 0.0])
+
+    portfolio.ratio_change = np.array([1.2, 1.0, 0.8])
+    targets = portfolio.rebalance_targets()
+    np.testing.assert_allclose(targets, [0.4, 1 / 3, 0.8 / 3])
+    assert abs(targets.sum() - 1) < 1e-9
+
+    sells = portfolio.sell_quantities(targets)
+    # SPY from 50% to 40% of the value is 2 of its 10 shares
+    np.testing.assert_allclose(sells, [2.0, 1.67, 0.0])
+
+    buys = portfolio.buy_quantities(targets)
+    # only IWM is under its target and gets all 1000 of cash
+    assert buys.tolist() == [0.0, 0.0, 5.0]
+
+    # the sells turn into cash, what counts as under target stays as read
+    portfolio.cash += float(sells @ portfolio.price)
+    np.testing.assert_allclose(portfolio.proportions, [0.5, 0.4, 0.0])
+    assert portfolio.buy_quantities(targets).tolist() == [0.0, 0.0, 13.0]
+
+    converted = portfolio.to_portfolio()
+    assert [p.symbol for p in converted.positions] == ["SPY", "QQQ", "IWM"]
+    assert converted.positions[2].new and converted.positions[2].cost_basis is None
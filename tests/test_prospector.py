@@ -1,8 +1,46 @@
-from flows.prospector import get_wikipedia_nasdaq100
+from flows.prospector import gather, render_report
 
 
-def test_get_wikipedia_nasdaq100():
-    df = get_wikipedia_nasdaq100()
-    assert set(df.columns) == set(
-        ["Ticker", "Company", "GICS Sector", "GICS Sub-Industry"]
+def test_render_report_is_markdown_and_png():
+    stock_data = {
+        "ticker": "ACME",
+        "company": "Acme",
+        "weburl": "acme.com",
+        "current_price": 10.0,
+        "52WeekHigh": 12,
+        "52WeekLow": 8,
+        "insider_transactions": [
+            {
+                "transactionDate": "2024-05-01",
+                "transactionPrice": 9.0,
+                "transactionCode": "S",
+            },
+            {
+                "transactionDate": "2024-06-03",
+                "transactionPrice": 9.5,
+                "transactionCode": "S",
+            },
+        ],
+        "recommendation_trends": [{"period": "2024-06-01", "buy": 3, "hold": 1}],
+    }
+    markdown, png = render_report(stock_data)
+    assert markdown.startswith("Acme (ACME) | ")
+    assert png.startswith(b"\x89PNG")
+
+
+class Done:
+    def __init__(self, value=None, error=None):
+        self.value, self.error = value, error
+
+    def result(self):
+        if self.error:
+            raise self.error
+        return self.value
+
+
+def test_gather_keeps_results_past_a_failure():
+    results, failed = gather(
+        ["A", "B", "C"], [Done(1), Done(error=ValueError("bad chart")), Done(3)]
     )
+    assert results == [1, 3]
+    assert failed == {"B": "ValueError('bad chart')"}
@@ -0,0 +1,56 @@
+from flows.report_data import monthly_insider_frame
+
+
+def test_monthly_insider_frame_fills_gaps_and_joins_analysts():
+    insider = [
+        {
+            "transactionCode": "S",
+            "transactionDate": "2024-01-05",
+            "transactionPrice": 10.0,
+        },
+        {
+            "transactionCode": "S",
+            "transactionDate": "2024-01-20",
+            "transactionPrice": 12.0,
+        },
+        {
+            "transactionCode": "P",
+            "transactionDate": "2024-02-01",
+            "transactionPrice": 99.0,
+        },
+        {
+            "transactionCode": "S",
+            "transactionDate": "2024-04-10",
+            "transactionPrice": 20.0,
+        },
+    ]
+    trends = [
+        {
+            "period": "2024-05-01",
+            "strongBuy": 1,
+            "buy": 2,
+            "hold": 3,
+            "sell": 0,
+            "strongSell": 0,
+        }
+    ]
+    pdf = monthly_insider_frame(insider, trends)
+    assert list(pdf.month) == ["2024-01", "2024-02", "2024-03", "2024-04", "2024-05"]
+    assert list(pdf.month_moving_average[:4]) == [11.0, 14.0, 17.0, 20.0]
+    assert pdf.buy.iloc[-1] == 2
+
+
+def test_monthly_insider_frame_without_sales():
+    trends = [
+        {
+            "period": "2024-05-01",
+            "strongBuy": 1,
+            "buy": 2,
+            "hold": 3,
+            "sell": 0,
+            "strongSell": 0,
+        }
+    ]
+    pdf = monthly_insider_frame([], trends)
+    assert list(pdf.month) == ["2024-05"]
+    assert pdf.month_moving_average.isna().all()
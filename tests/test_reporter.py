@@ -0,0 +1,58 @@
+from flows import ledger, reporter
+from flows.ledger import FILL
+
+
+class FakeTracker:
+    def __init__(self, final: dict | None):
+        self.final = final
+        self.waited = []
+
+    def wait(self, orders, timeout=None):
+        self.waited.append([o["id"] for o in orders])
+        if self.final is None:
+            raise TimeoutError(
+                f"1 orders still open after {timeout}s: {orders[0]['id']}"
+            )
+        return [self.final]
+
+
+def _patch(monkeypatch, final):
+    tracker = FakeTracker(final)
+    recorded = []
+    monkeypatch.setattr(reporter, "get_order_tracker", lambda account_type: tracker)
+    monkeypatch.setattr(ledger, "record", recorded.extend)
+    return tracker, recorded
+
+
+def test_sale_is_waited_for_and_its_fill_recorded(monkeypatch):
+    order = {
+        "id": "o-1",
+        "symbol": "AMD",
+        "side": "sell",
+        "qty": "3",
+        "status": "accepted",
+    }
+    filled = {
+        **order,
+        "status": "filled",
+        "filled_qty": "3",
+        "filled_avg_price": "150.5",
+        "filled_at": "2024-07-12T14:30:01Z",
+    }
+    tracker, recorded = _patch(monkeypatch, filled)
+
+    assert reporter.wait_for_sale.fn(order, "paper") == filled
+    assert tracker.waited == [["o-1"]]
+    [row] = recorded
+    assert (row["kind"], row["symbol"], row["qty"], row["price"]) == (
+        FILL,
+        "AMD",
+        3.0,
+        150.5,
+    )
+
+
+def test_unfilled_sale_is_reported_without(monkeypatch):
+    _, recorded = _patch(monkeypatch, None)
+    assert reporter.wait_for_sale.fn({"id": "o-2"}, "paper", timeout=1) is None
+    assert recorded == []
@@ -0,0 +1,51 @@
+import os
+
+from flows import run_state
+from flows.run_state import RunState, atomic_write, discard_run_state, get_run_state
+
+
+def test_runs_do_not_see_each_other():
+    a, b = get_run_state("run-a"), get_run_state("run-b")
+    a.put("ticker", "AMD")
+    b.put("ticker", "NVDA")
+    a.put_artifact("chart.png", b"\x89PNG a")
+    assert get_run_state("run-a").get("ticker") == "AMD"
+    assert get_run_state("run-b").get("ticker") == "NVDA"
+    assert get_run_state("run-b").get("missing", "default") == "default"
+    assert a.artifact("chart.png") == b"\x89PNG a"
+    discard_run_state("run-a")
+    discard_run_state("run-b")
+    assert get_run_state("run-a").get("ticker") is None
+
+
+def test_persisted_state_is_readable_from_another_process(tmp_path):
+    writer = RunState("run-1", root=str(tmp_path), persist=True)
+    writer.put("ticker", "AMD")
+    writer.put_artifact("chart.png", b"png bytes")
+    # nothing half written is left lying around
+    assert sorted(os.listdir(tmp_path / "run-1")) == ["chart.png", "ticker.json"]
+
+    # a fresh instance has nothing in memory, like another worker process
+    reader = RunState("run-1", root=str(tmp_path))
+    assert reader.get("ticker") == "AMD"
+    assert reader.artifact("chart.png") == b"png bytes"
+    reader.clear()
+    assert not (tmp_path / "run-1").exists()
+
+
+def test_atomic_write_replaces_whole_file(tmp_path):
+    path = tmp_path / "nested" / "current_stock.txt"
+    atomic_write(str(path), b"AMD")
+    atomic_write(str(path), b"NVDA")
+    assert path.read_bytes() == b"NVDA"
+    assert os.listdir(path.parent) == ["current_stock.txt"]
+
+
+def test_oldest_runs_are_dropped_from_memory(monkeypatch):
+    monkeypatch.setattr(run_state, "MAX_RUN_STATES", 2)
+    for n in range(3):
+        get_run_state(f"lru-{n}").put("n", n)
+    assert "lru-0" not in run_state._states
+    assert get_run_state("lru-2").get("n") == 2
+    for n in range(3):
+        discard_run_state(f"lru-{n}")
@@ -0,0 +1,138 @@
+from datetime import date
+
+import numpy as np
+
+from flows.market_store import MarketStore
+from flows.screener import PickMethod, factor_frame, load_factors, pick, screen
+
+AS_OF = date(2024, 7, 10)
+
+
+def record(ticker, price, low, high, sold_shares=0, trends=None):
+    return {
+        "ticker": ticker,
+        "current_price": price,
+        "52WeekHigh": high,
+        "52WeekLow": low,
+        "insider_transactions": [
+            # one recent sale, one too old to count, one purchase
+            {
+                "transactionDate": "2024-06-01",
+                "transactionCode": "S",
+                "change": -sold_shares,
+                "transactionPrice": 10.0,
+            },
+            {
+                "transactionDate": "2023-01-01",
+                "transactionCode": "S",
+                "change": -(10**6),
+                "transactionPrice": 10.0,
+            },
+            {
+                "transactionDate": "2024-06-02",
+                "transactionCode": "P",
+                "change": 10**6,
+                "transactionPrice": 10.0,
+            },
+        ],
+        "recommendation_trends": trends
+        if trends is not None
+        else [{"buy": 1, "hold": 1}],
+    }
+
+
+def test_factors_from_stock_data():
+    factors = factor_frame(
+        [
+            record(
+                "LOW",
+                10,
+                10,
+                20,
+                sold_shares=100,
+                trends=[{"strongBuy": 3, "sell": 1}, {"strongSell": 9}],
+            ),
+            record("MID", 15, 10, 20),
+            record("FLAT", 10, 10, 10, trends=[]),
+        ],
+        AS_OF,
+    )
+    assert (
+        factors.loc["LOW", "range_position"] == 0
+        and factors.loc["MID", "range_position"] == 0.5
+    )
+    assert np.isnan(factors.loc["FLAT", "range_position"])
+    assert factors.loc["LOW", "insider_selling"] == np.log1p(1000)
+    assert factors.loc["MID", "insider_selling"] == 0
+    # only the newest period: (3 * 2 - 1) / 4
+    assert factors.loc["LOW", "analyst_consensus"] == 1.25
+    assert np.isnan(factors.loc["FLAT", "analyst_consensus"])
+
+
+def test_screen_ranks_by_weighted_z_scores():
+    rng = np.random.default_rng(0)
+    records = [
+        record(
+            f"S{i}",
+            rng.uniform(10, 20),
+            10,
+            20,
+            trends=[{"buy": int(rng.integers(1, 5)), "hold": 2}],
+        )
+        for i in range(50)
+    ]
+    records.append(record("BEST", 10, 10, 20, trends=[{"strongBuy": 10}]))
+    records.append(
+        record("WORST", 20, 10, 20, sold_shares=10**6, trends=[{"strongSell": 10}])
+    )
+    ranked = screen(factor_frame(records, AS_OF))
+
+    assert ranked.index[0] == "BEST" and ranked.index[-1] == "WORST"
+    assert ranked["score"].is_monotonic_decreasing
+    assert ranked["rank"].tolist() == list(range(1, 53))
+
+    rng = np.random.default_rng(1)
+    assert {pick(ranked, PickMethod.TOP_K, k=3, rng=rng) for _ in range(50)} <= set(
+        ranked.index[:3]
+    )
+    weighted = [
+        pick(ranked, PickMethod.WEIGHTED, temperature=0.1, rng=rng) for _ in range(50)
+    ]
+    assert weighted.count("BEST") > 40
+
+
+def test_load_factors_reads_the_store_only(tmp_path):
+    with MarketStore(str(tmp_path / "store.sqlite"), offline=True) as store:
+        store.put("ACME", "quote", {"c": 15.0})
+        store.put(
+            "ACME",
+            "company_basic_financials",
+            {"metric": {"52WeekHigh": 20, "52WeekLow": 10}},
+        )
+        store.put("ACME", "recommendation_trends", [{"buy": 2}])
+        store.add_insider_transactions(
+            "ACME",
+            [
+                {
+                    "transactionDate": "2024-06-01",
+                    "transactionCode": "S",
+                    "change": -99,
+                    "transactionPrice": 10.0,
+                }
+            ],
+        )
+        store.put("OLD", "quote", {"c": 15.0})
+        store.put("ACME2", "quote", {"c": 15.0})
+        store.put("ACME2", "recommendation_trends", [{"buy": 2}])
+        # a universe scan from a while back
+        with store._conn:
+            store._conn.execute(
+                "UPDATE snapshots SET fetched_at = fetched_at - 2 * 86400 WHERE symbol = 'OLD'"
+            )
+            store._conn.execute(
+                "UPDATE snapshots SET fetched_at = fetched_at - 8 * 86400 WHERE endpoint = 'recommendation_trends' AND symbol = 'ACME2'"
+            )
+        factors = load_factors(["ACME", "UNKNOWN", "OLD", "ACME2"], store, AS_OF)
+    assert factors.index.tolist() == ["ACME", "ACME2"]
+    assert factors.loc["ACME"].tolist() == [0.5, np.log1p(990), 1.0]
+    assert np.isnan(factors.loc["ACME2", "analyst_consensus"])
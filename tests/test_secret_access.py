@@ -0,0 +1,43 @@
+import pytest
+
+from flows.utils import secret_access
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    secret_access.clear_cache()
+    yield
+    secret_access.clear_cache()
+
+
+def test_env_var_backend(monkeypatch):
+    monkeypatch.setenv("FINNHUB_API_KEY", "abc")
+    assert secret_access.get_secret("finnhub_api_key") == "abc"
+
+
+def test_file_backend(monkeypatch, tmp_path):
+    secrets_file = tmp_path / "secrets.env"
+    secrets_file.write_text("alpaca_paper_api_key=key\nETF_PICKS=SPY,QQQ\n")
+    monkeypatch.setenv("SECRETS_FILE", str(secrets_file))
+    assert secret_access.get_secrets(["alpaca_paper_api_key", "etf_picks"]) == {
+        "alpaca_paper_api_key": "key",
+        "etf_picks": "SPY,QQQ",
+    }
+
+
+def test_cached_until_ttl(monkeypatch):
+    monkeypatch.setenv("FINNHUB_API_KEY", "old")
+    assert secret_access.get_secret("finnhub_api_key", ttl=0) == "old"
+    monkeypatch.setenv("FINNHUB_API_KEY", "new")
+    # expired straight away, so this one goes back to the backend
+    assert secret_access.get_secret("finnhub_api_key", ttl=60) == "new"
+    monkeypatch.setenv("FINNHUB_API_KEY", "newer")
+    assert secret_access.get_secret("finnhub_api_key") == "new"
+
+
+def test_local_backend_never_calls_gsm(monkeypatch):
+    monkeypatch.delenv("ETF_PICKS", raising=False)
+    monkeypatch.delenv("SECRETS_FILE", raising=False)
+    monkeypatch.setattr(secret_access, "get_gsm_secret", pytest.fail)
+    with pytest.raises(KeyError):
+        secret_access.get_secret("etf_picks")
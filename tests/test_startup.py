@@ -0,0 +1,20 @@
+import os
+import subprocess
+import sys
+
+from benchmarks.startup import DEFERRED_MODULES, _statement, entrypoints
+
+
+def test_flow_modules_defer_heavy_imports():
+    # loaded by the tasks that need them, importing a flow shouldn't pull them in
+    statements = "; ".join(_statement(e) for e in entrypoints())
+    code = f"import sys; {statements}; print(','.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))"
+    env = dict(os.environ, SECRETS_BACKEND="local")
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert out.stdout.strip() == ""
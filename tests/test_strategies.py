@@ -0,0 +1,115 @@
+from datetime import UTC, datetime, timedelta
+from types import SimpleNamespace
+
+import prefect.deployments
+
+from flows import strategies
+from flows.strategies import Stage, SuspendConfig, SuspendMode
+
+
+class FakeClock:
+    def __init__(self, now: float):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def process_time(self):
+        return 0.0
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        # the os wakes us a little late
+        self.now += seconds + 0.001
+
+
+def test_sleep_until_wakes_every_report_interval(monkeypatch):
+    clock = FakeClock(1000.0)
+    monkeypatch.setattr(strategies, "time", clock)
+    target = datetime.fromtimestamp(1150.0, UTC)
+
+    late = strategies.sleep_until.fn(target, report_every=60)
+
+    assert clock.sleeps[:2] == [60, 60]
+    assert len(clock.sleeps) == 3 and 29.99 < clock.sleeps[2] < 30
+    assert 0 < late < 0.01
+    # already past the target, no sleeping at all
+    assert strategies.sleep_until.fn(target) > 0 and len(clock.sleeps) == 3
+
+
+def _in_deployment(monkeypatch):
+    monkeypatch.setenv(
+        "PREFECT__RUNTIME__DEPLOYMENT__ID", "6f1c2d8e-0000-4000-8000-000000000000"
+    )
+    monkeypatch.setenv("PREFECT__RUNTIME__DEPLOYMENT__NAME", "weekly")
+    monkeypatch.setenv(
+        "PREFECT__RUNTIME__FLOW_RUN__ID", "a3e0b7f2-0000-4000-8000-000000000000"
+    )
+    monkeypatch.setenv(
+        "PREFECT__RUNTIME__FLOW_RUN__FLOW_NAME", "humpday_day_trader_basic"
+    )
+
+
+def _fake_run_deployment(monkeypatch) -> list:
+    calls = []
+
+    def run_deployment(name, **kwargs):
+        calls.append((name, kwargs))
+        return SimpleNamespace(name="brave-otter")
+
+    monkeypatch.setattr(
+        prefect.deployments, "run_deployment", run_deployment, raising=False
+    )
+    return calls
+
+
+def test_reschedule_hands_the_next_stage_to_a_scheduled_run(monkeypatch):
+    _in_deployment(monkeypatch)
+    calls = _fake_run_deployment(monkeypatch)
+    target = datetime(2024, 7, 10, 9, 45, tzinfo=UTC)
+
+    assert strategies.reschedule.fn(target, {"ticker": "AMD", "stage": Stage.TRADE})
+
+    [(name, kwargs)] = calls
+    assert name == "humpday_day_trader_basic/weekly"
+    assert kwargs["scheduled_time"] == target
+    assert kwargs["parameters"] == {"ticker": "AMD", "stage": Stage.TRADE}
+    assert kwargs["timeout"] == 0 and kwargs["as_subflow"] is False
+    assert kwargs["idempotency_key"] == "a3e0b7f2-0000-4000-8000-000000000000-trade"
+
+
+def _stub_tasks(monkeypatch, target) -> list:
+    slept = []
+    monkeypatch.setattr(strategies, "wake_time", lambda config, account_type: target)
+    monkeypatch.setattr(strategies, "sleep_until", slept.append)
+    monkeypatch.setattr(strategies, "reschedule", strategies.reschedule.fn)
+    return slept
+
+
+def test_suspend_reschedules_only_with_resume_parameters(monkeypatch):
+    _in_deployment(monkeypatch)
+    calls = _fake_run_deployment(monkeypatch)
+    target = datetime.now(UTC) + timedelta(hours=20)
+    slept = _stub_tasks(monkeypatch, target)
+    config = SuspendConfig(h=20, mode=SuspendMode.RESCHEDULE)
+
+    assert strategies.suspend(
+        config, resume_parameters={"ticker": "AMD", "stage": Stage.REPORT}
+    )
+    assert calls[0][1]["parameters"]["stage"] == Stage.REPORT and slept == []
+    # nothing to resume with, so it has to wait in this run
+    assert not strategies.suspend(config)
+    assert len(calls) == 1 and slept == [target]
+
+
+def test_suspend_sleeps_when_not_in_a_deployment(monkeypatch):
+    calls = _fake_run_deployment(monkeypatch)
+    target = datetime.now(UTC) + timedelta(hours=20)
+    slept = _stub_tasks(monkeypatch, target)
+
+    config = SuspendConfig(h=20, mode=SuspendMode.RESCHEDULE)
+    assert not strategies.suspend(
+        config, resume_parameters={"ticker": "AMD", "stage": Stage.TRADE}
+    )
+    assert calls == [] and slept == [target]